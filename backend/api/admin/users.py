@@ -1,8 +1,8 @@
 """Health check routes are used by the production system to monitor whether the system is live and running."""
 
 from fastapi import APIRouter, Depends, HTTPException
-from ...services import UserService, UserPermissionError
-from ...models import User, Paginated, PaginationParams
+from ...services import AsyncUserService, UserPermissionError
+from ...models import User, Paginated, PaginationParams, CursorPaginated, CursorPaginationParams
 from ..authentication import registered_user
 
 
@@ -16,9 +16,9 @@ api = APIRouter(prefix="/api/admin/users")
 
 
 @api.get("", tags=["List Users"])
-def list_users(
+async def list_users(
     subject: User = Depends(registered_user),
-    user_service: UserService = Depends(),
+    user_service: AsyncUserService = Depends(),
     page: int = 0,
     page_size: int = 10,
     order_by: str = "first_name",
@@ -27,6 +27,26 @@ def list_users(
     try:
         pagination_params = PaginationParams(
             page=page, page_size=page_size, order_by=order_by, filter=filter)
-        return user_service.list(subject, pagination_params)
+        return await user_service.list(subject, pagination_params)
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@api.get("/page", response_model=CursorPaginated[User], tags=["List Users"])
+async def page_users(
+    subject: User = Depends(registered_user),
+    user_service: AsyncUserService = Depends(),
+    cursor: str = "",
+    page_size: int = 25,
+    order_by: str = "first_name",
+    filter: str = ""
+):
+    try:
+        params = CursorPaginationParams(cursor=cursor, page_size=page_size, order_by=order_by, filter=filter)
+        return await user_service.page(subject, params)
+    except UserPermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
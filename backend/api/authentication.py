@@ -67,7 +67,7 @@ from fastapi.security import HTTPBearer
 from fastapi.security.http import HTTPAuthorizationCredentials
 from fastapi.responses import RedirectResponse
 from ..env import getenv
-from ..services import UserService
+from ..services import AsyncUserService
 from ..models import User
 
 
@@ -85,8 +85,8 @@ _JWT_SECRET = getenv('JWT_SECRET')
 _JST_ALGORITHM = 'HS256'
 
 
-def registered_user(
-    user_service: UserService = Depends(),
+async def registered_user(
+    user_service: AsyncUserService = Depends(),
     token: HTTPAuthorizationCredentials | None = Depends(HTTPBearer())
 ) -> User:
     """Returns the authenticated user or raises a 401 HTTPException if the user is not authenticated."""
@@ -94,7 +94,7 @@ def registered_user(
         try:
             auth_info = jwt.decode(
                 token.credentials, _JWT_SECRET, algorithms=[_JST_ALGORITHM])
-            user = user_service.get(auth_info['pid'])
+            user = await user_service.get(int(auth_info['pid']))
             if user:
                 return user
         except:
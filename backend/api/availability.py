@@ -0,0 +1,53 @@
+"""
+    Availability API
+
+    This API summarizes the reserved slots of all desks so clients can render a floor plan in one request,
+    and pushes the slots booked and freed afterwards so that clients stay up to date without polling.
+"""
+
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from ..models import Availability
+from ..services import AsyncDeskReservationService
+from ..services.live import Subscription, availability_broadcaster
+from .responses import ModelJSONResponse
+
+api = APIRouter(prefix="/api/availability")
+
+KEEPALIVE = 15.0
+"""Seconds between comments sent on idle event streams, so that proxies do not close them."""
+
+# Reserved hourly slots of every available desk between start and end.
+@api.get("", response_model=Availability, tags=['Availability'])
+async def get_availability(start: datetime | None = None, end: datetime | None = None, desk_type: str | None = None, desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        return ModelJSONResponse(await desk_res.get_availability(start, end, desk_type))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+# Server-sent events of the slots booked and freed on some desks and day, see `AvailabilityEvent`.
+@api.get("/events", tags=['Availability'])
+async def availability_events(request: Request, desk_id: list[int] = Query(default=[]), day: date | None = None):
+    subscription = availability_broadcaster.subscribe(set(desk_id) or None, day)
+    return StreamingResponse(
+        _event_stream(subscription, request.is_disconnected),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+async def _event_stream(subscription: Subscription, is_disconnected: Callable[[], Awaitable[bool]], keepalive: float = KEEPALIVE) -> AsyncIterator[str]:
+    try:
+        yield ': subscribed\n\n'
+        async for event in subscription.events(keepalive):
+            if await is_disconnected():
+                return
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield f'event: {event.type}\ndata: {event.json(exclude_none=True)}\n\n'
+    finally:
+        availability_broadcaster.unsubscribe(subscription)
@@ -4,71 +4,86 @@
 
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from collections.abc import Awaitable, Callable
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from ..models import User, Desk
-from ..services import UserPermissionError, DeskService
+from ..services import UserPermissionError, AsyncDeskService
+from ..services.desk import desk_catalog
 from .authentication import registered_user
+from .responses import ModelJSONResponse, conditional_response, etag
 
 api = APIRouter(prefix="/api/desk")
 
 # List all desks in the database.
 @api.get("", tags=['Desk'])
-def list_all_desks(subject : User = Depends(registered_user), desk_service: DeskService = Depends()):
+async def list_all_desks(subject : User = Depends(registered_user), desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.list_all_desks(subject)
+        return await desk_service.list_all_desks(subject)
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
     
 
+async def _catalog_response(request: Request, key: tuple, load: Callable[[], Awaitable[Any]]) -> Response:
+    """Serve a desk catalog response from `desk_catalog`, building and caching it with `load` on a miss."""
+    cached = desk_catalog.get(key)
+    if cached is None:
+        version = desk_catalog.version
+        body = ModelJSONResponse(await load()).body
+        cached = (etag(body), body)
+        desk_catalog.put(key, version, *cached)
+    return conditional_response(request, cached[1], cached[0])
+
+
 # List available desks
-@api.get("/available", tags=['Desk'])
-def list_available_desks(desk_service: DeskService = Depends()):
+@api.get("/available", response_model=list[Desk], tags=['Desk'])
+async def list_available_desks(request: Request, desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.list_available_desks()
+        return await _catalog_response(request, ('available',), desk_service.list_available_desks)
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
     
 
 # Create Desk (For admin)
 @api.post("/admin/create_desk", tags=['Desk'])
-def create_desk(desk: Desk, subject : User = Depends(registered_user), desk_service: DeskService = Depends()):
+async def create_desk(desk: Desk, subject : User = Depends(registered_user), desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.create_desk(desk, subject)
+        return await desk_service.create_desk(desk, subject)
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
     
 
 # Remove Desk (For admin)
 @api.post("/admin/remove_desk", tags=['Desk'])
-def remove_desk(desk: Desk, subject : User = Depends(registered_user), desk_service: DeskService = Depends()):
+async def remove_desk(desk: Desk, subject : User = Depends(registered_user), desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.remove_desk(desk, subject)
+        return await desk_service.remove_desk(desk, subject)
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
     
     
 # Toggle Desk Availability (For admin)
 @api.put("/admin/toggle_availability", tags=['Desk'])
-def toggle_desk_availability(desk: Desk, subject : User = Depends(registered_user), desk_service: DeskService = Depends()):
+async def toggle_desk_availability(desk: Desk, subject : User = Depends(registered_user), desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.toggle_desk_availability(desk, subject)
+        return await desk_service.toggle_desk_availability(desk, subject)
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
     
 
 # Get Desk by Desk ID
-@api.get("/{desk_id}", tags=['Desk'])
-def get_desk_desk_id(desk_id: int, desk_service: DeskService = Depends()):
+@api.get("/{desk_id}", response_model=Desk, tags=['Desk'])
+async def get_desk_desk_id(desk_id: int, request: Request, desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.get_desk_by_id(desk_id)
+        return await _catalog_response(request, ('desk', desk_id), lambda: desk_service.get_desk_by_id(desk_id))
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
 
 
 # Update Desk
 @api.put("/admin/update_desk/{desk_id}", tags=['Desk'])
-def update_desk(desk_id: int, desk: Desk, subject : User = Depends(registered_user), desk_service: DeskService = Depends()):
+async def update_desk(desk_id: int, desk: Desk, subject : User = Depends(registered_user), desk_service: AsyncDeskService = Depends()):
     try:
-        return desk_service.update_desk(desk_id, desk, subject)
+        return await desk_service.update_desk(desk_id, desk, subject)
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
\ No newline at end of file
@@ -4,79 +4,181 @@
     This API is used to modify available resources.
 """
 
+import csv
+import io
+import json
+import logging
+from collections.abc import AsyncIterator
+from typing import Literal
 from fastapi import APIRouter, Depends, HTTPException
-from ..models import User, Desk, DeskReservation
-from ..services import DeskReservationService, UserPermissionError
+from fastapi.responses import StreamingResponse
+from ..models import User, Desk, DeskReservation, CursorPaginated, CursorPaginationParams, BulkReservationRequest, BulkReservationResult, RetentionStatus
+from ..services import AsyncDeskReservationService, UserPermissionError, ReservationConflictError
 from .authentication import registered_user
+from .responses import ModelJSONResponse
 
 api = APIRouter(prefix="/api/reservation")
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = ['id', 'date', 'desk_id', 'desk_tag', 'desk_type', 'user_id', 'onyen', 'first_name', 'last_name', 'email']
+EXPORT_CHUNK_ROWS = 500
 
 # List all desk reservations for admin.
 @api.get("/admin/all", tags=['Reservation'])
-def list_all_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+async def list_all_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.list_all_desk_reservations_for_admin(subject)
+        return await desk_res.list_all_desk_reservations_for_admin(subject)
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
     
 # List future desk reservations for admin.
-@api.get("/admin/future", tags=['Reservation'])
-def list_future_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+@api.get("/admin/future", response_model=list[tuple[DeskReservation, Desk, User]], tags=['Reservation'])
+async def list_future_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.list_future_desk_reservations_for_admin(subject)
+        return ModelJSONResponse(await desk_res.list_future_desk_reservations_for_admin(subject))
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
 # List past desk reservations for admin.
-@api.get("/admin/past", tags=['Reservation'])
-def list_past_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+@api.get("/admin/past", response_model=list[tuple[DeskReservation, Desk, User]], tags=['Reservation'])
+async def list_past_desk_reservations_for_admin(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.list_past_desk_reservations_for_admin(subject)
+        return ModelJSONResponse(await desk_res.list_past_desk_reservations_for_admin(subject))
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))    
 
+# Page through future desk reservations for admin.
+@api.get("/admin/future/page", response_model=CursorPaginated[tuple[DeskReservation, Desk, User]], tags=['Reservation'])
+async def page_future_desk_reservations_for_admin(cursor: str = "", page_size: int = 50, subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        return await desk_res.page_desk_reservations_for_admin(subject, False, CursorPaginationParams(cursor=cursor, page_size=page_size))
+    except UserPermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Page through past desk reservations for admin, most recent first.
+@api.get("/admin/past/page", response_model=CursorPaginated[tuple[DeskReservation, Desk, User]], tags=['Reservation'])
+async def page_past_desk_reservations_for_admin(cursor: str = "", page_size: int = 50, subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        return await desk_res.page_desk_reservations_for_admin(subject, True, CursorPaginationParams(cursor=cursor, page_size=page_size))
+    except UserPermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Export all future or past desk reservations for admin as newline delimited JSON or CSV.
+@api.get("/admin/export", tags=['Reservation'])
+async def export_desk_reservations_for_admin(timeframe: Literal['future', 'past'] = 'past', format: Literal['ndjson', 'csv'] = 'ndjson', subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        rows = await desk_res.stream_desk_reservations_for_admin(subject, timeframe == 'past')
+    except UserPermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if format == 'csv':
+        headers = {'Content-Disposition': f'attachment; filename="reservations_{timeframe}.csv"'}
+        return StreamingResponse(_csv_chunks(rows), media_type='text/csv', headers=headers)
+    else:
+        return StreamingResponse(_ndjson_chunks(rows), media_type='application/x-ndjson')
+
 # Remove desk reservation older than 1 month
 @api.delete("/admin/remove_old", tags=['Reservation'])
-def remove_old_desk_reservations(subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+async def remove_old_desk_reservations(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        return await desk_res.remove_old_reservations(subject)
+    except UserPermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+# Report the progress of archiving old desk reservations
+@api.get("/admin/retention", response_model=RetentionStatus, tags=['Reservation'])
+async def retention_status(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.remove_old_reservations(subject)
+        return await desk_res.retention_status(subject)
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
 # List desk reservations by user
-@api.get("/desk_reservations", tags=['Reservation'])
-def list_desk_reservations_by_user(subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+@api.get("/desk_reservations", response_model=list[tuple[DeskReservation, Desk]], tags=['Reservation'])
+async def list_desk_reservations_by_user(subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.list_desk_reservations_by_user(subject)
+        return ModelJSONResponse(await desk_res.list_desk_reservations_by_user(subject))
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
 
 # List desk reservations by Desk ID
-@api.get("/{desk_id}", tags=['Reservation'])
-def list_desk_reservations_by_desk(desk_id: int, desk_res: DeskReservationService = Depends()):
+@api.get("/{desk_id}", response_model=list[DeskReservation], tags=['Reservation'])
+async def list_desk_reservations_by_desk(desk_id: int, desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.list_reservations_by_desk(desk_id)
+        return ModelJSONResponse(await desk_res.list_reservations_by_desk(desk_id))
     except UserPermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
 
 
 # Reserve desk
 @api.post("/reserve", tags=['Reservation'])
-def create_desk_reservation(desk: Desk, reservation: DeskReservation, subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+async def create_desk_reservation(desk: Desk, reservation: DeskReservation, subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.create_desk_reservation(desk, subject, reservation)
+        return await desk_res.create_desk_reservation(desk, subject, reservation)
+    except ReservationConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        print(str(e))
+        logger.warning('Reservation of desk %s failed: %s', desk.id, e)
         raise HTTPException(status_code=422, detail=str(e))  
 
 
+# Reserve many slots of a desk at once, listed or recurring, reporting the outcome of each slot.
+@api.post("/reserve/bulk", response_model=BulkReservationResult, tags=['Reservation'])
+async def create_desk_reservations(request: BulkReservationRequest, subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
+    try:
+        return await desk_res.create_desk_reservations(subject, request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 # Unreserve desk
 @api.post("/unreserve", tags=['Reservation'])
-def remove_desk_reservation(desk: Desk, reservation: DeskReservation, subject : User = Depends(registered_user), desk_res: DeskReservationService = Depends()):
+async def remove_desk_reservation(desk: Desk, reservation: DeskReservation, subject : User = Depends(registered_user), desk_res: AsyncDeskReservationService = Depends()):
     try:
-        return desk_res.remove_desk_reservation(desk, subject, reservation)
+        return await desk_res.remove_desk_reservation(desk, subject, reservation)
     except Exception as e:
         raise HTTPException(status_code=403, detail=str(e))
-    
-    
+
+
+def _export_record(reservation: DeskReservation, desk: Desk, user: User) -> dict:
+    return {
+        'id': reservation.id,
+        'date': reservation.date.isoformat(),
+        'desk_id': desk.id,
+        'desk_tag': desk.tag,
+        'desk_type': desk.desk_type,
+        'user_id': user.id,
+        'onyen': user.onyen,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+    }
+
+
+async def _ndjson_chunks(rows: AsyncIterator[tuple[DeskReservation, Desk, User]]) -> AsyncIterator[str]:
+    lines = []
+    async for row in rows:
+        lines.append(json.dumps(_export_record(*row)) + '\n')
+        if len(lines) == EXPORT_CHUNK_ROWS:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+async def _csv_chunks(rows: AsyncIterator[tuple[DeskReservation, Desk, User]]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    count = 0
+    async for row in rows:
+        writer.writerow(_export_record(*row))
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
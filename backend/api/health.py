@@ -1,7 +1,15 @@
-"""Health check routes are used by the production system to monitor whether the system is live and running."""
+"""Health check routes are used by the production system to monitor whether the system is live and running.
 
-from fastapi import APIRouter, Depends
-from ..services.health import HealthService
+Orchestrators should probe `/live` for liveness, answered without any I/O, and `/ready` for readiness,
+answered from the last background check of the database along with the state of the pools and
+caches, see `services.health`. Both are answered on the event loop, so that they are answered even
+while every thread serving synchronous routes is busy."""
+
+from fastapi import APIRouter, Depends, Response
+from starlette.concurrency import run_in_threadpool
+from ..models import Readiness
+from ..services.health import HealthService, health_monitor
+from .metrics import CACHES
 
 
 __authors__ = ["Kailash Muthu"]
@@ -16,3 +24,19 @@ api = APIRouter(prefix="/api/health")
 @api.get("", tags=["System Health"])
 def health_check(health_svc: HealthService = Depends()) -> str:
     return health_svc.check()
+
+
+@api.get("/live", tags=["System Health"])
+async def live() -> str:
+    return "OK"
+
+
+@api.get("/ready", response_model=Readiness, tags=["System Health"], responses={503: {"model": Readiness}})
+async def ready(response: Response) -> Readiness:
+    if not health_monitor.running:
+        # Without the background thread, such as with HEALTH_INTERVAL=0, probes check the database themselves.
+        await run_in_threadpool(health_monitor.refresh, health_monitor.interval)
+    readiness = health_monitor.readiness(CACHES)
+    if not readiness.ready:
+        response.status_code = 503
+    return readiness
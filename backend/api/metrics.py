@@ -0,0 +1,34 @@
+"""Metrics route scraped by Prometheus to monitor the latency, errors and caches of each worker, see `backend.metrics`."""
+
+from fastapi import APIRouter, Response
+from ..metrics import CONTENT_TYPE, registry
+from ..services.desk import desk_catalog
+from ..services.occupancy import occupancy_index
+from ..services.permission import permission_index
+from ..services.user import registered_users
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+api = APIRouter(prefix="/api/metrics")
+
+CACHES = {
+    'permission_index': permission_index,
+    'registered_users': registered_users,
+    'desk_catalog': desk_catalog,
+    'occupancy_index': occupancy_index,
+}
+"""In-process caches whose lookups are counted, each with `hits` and `misses` attributes."""
+
+registry.collected('cache_hits_total', 'Lookups answered by the cache.', ('cache',),
+                   lambda: (((name,), cache.hits) for name, cache in CACHES.items()), type='counter')
+registry.collected('cache_misses_total', 'Lookups the cache could not answer.', ('cache',),
+                   lambda: (((name,), cache.misses) for name, cache in CACHES.items()), type='counter')
+registry.collected('cache_hit_ratio', 'Share of the lookups answered by the cache since the worker started.', ('cache',),
+                   lambda: (((name,), cache.hits / (cache.hits + cache.misses)) for name, cache in CACHES.items() if cache.hits + cache.misses))
+
+
+@api.get("", tags=["System Health"], response_class=Response)
+def metrics() -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
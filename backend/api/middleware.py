@@ -0,0 +1,125 @@
+"""ASGI middleware wrapping every request handled by the app."""
+
+import logging
+import time
+from typing import Any
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..env import getenv
+from ..metrics import registry
+from ..services.request_context import RequestContext, report, request_scope
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = getenv('SERVER_TIMING', 'true').lower() in ('1', 'true')
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+request_duration = registry.histogram('http_request_duration_seconds', 'Time from receiving a request to starting its response.', ('method', 'route'))
+requests = registry.counter('http_requests_total', 'Requests answered, by status code.', ('method', 'route', 'status'))
+
+
+class RequestContextMiddleware:
+    """Handle each HTTP request within a `RequestContext` of its own, see `services.request_context`.
+
+    The context stays current until the response is sent in full, streamed bodies included, and the
+    number of SQL statements the request ran is then logged at the DEBUG level. Its slow statements,
+    and the statements it repeated the most when it ran too many, are reported by the `backend.sql`
+    logger.
+
+    Unless `SERVER_TIMING` is false, the response carries a `Server-Timing` header with the statements
+    run and the time spent in the database and in the app until the response started, which browser
+    developer tools show along with the timing of the request:
+
+        Server-Timing: db;dur=12.4;desc="7 statements", app;dur=31.0
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        with request_scope() as context:
+
+            async def send_timing(message: Message) -> None:
+                if message['type'] == 'http.response.start':
+                    headers = [*message.get('headers', ()), (b'server-timing', _server_timing(context, start).encode('latin-1'))]
+                    message = {**message, 'headers': headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_timing if SERVER_TIMING else send)
+            finally:
+                route = f'{scope["method"]} {route_template(scope)}'
+                logger.debug('%s ran %d SQL statements in %.1f ms', route, context.statements, context.db_seconds * 1000)
+                report(context, route)
+
+
+def _server_timing(context: RequestContext, start: float) -> str:
+    return (f'db;dur={context.db_seconds * 1000:.1f};desc="{context.statements} statements", '
+            f'app;dur={(time.perf_counter() - start) * 1000:.1f}')
+
+
+class MetricsMiddleware:
+    """Record the latency and status code of each HTTP request, see `backend.metrics`.
+
+    Requests are labeled with the path of the route handling them, such as `/api/desk/{desk_id}`, so
+    that the requests of every desk add up. Latency is timed until the response starts, so that
+    streamed responses, such as live availability, are timed until their first byte. Requests failing
+    with an exception are counted with status 500, as the app responds to them."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method'] if scope['method'] in METHODS else 'other'
+        start = time.perf_counter()
+        started = False
+
+        async def send_timed(message: Message) -> None:
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+                self._record(scope, method, message['status'], start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if not started:
+                self._record(scope, method, 500, start)
+
+    def _record(self, scope: Scope, method: str, status: int, start: float) -> None:
+        route = route_template(scope)
+        request_duration.observe(time.perf_counter() - start, method, route)
+        requests.inc(method, route, str(status))
+
+
+_templates: dict[Any, str] = {}
+
+
+def route_template(scope: Scope) -> str:
+    """Path of the route the router matched the request with, such as `/api/desk/{desk_id}`, or `unmatched`."""
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return 'unmatched'
+    route = _templates.get(endpoint)
+    if route is None:
+        route = 'unmatched'
+        for candidate in scope['app'].routes:
+            if isinstance(candidate, Mount) and candidate.app is endpoint:
+                route = f'{candidate.path}/{{path:path}}'
+                break
+            if getattr(candidate, 'endpoint', None) is endpoint:
+                route = candidate.path
+                break
+        _templates[endpoint] = route
+    return route
@@ -4,7 +4,7 @@ This API is used to retrieve and update a user's profile."""
 
 from fastapi import APIRouter, Depends
 from .authentication import authenticated_pid
-from ..services import UserService
+from ..services import AsyncUserService
 from ..models import User, NewUser, ProfileForm
 
 __authors__ = ['Kailash Muthu']
@@ -18,14 +18,14 @@ ONYEN = 1
 
 
 @api.get("", response_model=User | NewUser, tags=['profile'])
-def read_profile(pid_onyen: tuple[int, str] = Depends(authenticated_pid), user_svc: UserService = Depends()):
+async def read_profile(pid_onyen: tuple[int, str] = Depends(authenticated_pid), user_svc: AsyncUserService = Depends()):
     """Retrieve a user's profile. If the user does not exist, return a NewUser.
 
     To handle new users, we rely only on the authenticated_pid dependency rather than
     registered_user.
     """
     pid, onyen = pid_onyen
-    user = user_svc.get(pid)
+    user = await user_svc.get(pid)
     if user:
         return user
     else:
@@ -33,10 +33,10 @@ def read_profile(pid_onyen: tuple[int, str] = Depends(authenticated_pid), user_s
 
 
 @api.put("", response_model=User, tags=['profile'])
-def update_profile(
+async def update_profile(
     profile: ProfileForm,
     pid_onyen: tuple[int, str] = Depends(authenticated_pid),
-    user_svc: UserService = Depends()
+    user_svc: AsyncUserService = Depends()
 ):
     """Update a user's profile. If the user does not exist, create a new user.
 
@@ -48,7 +48,7 @@ def update_profile(
     purposes. Importantly, ProfileForm doesn't contain an ID field.
     """
     pid, onyen = pid_onyen
-    user = user_svc.get(pid)
+    user = await user_svc.get(pid)
     if user is None:
         user = User(
             pid=pid,
@@ -58,12 +58,12 @@ def update_profile(
             email=profile.email,
             pronouns=profile.pronouns,
         )
-        user = user_svc.create(user, user)
+        user = await user_svc.create(user, user)
     else:
         user.first_name = profile.first_name
         user.last_name = profile.last_name
         user.email = profile.email
         user.pronouns = profile.pronouns
         user.onyen = onyen
-        user = user_svc.update(user, user)
+        user = await user_svc.update(user, user)
     return user
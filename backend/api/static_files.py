@@ -1,17 +1,32 @@
 """Single-page application middleware.
 
 Our application is organized as a single-page application (SPA). This middleware class
-extends the functionality of the StaticFiles middleware and was inspired by: 
+extends the functionality of the StaticFiles middleware and was inspired by:
 <https://stackoverflow.com/questions/63069190/how-to-capture-arbitrary-paths-at-one-route-in-fastapi>
+
+`StaticBundle` serves a production build of the SPA from memory instead. The bundle is read once,
+when the app starts, into a manifest of every file along with its gzip and brotli encodings, taken
+from the `.gz` and `.br` files next to it when the build produced them or else compressed then.
+Requests are answered from the manifest without touching the filesystem, in the encoding the client
+prefers. Files whose name carries a content hash, as `ng build` names scripts and styles, never
+change under the same name and are cached by clients for a year; everything else, `index.html`
+above all, is revalidated with its `ETag` so that a new deployment is picked up right away.
 """
 
 __authors__ = ["Kailash Muthu"]
 __copyright__ = "Copyright 2023"
 __license__ = "MIT"
 
+import gzip
+import hashlib
+import mimetypes
 import os
+import re
 
+import brotli
 from fastapi.staticfiles import StaticFiles
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
 
 
 class StaticFileMiddleware(StaticFiles):
@@ -34,3 +49,149 @@ class StaticFileMiddleware(StaticFiles):
             return super().lookup_path(self.index)
         else:
             return (full_path, stat_result)
+
+
+HASHED = re.compile(r'[.-][0-9a-f]{16,}\.[^./]+$')
+"""Names of files carrying a content hash, like `main.3e4f5a6b7c8d9e0f.js`."""
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'application/xml', 'image/svg+xml')
+MIN_COMPRESSED_SIZE = 256
+"""Files smaller than this many bytes are only served as they are, compression would gain nothing."""
+
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+"""Content encodings served besides identity, and the suffix of the files holding them."""
+
+
+class Asset:
+    """A file of the bundle, held in memory in each of its encodings."""
+
+    def __init__(self, path: str, body: bytes, encoded: dict[str, bytes], hashed: bool):
+        self.media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.bodies = {'identity': body, **encoded}
+        tag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.headers = {
+            encoding: {
+                'Content-Type': _content_type(self.media_type),
+                'Content-Length': str(len(encoded_body)),
+                'ETag': f'"{tag}"' if encoding == 'identity' else f'"{tag}-{encoding}"',
+                'Cache-Control': IMMUTABLE if hashed else REVALIDATE,
+                **({'Vary': 'Accept-Encoding'} if encoded else {}),
+                **({'Content-Encoding': encoding} if encoding != 'identity' else {}),
+            }
+            for encoding, encoded_body in self.bodies.items()
+        }
+
+    def encoding_for(self, accept_encoding: str) -> str:
+        """The encoding of this asset the client prefers, by its Accept-Encoding header."""
+        accepted = _accepted_encodings(accept_encoding)
+        candidates = [encoding for encoding in self.bodies if accepted.get(encoding, accepted.get('*', 0.0)) > 0]
+        if not candidates:
+            return 'identity'
+        # Ties in quality go to the smallest body.
+        return max(candidates, key=lambda encoding: (accepted.get(encoding, accepted.get('*', 0.0)), -len(self.bodies[encoding])))
+
+
+class StaticBundle:
+    """ASGI app serving the files of `directory` from an in-memory manifest, with `index` for any other path."""
+
+    def __init__(self, directory: os.PathLike, index: str = 'index.html') -> None:
+        self.directory = directory
+        self.index = index
+        self.manifest = load_manifest(directory)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope['type'] == 'http'
+        if scope['method'] not in ('GET', 'HEAD'):
+            response = PlainTextResponse('Method Not Allowed', status_code=405, headers={'Allow': 'GET, HEAD'})
+            return await response(scope, receive, send)
+
+        asset = self.lookup(scope['path'])
+        if asset is None:
+            return await PlainTextResponse('Not Found', status_code=404)(scope, receive, send)
+
+        request_headers = dict((name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers'])
+        encoding = asset.encoding_for(request_headers.get('accept-encoding', ''))
+        headers = asset.headers[encoding]
+        if _matches(request_headers.get('if-none-match'), headers['ETag']):
+            not_modified = {name: value for name, value in headers.items() if name in ('ETag', 'Cache-Control', 'Vary')}
+            return await Response(status_code=304, headers=not_modified)(scope, receive, send)
+        body = asset.bodies[encoding] if scope['method'] == 'GET' else b''
+        await Response(body, headers=headers)(scope, receive, send)
+
+    def lookup(self, path: str) -> Asset | None:
+        """The asset at `path`, the index of the directory at `path`, or else the index of the bundle."""
+        path = path.strip('/')
+        asset = self.manifest.get(path) or self.manifest.get(f'{path}/{self.index}'.lstrip('/'))
+        return asset or self.manifest.get(self.index)
+
+
+def load_manifest(directory: os.PathLike) -> dict[str, Asset]:
+    """Read every file under `directory` into assets by their path relative to it."""
+    if not os.path.isdir(directory):
+        raise RuntimeError(f"Directory '{directory}' does not exist")
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        for name in names:
+            if not name.startswith('.'):
+                full_path = os.path.join(root, name)
+                files[os.path.relpath(full_path, directory).replace(os.sep, '/')] = full_path
+
+    manifest = {}
+    for path, full_path in files.items():
+        if any(path.endswith(suffix) and path[:-len(suffix)] in files for suffix in ENCODINGS.values()):
+            continue
+        body = _read(full_path)
+        encoded = {}
+        if len(body) >= MIN_COMPRESSED_SIZE and (mimetypes.guess_type(path)[0] or '').startswith(COMPRESSIBLE):
+            for encoding, suffix in ENCODINGS.items():
+                variant = _read(files[path + suffix]) if path + suffix in files else _compress(encoding, body)
+                if len(variant) < len(body):
+                    encoded[encoding] = variant
+        manifest[path] = Asset(path, body, encoded, bool(HASHED.search(path)))
+    return manifest
+
+
+def _read(full_path: str) -> bytes:
+    with open(full_path, 'rb') as file:
+        return file.read()
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def _content_type(media_type: str) -> str:
+    if media_type.startswith('text/') or media_type in ('application/javascript', 'application/json'):
+        return f'{media_type}; charset=utf-8'
+    return media_type
+
+
+def _accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """Quality of each coding listed in an Accept-Encoding header. Identity is acceptable unless refused."""
+    accepted = {'identity': 1.0}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def _matches(if_none_match: str | None, tag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return tag in tags or '*' in tags
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from ..services import UserService
+from ..services import AsyncUserService
 from ..models import User
 from .authentication import registered_user
 
@@ -7,5 +7,5 @@ api = APIRouter(prefix="/api/user")
 
 
 @api.get("", response_model=list[User], tags=['User'])
-def search(q: str, subject: User = Depends(registered_user), user_svc: UserService = Depends()):
-    return user_svc.search(subject, q)
+async def search(q: str, subject: User = Depends(registered_user), user_svc: AsyncUserService = Depends()):
+    return await user_svc.search(subject, q)
@@ -0,0 +1,4 @@
+"""Benchmark suite measuring the latency and throughput of the API against a realistically sized database.
+
+Seed the benchmark database once with `python -m backend.bench.seed`, then run the routes with
+`python -m backend.bench.run`, which emits a JSON report meant to be diffed between commits."""
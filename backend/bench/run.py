@@ -0,0 +1,423 @@
+"""Measure the latency and throughput of each API route against the seeded benchmark database.
+
+Requests are made by an in-process ASGI client, so the report measures the application, from routing
+through the database round trips to rendering the response, without any network or server in between.
+Routes run one after the other, each with `--requests` requests spread over `--concurrency` concurrent
+clients after `--warmup` untimed ones. Routes returning whole tables are capped to a few requests.
+
+The report lists the requests, status codes, p50/p99/mean latency in milliseconds and the throughput in
+requests per second of each route, keyed and sorted so that reports of two commits diff line by line:
+
+    python -m backend.bench.run --output before.json
+    python -m backend.bench.run --output after.json --baseline before.json
+
+Routes which change data undo their changes, in pairs such as reserve and unreserve, and whatever is
+left once the routes ran is removed, so that runs are repeatable against the same seed.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import re
+import subprocess
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+import httpx
+from sqlalchemy import Engine, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from ..database import _engine_str, db_session, async_db_session
+from ..entities import DeskEntity, UserEntity
+from ..api.authentication import _generate_token
+from ..services import occupancy
+from ..script.dev_data import users, roles
+from .seed import POSTGRES_DATABASE, OPENING_HOUR, FIRST_NAMES, LAST_NAMES, bench_engine
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+
+@dataclass
+class Context:
+    """State shared by the routes of a run."""
+    root: dict[str, str]
+    student: dict[str, str]
+    desks: list[dict]
+    users: list[dict]
+    created_desks: list[dict] = field(default_factory=list)
+    reservations: list[dict] = field(default_factory=list)
+    granted: list[int] = field(default_factory=list)
+    cursors: dict[str, str] = field(default_factory=dict)
+
+    def desk(self, i: int) -> dict:
+        return self.desks[i % len(self.desks)]
+
+    def user(self, i: int) -> dict:
+        return self.users[i % len(self.users)]
+
+
+@dataclass
+class Route:
+    name: str
+    call: Callable[[httpx.AsyncClient, Context, int], Awaitable[httpx.Response]]
+    max_requests: int | None = None
+    requires: str | None = None
+
+
+ROUTES: list[Route] = []
+
+
+def route(name: str, max_requests: int | None = None, requires: str | None = None):
+    """Register a benchmarked route, named after its method and path, run in the order of registration.
+
+    A route which works on what an earlier route created `requires` that route, which then runs whenever it does."""
+    def register(call):
+        ROUTES.append(Route(name, call, max_requests, requires))
+        return call
+    return register
+
+
+def _night_slot(i: int) -> datetime:
+    """A distinct future slot outside of the seeded opening hours for each `i`."""
+    day = date.today() + timedelta(days=2 + (i // OPENING_HOUR) % 20)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=i % OPENING_HOUR)
+
+
+# Desk API
+
+@route('GET /api/desk')
+async def list_all_desks(client, ctx, i):
+    return await client.get('/api/desk', headers=ctx.root)
+
+@route('GET /api/desk/available')
+async def list_available_desks(client, ctx, i):
+    return await client.get('/api/desk/available', headers=ctx.student)
+
+@route('GET /api/desk/{desk_id}')
+async def get_desk(client, ctx, i):
+    return await client.get(f'/api/desk/{ctx.desk(i)["id"]}', headers=ctx.student)
+
+@route('POST /api/desk/admin/create_desk')
+async def create_desk(client, ctx, i):
+    response = await client.post('/api/desk/admin/create_desk', headers=ctx.root,
+                                 json={'tag': f'BENCH{i}', 'desk_type': 'Computer Desk', 'included_resource': '', 'available': False})
+    ctx.created_desks.append(response.json())
+    return response
+
+@route('PUT /api/desk/admin/toggle_availability', requires='POST /api/desk/admin/create_desk')
+async def toggle_desk_availability(client, ctx, i):
+    # Making a desk unavailable cancels its reservations, so only the desks created above are toggled.
+    # Consecutive requests toggle the same desk, leaving it as it was after an even number of requests.
+    desk = ctx.created_desks[(i // 2) % len(ctx.created_desks)]
+    return await client.put('/api/desk/admin/toggle_availability', headers=ctx.root, json=desk)
+
+@route('PUT /api/desk/admin/update_desk/{desk_id}', requires='POST /api/desk/admin/create_desk')
+async def update_desk(client, ctx, i):
+    desk = ctx.created_desks[i % len(ctx.created_desks)]
+    return await client.put(f'/api/desk/admin/update_desk/{desk["id"]}', headers=ctx.root, json=desk)
+
+@route('POST /api/desk/admin/remove_desk', requires='POST /api/desk/admin/create_desk')
+async def remove_desk(client, ctx, i):
+    return await client.post('/api/desk/admin/remove_desk', headers=ctx.root, json=ctx.created_desks.pop())
+
+
+# Reservation API
+
+@route('GET /api/reservation/admin/future', max_requests=3)
+async def list_future_desk_reservations_for_admin(client, ctx, i):
+    return await client.get('/api/reservation/admin/future', headers=ctx.root)
+
+@route('GET /api/reservation/admin/past', max_requests=3)
+async def list_past_desk_reservations_for_admin(client, ctx, i):
+    return await client.get('/api/reservation/admin/past', headers=ctx.root)
+
+@route('GET /api/reservation/admin/future/page')
+async def page_future_desk_reservations_for_admin(client, ctx, i):
+    return await _page(client, ctx, 'future')
+
+@route('GET /api/reservation/admin/past/page')
+async def page_past_desk_reservations_for_admin(client, ctx, i):
+    return await _page(client, ctx, 'past')
+
+async def _page(client, ctx, timeframe):
+    # Each request continues after the previous page, walking ever deeper into the listing.
+    params = {'cursor': ctx.cursors.get(timeframe, ''), 'page_size': 50}
+    response = await client.get(f'/api/reservation/admin/{timeframe}/page', headers=ctx.root, params=params)
+    ctx.cursors[timeframe] = response.json().get('next_cursor') or ''
+    return response
+
+@route('GET /api/reservation/admin/export', max_requests=3)
+async def export_desk_reservations_for_admin(client, ctx, i):
+    return await client.get('/api/reservation/admin/export', headers=ctx.root, params={'timeframe': 'future', 'format': 'csv'})
+
+@route('DELETE /api/reservation/admin/remove_old')
+async def remove_old_desk_reservations(client, ctx, i):
+    return await client.delete('/api/reservation/admin/remove_old', headers=ctx.root)
+
+@route('GET /api/reservation/desk_reservations')
+async def list_desk_reservations_by_user(client, ctx, i):
+    return await client.get('/api/reservation/desk_reservations', headers=ctx.student)
+
+@route('GET /api/reservation/{desk_id}')
+async def list_desk_reservations_by_desk(client, ctx, i):
+    return await client.get(f'/api/reservation/{ctx.desk(i)["id"]}', headers=ctx.student)
+
+@route('POST /api/reservation/reserve')
+async def create_desk_reservation(client, ctx, i):
+    response = await client.post('/api/reservation/reserve', headers=ctx.student,
+                                 json={'desk': ctx.desk(i), 'reservation': {'date': _night_slot(i).isoformat()}})
+    ctx.reservations.append({'desk': ctx.desk(i), 'reservation': response.json()})
+    return response
+
+@route('POST /api/reservation/unreserve', requires='POST /api/reservation/reserve')
+async def remove_desk_reservation(client, ctx, i):
+    return await client.post('/api/reservation/unreserve', headers=ctx.student, json=ctx.reservations.pop())
+
+@route('POST /api/reservation/reserve/bulk')
+async def create_desk_reservations(client, ctx, i):
+    # Recurring night slots which `run` removes again once all routes ran.
+    start = date.today() + timedelta(days=2)
+    recurrence = {'start': start.isoformat(), 'end': (start + timedelta(days=13)).isoformat(), 'hours': [i % OPENING_HOUR]}
+    return await client.post('/api/reservation/reserve/bulk', headers=ctx.root,
+                              json={'desk_id': ctx.desk(i)['id'], 'recurrence': recurrence})
+
+@route('GET /api/availability')
+async def get_availability(client, ctx, i):
+    return await client.get('/api/availability', headers=ctx.student)
+
+
+# Admin and profile APIs
+
+@route('GET /api/admin/users')
+async def list_users(client, ctx, i):
+    return await client.get('/api/admin/users', headers=ctx.root, params={'page': i % 100, 'page_size': 25})
+
+@route('GET /api/admin/users/page')
+async def page_users(client, ctx, i):
+    # Each request continues after the previous page, walking ever deeper into the directory.
+    params = {'cursor': ctx.cursors.get('users', ''), 'page_size': 25, 'order_by': 'last_name'}
+    response = await client.get('/api/admin/users/page', headers=ctx.root, params=params)
+    ctx.cursors['users'] = response.json().get('next_cursor') or ''
+    return response
+
+@route('GET /api/admin/users?filter=')
+async def filter_users(client, ctx, i):
+    return await client.get('/api/admin/users', headers=ctx.root, params={'filter': _search_query(i), 'page_size': 25})
+
+@route('GET /api/admin/roles')
+async def list_roles(client, ctx, i):
+    return await client.get('/api/admin/roles', headers=ctx.root)
+
+@route('GET /api/admin/roles/{id}')
+async def role_details(client, ctx, i):
+    return await client.get(f'/api/admin/roles/{roles.staff.id}', headers=ctx.root)
+
+@route('POST /api/admin/roles/{id}/permission')
+async def grant_permission(client, ctx, i):
+    action = f'bench.{i}'
+    response = await client.post(f'/api/admin/roles/{roles.ambassador.id}/permission', headers=ctx.root, json={'action': action, 'resource': '*'})
+    ctx.granted.extend(permission['id'] for permission in response.json()['permissions'] if permission['action'] == action)
+    return response
+
+@route('DELETE /api/admin/roles/{id}/permission/{permissionId}', requires='POST /api/admin/roles/{id}/permission')
+async def revoke_permission(client, ctx, i):
+    return await client.delete(f'/api/admin/roles/{roles.ambassador.id}/permission/{ctx.granted.pop()}', headers=ctx.root)
+
+@route('POST /api/admin/roles/{id}/member')
+async def add_member(client, ctx, i):
+    return await client.post(f'/api/admin/roles/{roles.ambassador.id}/member', headers=ctx.root, json=ctx.user(i))
+
+@route('DELETE /api/admin/roles/{id}/member/{userId}', requires='POST /api/admin/roles/{id}/member')
+async def remove_member(client, ctx, i):
+    return await client.delete(f'/api/admin/roles/{roles.ambassador.id}/member/{ctx.user(i)["id"]}', headers=ctx.root)
+
+@route('GET /api/profile')
+async def read_profile(client, ctx, i):
+    return await client.get('/api/profile', headers=ctx.student)
+
+@route('PUT /api/profile')
+async def update_profile(client, ctx, i):
+    profile = users.sol_student
+    return await client.put('/api/profile', headers=ctx.student,
+                            json={'first_name': profile.first_name, 'last_name': profile.last_name, 'email': profile.email, 'pronouns': profile.pronouns})
+
+@route('GET /api/user')
+async def search_users(client, ctx, i):
+    return await client.get('/api/user', headers=ctx.root, params={'q': _search_query(i)})
+
+
+def _search_query(i: int) -> str:
+    """What an admin has typed into the user autocomplete after a few keystrokes: part of a name or onyen, or a PID."""
+    first_name, last_name = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[i % len(LAST_NAMES)]
+    onyen = (first_name[0] + last_name[:4]).lower()
+    return [first_name[:3], f'{first_name} {last_name[:2]}', onyen, str(200000000 + i * 37)[:6 + i % 4]][i % 4]
+
+
+async def measure(client: httpx.AsyncClient, ctx: Context, route: Route, requests: int, concurrency: int, warmup: int) -> dict:
+    """Run `requests` requests of a route over `concurrency` concurrent clients and summarize them."""
+    if route.max_requests is not None:
+        requests = min(requests, route.max_requests)
+        warmup = min(warmup, 1)
+    for i in range(requests, requests + warmup):
+        await _status(route.call(client, ctx, i))
+
+    latencies = []
+    statuses = Counter()
+    indices = iter(range(requests))
+
+    async def worker():
+        for i in indices:
+            start = time.perf_counter()
+            status = await _status(route.call(client, ctx, i))
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'statuses': dict(sorted(statuses.items())),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(requests / elapsed, 1),
+    }
+
+
+async def _status(request: Awaitable[httpx.Response]) -> str:
+    """Status code of a response, or the name of the exception the application raised instead."""
+    try:
+        return str((await request).status_code)
+    except Exception as e:
+        return type(e).__name__
+
+
+def _percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+async def run(engine: Engine, async_engine: AsyncEngine, requests: int = 50, concurrency: int = 1, warmup: int = 2, pattern: str = '') -> dict:
+    """Benchmark every route whose name matches `pattern` with the application's sessions bound to the given engines."""
+    from ..main import app
+
+    def bench_db_session():
+        with Session(engine) as session:
+            yield session
+
+    async def bench_async_db_session():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    app.dependency_overrides[db_session] = bench_db_session
+    app.dependency_overrides[async_db_session] = bench_async_db_session
+    with Session(engine) as session:
+        # The application loads the occupancy index at startup, which the in-process client does not run.
+        if occupancy.ENABLED:
+            occupancy.occupancy_index.load(session)
+        desks = [entity.to_model().dict() for entity in session.scalars(select(DeskEntity).where(DeskEntity.available == True).order_by(DeskEntity.id.desc()).limit(100))]
+        bench_users = [entity.to_model().dict() for entity in session.scalars(select(UserEntity).order_by(UserEntity.id.desc()).limit(100))]
+    ctx = Context(
+        root={'Authorization': f'Bearer {_generate_token(users.root.onyen, users.root.pid)}'},
+        student={'Authorization': f'Bearer {_generate_token(users.sol_student.onyen, users.sol_student.pid)}'},
+        desks=desks,
+        users=bench_users,
+    )
+
+    report = {}
+    try:
+        async with httpx.AsyncClient(app=app, base_url='http://bench') as client:
+            for route in _select(pattern):
+                report[route.name] = await measure(client, ctx, route, requests, concurrency, warmup)
+    finally:
+        occupancy.occupancy_index.unload()
+        app.dependency_overrides.pop(db_session, None)
+        app.dependency_overrides.pop(async_db_session, None)
+        _clean_up(engine)
+    return report
+
+
+def _clean_up(engine: Engine) -> None:
+    """Remove whatever routes created and did not remove again, such as when their undoing route was not selected."""
+    with Session(engine) as session:
+        session.execute(text('DELETE FROM desk_reservation WHERE extract(hour FROM date) < :opening'), {'opening': OPENING_HOUR})
+        session.execute(text("DELETE FROM desk WHERE tag LIKE 'BENCH%'"))
+        session.execute(text("DELETE FROM permission WHERE action LIKE 'bench.%'"))
+        # Seeded users are numbered after the users of the demo data, see `seed.seed`.
+        session.execute(text('DELETE FROM user_role WHERE role_id = :role AND user_id >= :first_user'),
+                        {'role': roles.ambassador.id, 'first_user': len(users.models) + 1})
+        session.commit()
+
+
+def _select(pattern: str) -> list[Route]:
+    """Routes whose name matches `pattern` along with the routes they require, in the order of registration."""
+    names = {route.name for route in ROUTES if re.search(pattern, route.name)}
+    names |= {route.requires for route in ROUTES if route.name in names and route.requires}
+    return [route for route in ROUTES if route.name in names]
+
+
+def _environment(engine: Engine) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    with engine.connect() as connection:
+        rows = {table: connection.execute(text(f'SELECT count(*) FROM "{table}"')).scalar() for table in ['desk', 'user', 'desk_reservation']}
+    return {'commit': commit, 'python': platform.python_version(), 'rows': rows}
+
+
+def _compare(report: dict, baseline: dict) -> str:
+    lines = [f'{"route":<56} {"p50 ms":>18} {"p99 ms":>18} {"req/s":>16}']
+    for name, result in report['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        cells = [f'{before[key]:>8g} {result[key]:>8g}' if key != 'throughput_rps' else f'{before[key]:>7g} {result[key]:>7g}'
+                 for key in ['p50_ms', 'p99_ms', 'throughput_rps']]
+        lines.append(f'{name:<56} ' + ' '.join(f'{cell:>18}' for cell in cells))
+    return '\n'.join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients per route')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per route')
+    parser.add_argument('--routes', default='', help='only run routes whose name matches this regular expression')
+    parser.add_argument('--output', help='write the report to this file rather than standard output')
+    parser.add_argument('--baseline', help='print a comparison with this earlier report')
+    args = parser.parse_args()
+
+    engine = bench_engine()
+    async_engine = create_async_engine(_engine_str(POSTGRES_DATABASE, dialect='postgresql+asyncpg'), pool_size=max(5, args.concurrency))
+
+    async def bench():
+        try:
+            return await run(engine, async_engine, args.requests, args.concurrency, args.warmup, args.routes)
+        finally:
+            await async_engine.dispose()
+
+    routes = asyncio.run(bench())
+    report = {'environment': _environment(engine), 'settings': {'requests': args.requests, 'concurrency': args.concurrency}, 'routes': routes}
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(body + '\n')
+    else:
+        print(body)
+    if args.baseline:
+        with open(args.baseline) as file:
+            print(_compare(report, json.load(file)))
+
+
+if __name__ == '__main__':
+    main()
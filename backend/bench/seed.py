@@ -0,0 +1,120 @@
+"""Seed the benchmark database with thousands of desks, tens of thousands of users and millions of reservations.
+
+The demo users, roles and permissions of `script.dev_data` are installed first so the benchmark can
+act as the same personas as development. Desks, users and reservations are then generated by the
+database itself with `generate_series`, which takes seconds where inserting entities would take hours.
+Reservations fill the opening hours of the days around today, as they would be just before old
+reservations are removed, with `occupancy` of the slots taken.
+
+    python -m backend.bench.seed --desks 3000 --users 20000 --days 60
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Session
+
+from ..database import _engine_str
+from ..env import getenv
+from .. import entities
+from ..entities import UserEntity, RoleEntity, PermissionEntity
+from ..services.partition import ensure_partitions
+from ..script.dev_data import users, roles, user_roles, permissions, desks as dev_desks
+from ..script.generate_data import FIRST_NAMES, LAST_NAMES, reset_sequences
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+POSTGRES_DATABASE = f'{getenv("POSTGRES_DATABASE")}_bench'
+
+OPENING_HOUR = 7
+"""Reservations are seeded from this hour of each day ..."""
+CLOSING_HOUR = 23
+"""... until this hour, leaving the night free for the benchmark to reserve without conflicts."""
+
+
+def bench_engine() -> Engine:
+    """Engine of the benchmark database, creating the database if it does not exist."""
+    with create_engine(_engine_str(''), isolation_level='AUTOCOMMIT').connect() as connection:
+        try:
+            connection.execute(text(f'CREATE DATABASE {POSTGRES_DATABASE}'))
+        except ProgrammingError:
+            ...
+    return create_engine(_engine_str(POSTGRES_DATABASE))
+
+
+def seed(engine: Engine, desks: int = 3000, users_count: int = 20000, days: int = 60, occupancy: float = 0.7) -> dict[str, int]:
+    """Recreate the schema and fill it, returning the number of rows of each table."""
+    if users_count < desks:
+        raise ValueError('users must be at least desks so that no user holds two desks in the same hour')
+    entities.EntityBase.metadata.drop_all(engine)
+    entities.EntityBase.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        user_entities = {model.id: UserEntity.from_model(model) for model in users.models}
+        role_entities = {model.id: RoleEntity.from_model(model) for model in roles.models}
+        session.add_all([*user_entities.values(), *role_entities.values()])
+        for user, role in user_roles.pairs:
+            user_entities[user.id].roles.append(role_entities[role.id])
+        for role, permission in permissions.pairs:
+            entity = PermissionEntity.from_model(permission)
+            entity.role = role_entities[role.id]
+            session.add(entity)
+        session.commit()
+        ensure_partitions(session, datetime.now() - timedelta(days=days // 2), datetime.now() + timedelta(days=days // 2 + 1))
+
+        desk_types = [(desk.desk_type, desk.included_resource) for desk in dev_desks.models]
+        session.execute(text('''
+            INSERT INTO desk (id, tag, desk_type, included_resource, available)
+            SELECT d, 'BD' || d, (:types)[1 + d % cardinality(:types)], (:resources)[1 + d % cardinality(:resources)], d % 50 <> 0
+            FROM generate_series(1, :desks) d'''),
+            {'desks': desks, 'types': [t for t, _ in desk_types], 'resources': [r for _, r in desk_types]})
+
+        first_user = len(users.models) + 1
+        # Names are drawn from FIRST_NAMES and LAST_NAMES so that searching users matches as many as it would in production.
+        session.execute(text('''
+            INSERT INTO "user" (id, pid, onyen, email, first_name, last_name, pronouns)
+            SELECT u, 200000000 + u, onyen, onyen || '@unc.edu', first_name, last_name, 'they / them'
+            FROM generate_series(:first, :first + :users - 1) u,
+                 LATERAL (SELECT (:first_names)[1 + u % cardinality(:first_names)] AS first_name,
+                                 (:last_names)[1 + u / cardinality(:first_names) % cardinality(:last_names)] AS last_name) names,
+                 LATERAL (SELECT lower(left(first_name, 1) || left(last_name, 8)) || u AS onyen) onyens'''),
+            {'first': first_user, 'users': users_count, 'first_names': FIRST_NAMES, 'last_names': LAST_NAMES})
+
+        # Within each hour every desk is held by a different user, as (d + h) % users is distinct for distinct desks.
+        session.execute(text('''
+            INSERT INTO desk_reservation (desk_id, user_id, date)
+            SELECT d, :first + (d + h * 7) % :users, day + h * interval '1 hour'
+            FROM generate_series(date_trunc('day', LOCALTIMESTAMP) - (:days / 2 - 1) * interval '1 day',
+                                 date_trunc('day', LOCALTIMESTAMP) + (:days / 2) * interval '1 day',
+                                 interval '1 day') day,
+                 generate_series(:opening, :closing - 1) h,
+                 generate_series(1, :desks) d
+            WHERE (d * 7919 + h * 104729 + extract(doy FROM day)::int * 1299709) % 1000 < :occupancy'''),
+            {'first': first_user, 'users': users_count, 'days': days, 'desks': desks,
+             'opening': OPENING_HOUR, 'closing': CLOSING_HOUR, 'occupancy': int(occupancy * 1000)})
+
+        reset_sequences(session, ['user', 'role', 'permission', 'desk', 'desk_reservation'])
+        session.commit()
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('VACUUM ANALYZE'))
+        return {table: connection.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+                for table in ['user', 'role', 'permission', 'desk', 'desk_reservation']}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--desks', type=int, default=3000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=60, help='days of reservations, centered on today')
+    parser.add_argument('--occupancy', type=float, default=0.7, help='fraction of slots reserved')
+    args = parser.parse_args()
+    print(json.dumps(seed(bench_engine(), args.desks, args.users, args.days, args.occupancy), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,21 @@
 """SQLAlchemy DB Engine and Session niceties for FastAPI dependency injection."""
 
+import time
 import sqlalchemy
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .env import getenv
+from .metrics import registry
 
 __authors__ = ["Kailash Muthu"]
 __copyright__ = "Copyright 2023"
 __license__ = "MIT"
 
 
-def _engine_str(database=getenv("POSTGRES_DATABASE")) -> str:
+def _engine_str(database=getenv("POSTGRES_DATABASE"), dialect="postgresql+psycopg2") -> str:
     """Helper function for reading settings from environment variables to produce connection string."""
-    dialect = "postgresql+psycopg2"
     user = getenv("POSTGRES_USER")
     password = getenv("POSTGRES_PASSWORD")
     host = getenv("POSTGRES_HOST")
@@ -19,7 +23,38 @@ def _engine_str(database=getenv("POSTGRES_DATABASE")) -> str:
     return f"{dialect}://{user}:{password}@{host}:{port}/{database}"
 
 
-engine = sqlalchemy.create_engine(_engine_str(), echo=True)
+_echo = getenv("POSTGRES_ECHO", "false").lower() in ("1", "true")
+"""Whether the engines log every SQL statement, which is costly and only meant for debugging."""
+
+pool_wait = registry.histogram('db_pool_checkout_wait_seconds', 'Time waited for a connection of the pool, connecting included.', ('pool',))
+pool_timeouts = registry.counter('db_pool_checkout_timeouts_total', 'Checkouts given up after waiting for the pool timeout.', ('pool',))
+
+
+class _TimedCheckout:
+    """Mixin of the queue pools of the app engines, recording how long checkouts wait for a connection."""
+
+    label: str
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_timeouts.inc(self.label)
+            raise
+        finally:
+            pool_wait.observe(time.perf_counter() - start, self.label)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    label = 'sync'
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    label = 'async'
+
+
+engine = sqlalchemy.create_engine(_engine_str(), echo=_echo, poolclass=TimedQueuePool)
 """Application-level SQLAlchemy database engine."""
 
 
@@ -30,3 +65,40 @@ def db_session():
         yield session
     finally:
         session.close()
+
+
+async_engine = create_async_engine(
+    _engine_str(dialect="postgresql+asyncpg"),
+    echo=_echo,
+    pool_size=int(getenv("POSTGRES_POOL_SIZE", "20")),
+    max_overflow=int(getenv("POSTGRES_MAX_OVERFLOW", "10")),
+    pool_timeout=float(getenv("POSTGRES_POOL_TIMEOUT", "30")),
+    poolclass=TimedAsyncAdaptedQueuePool,
+)
+"""Application-level SQLAlchemy async database engine used by `async def` routes.
+
+The pool is sized with the POSTGRES_POOL_SIZE, POSTGRES_MAX_OVERFLOW and POSTGRES_POOL_TIMEOUT
+environment variables. Scripts and tests continue to use the synchronous `engine`."""
+
+
+async def async_db_session():
+    """Generator function offering dependency injection of SQLAlchemy AsyncSessions."""
+    session = AsyncSession(async_engine)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+def _pool_states():
+    """Size, connections checked out and in, and overflow of the pools of both engines."""
+    for label, pool in (('sync', engine.pool), ('async', async_engine.pool)):
+        yield (label, 'size'), pool.size()
+        yield (label, 'checked_out'), pool.checkedout()
+        yield (label, 'checked_in'), pool.checkedin()
+        # The overflow counts down from minus the size while the pool fills up.
+        yield (label, 'overflow'), max(pool.overflow(), 0)
+
+
+registry.collected('db_pool_connections', 'Connections of the pools, by state: the pool size, checked out, checked in and beyond the size.',
+                   ('pool', 'state'), _pool_states)
@@ -20,6 +20,7 @@ from .permission_entity import PermissionEntity
 from .user_role_entity import user_role_table
 from .desk_entity import DeskEntity
 from .desk_reservation_entity import DeskReservationEntity
+from .desk_reservation_history_entity import DeskReservationHistoryEntity
 
 
 __authors__ = ["Kailash Muthu"]
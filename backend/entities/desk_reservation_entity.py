@@ -1,35 +1,53 @@
-from sqlalchemy import Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import DDL, Integer, DateTime, ForeignKey, UniqueConstraint, event
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import Self
 from .entity_base import EntityBase
 from ..models import DeskReservation
 from . import UserEntity
 # from . import DeskEntity
-from datetime import datetime
+from datetime import datetime, timezone
 
 class DeskReservationEntity(EntityBase):
     __tablename__ = "desk_reservation"
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    date: Mapped[datetime] = mapped_column(DateTime, unique=False)
+    # The table is partitioned by month of `date`, which Postgres requires to be part of the primary key.
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    date: Mapped[datetime] = mapped_column(DateTime, primary_key=True, unique=False, index=True)
 
     desk_id: Mapped[int] = mapped_column(ForeignKey('desk.id'), nullable=True)
     desk: Mapped['DeskEntity'] = relationship(back_populates='desk_reservations')
 
     user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), nullable=True)
     user: Mapped[UserEntity] = relationship(back_populates='desk_reservations')
-    # __table_args__ = (UniqueConstraint('desk_id', 'date', name='reservation_detail'),UniqueConstraint('user_id', 'date', name='user_reservation_time'))
+    # A desk and a user can each hold at most one reservation per slot, enforced by the database
+    # so that concurrent bookings of the same slot cannot both succeed.
+    __table_args__ = (
+        UniqueConstraint('desk_id', 'date', name='reservation_detail'),
+        UniqueConstraint('user_id', 'date', name='user_reservation_time'),
+        {'postgresql_partition_by': 'RANGE (date)'},
+    )
 
     @classmethod
     def from_model(cls, model: DeskReservation) -> Self:
+        date = model.date
+        if date is not None and date.tzinfo is not None:
+            # The column is timezone naive and holds UTC wall times for aware dates.
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
         return cls(
             id=model.id,
-            date=model.date,
+            date=date,
         )
     
     def to_model(self) -> DeskReservation:
-        print(self.date)
         return DeskReservation(
             id=self.id,
-            date= self.date,
-        )
\ No newline at end of file
+            date=self.date,
+            desk_id=self.desk_id,
+            user_id=self.user_id,
+        )
+
+
+# Reservations outside every monthly partition land in the default partition, until
+# `services.partition` moves them into the partition of their month once it is created.
+event.listen(DeskReservationEntity.__table__, 'after_create',
+             DDL('CREATE TABLE desk_reservation_default PARTITION OF desk_reservation DEFAULT'))
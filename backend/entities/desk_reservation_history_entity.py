@@ -0,0 +1,21 @@
+"""Reservations archived by the retention job once they are older than the retention period."""
+
+from sqlalchemy import Integer, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+from .entity_base import EntityBase
+from datetime import datetime
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+
+class DeskReservationHistoryEntity(EntityBase):
+    """Archived reservations keep the ids of their desk and user without foreign keys, so that
+    removing a desk or a user leaves its history in place."""
+    __tablename__ = "desk_reservation_history"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    date: Mapped[datetime] = mapped_column(DateTime, index=True)
+    desk_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=True)
@@ -1,8 +1,8 @@
 '''User accounts for all registered users in the application.'''
 
 
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import Index, Integer, String, func, literal_column, text
+from sqlalchemy.orm import Mapped, column_property, mapped_column, relationship
 from typing import Self
 from .entity_base import EntityBase
 from .user_role_entity import user_role_table
@@ -14,6 +14,10 @@ __copyright__ = 'Copyright 2023'
 __license__ = 'MIT'
 
 
+SEARCH_VECTOR = """to_tsvector('simple', "user".first_name || ' ' || "user".last_name || ' ' || "user".onyen || ' ' || replace("user".email, '@', ' '))"""
+"""Expression of the full-text search vector of a user, the email split so that its local part is a word of its own."""
+
+
 class UserEntity(EntityBase):
     __tablename__ = 'user'
 
@@ -29,11 +33,22 @@ class UserEntity(EntityBase):
         String(64), nullable=False, default='')
     pronouns: Mapped[str] = mapped_column(
         String(32), nullable=False, default='')
+    # Words of the names, onyen and email of the user, searched by prefix by `UserService.search`. Computed
+    # rather than stored, so as not to widen the rows every listing of users scans; the index holds the words.
+    search: Mapped[str] = column_property(literal_column(SEARCH_VECTOR), deferred=True)
 
     roles: Mapped[list['RoleEntity']] = relationship(secondary=user_role_table, back_populates='users')
     permissions: Mapped['PermissionEntity'] = relationship(back_populates='user')
     desk_reservations: Mapped[list['DeskReservationEntity']] = relationship(back_populates='user')
 
+    __table_args__ = (
+        Index('ix_user_search', text(SEARCH_VECTOR), postgresql_using='gin'),
+        Index('ix_user_onyen_prefix', func.lower(onyen).label('onyen'), postgresql_ops={'onyen': 'text_pattern_ops'}),
+        # Listing users by name reads them in order from these indexes, see `UserService.page`.
+        Index('ix_user_first_name', 'first_name', 'id'),
+        Index('ix_user_last_name', 'last_name', 'id'),
+    )
+
     @classmethod
     def from_model(cls, model: User) -> Self:
         return cls(
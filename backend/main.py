@@ -1,14 +1,27 @@
 """Entrypoint of backend API exposing the FastAPI `app` to be served by an application server such as uvicorn."""
 
+import logging
 from fastapi import FastAPI
-from .api import desk_reservation, health, static_files, profile, authentication, user, desk
+from .env import getenv
+from .api.middleware import MetricsMiddleware, RequestContextMiddleware
+from .api.responses import ModelJSONResponse
+from .api import desk_reservation, health, metrics, static_files, profile, authentication, user, desk, availability
 from .api.admin import users as admin_users
 from .api.admin import roles as admin_roles
+from .database import engine
+from .services.health import health_monitor
+from .services.occupancy import occupancy_index
+from .services.retention import partition_worker, retention_worker
 
 __authors__ = ["Kailash Muthu"]
 __copyright__ = "Copyright 2023"
 __license__ = "MIT"
 
+logging.basicConfig(
+    level=getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+
 description = """
 Welcome to the UNC Computer Science **Experience Labs** Application Programming Interface
 """
@@ -18,14 +31,41 @@ app = FastAPI(
     version="0.0.1",
     description=description,
     openapi_tags=[health.openapi_tags],
+    default_response_class=ModelJSONResponse,
 )
 
+app.add_middleware(RequestContextMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(user.api)
 app.include_router(profile.api)
 app.include_router(health.api)
+app.include_router(metrics.api)
 app.include_router(authentication.api)
 app.include_router(admin_users.api)
 app.include_router(admin_roles.api)
 app.include_router(desk_reservation.api)
 app.include_router(desk.api)
-app.mount("/", static_files.StaticFileMiddleware(directory="./static"))
\ No newline at end of file
+app.include_router(availability.api)
+
+# Serve the front-end bundle from memory, or from disk with STATIC_MANIFEST=false while rebuilding it locally.
+if getenv("STATIC_MANIFEST", "true").lower() in ("1", "true"):
+    app.mount("/", static_files.StaticBundle(directory="./static"))
+else:
+    app.mount("/", static_files.StaticFileMiddleware(directory="./static"))
+
+
+@app.on_event("startup")
+def start_background_workers():
+    partition_worker.start()
+    retention_worker.start()
+    occupancy_index.start(engine)
+    health_monitor.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    health_monitor.stop(timeout=5)
+    occupancy_index.stop(timeout=5)
+    retention_worker.stop(timeout=5)
+    partition_worker.stop(timeout=5)
@@ -0,0 +1,206 @@
+"""In-process metrics of the app, exposed in the Prometheus text format by the `/api/metrics` route.
+
+Counters and histograms are recorded on the hot path of every request, both on the event loop and on
+the threads running synchronous routes. Instead of taking a lock, each thread records into counts of
+its own, its shard, which no other thread writes. A lock is only taken when a thread first records a
+set of label values into a metric, to add its shard to those summed when the metrics are collected.
+A scrape may miss the observations racing with it; they are counted by the next one.
+
+Values kept elsewhere, such as the state of the connection pools or the hits of the caches, are read
+when the metrics are collected by the callback of a `Collected` metric.
+
+Every worker process of the application server holds metrics of its own, so that each worker is to
+be scraped, or the samples of each are to be told apart by the `instance` Prometheus assigns them.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds, in seconds, of the buckets of latency histograms."""
+
+
+class _Sharded:
+    """Base of metrics recording into per-thread shards of `size` values for each set of label values."""
+
+    type: str
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], size: int):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._size = size
+        self._local = threading.local()
+        self._shards: list[tuple[tuple[str, ...], list[float]]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self, labels: tuple[str, ...]) -> list[float]:
+        try:
+            shards = self._local.shards
+        except AttributeError:
+            shards = self._local.shards = {}
+        shard = shards.get(labels)
+        if shard is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f'{self.name} is labeled by {self.labelnames}, got {labels}')
+            shard = shards[labels] = [0.0] * self._size
+            with self._lock:
+                self._shards.append((labels, shard))
+        return shard
+
+    def totals(self) -> dict[tuple[str, ...], list[float]]:
+        """The values of every set of label values, summed over the shards of all threads."""
+        with self._lock:
+            shards = list(self._shards)
+        totals: dict[tuple[str, ...], list[float]] = {}
+        for labels, shard in shards:
+            total = totals.setdefault(labels, [0.0] * self._size)
+            for i, value in enumerate(shard):
+                total[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames, 1)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._shard(labels)[0] += amount
+
+    def samples(self) -> Iterable[tuple[str, tuple[str, ...], dict[str, str], float]]:
+        for labels, (value,) in self.totals().items():
+            yield self.name, labels, {}, value
+
+
+class Histogram(_Sharded):
+    """Histogram of observed values. Each shard holds the count of each bucket, not cumulated, then the sum."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard(labels)
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def samples(self) -> Iterable[tuple[str, tuple[str, ...], dict[str, str], float]]:
+        for labels, total in self.totals().items():
+            count = 0.0
+            for bound, observed in zip((*self.buckets, float('inf')), total):
+                count += observed
+                yield f'{self.name}_bucket', labels, {'le': _format(bound)}, count
+            yield f'{self.name}_sum', labels, {}, total[-1]
+            yield f'{self.name}_count', labels, {}, count
+
+
+class Collected:
+    """Metric of values kept elsewhere, read by `collect` as pairs of label values and value when collected."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+                 type: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.type = type
+        self._collect = collect
+
+    def samples(self) -> Iterable[tuple[str, tuple[str, ...], dict[str, str], float]]:
+        for labels, value in self._collect():
+            yield self.name, labels, {}, value
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Collected] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collected(self, name: str, documentation: str, labelnames: tuple[str, ...], collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+                  type: str = 'gauge') -> Collected:
+        return self._register(Collected(name, documentation, labelnames, collect, type))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> bytes:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, extra, value in metric.samples():
+                pairs = [*zip(metric.labelnames, labels), *extra.items()]
+                label_text = ','.join(f'{key}="{_escape(str(label))}"' for key, label in pairs)
+                lines.append(f'{name}{{{label_text}}} {_format(value)}' if label_text else f'{name} {_format(value)}')
+        return ('\n'.join(lines) + '\n').encode()
+
+
+registry = Registry()
+"""Metrics of this process."""
+
+service_method_duration = registry.histogram(
+    'service_method_duration_seconds', 'Time spent in the public methods of the services.', ('service', 'method'))
+
+
+def timed(cls: type) -> type:
+    """Class decorator recording the duration of every call of the public methods of a service.
+
+    Generator methods are timed until their generator is exhausted or closed."""
+    for name, function in list(vars(cls).items()):
+        if not name.startswith('_') and inspect.isfunction(function):
+            setattr(cls, name, _timed(function, cls.__name__, name))
+    return cls
+
+
+def _timed(function: Callable, service: str, method: str) -> Callable:
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def timed_generator(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return (yield from function(*args, **kwargs))
+            finally:
+                service_method_duration.observe(time.perf_counter() - start, service, method)
+        return timed_generator
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            service_method_duration.observe(time.perf_counter() - start, service, method)
+    return timed_function
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,49 @@
+"""Alembic environment running migrations against the application's database.
+
+Fresh databases are created from the entities by `script.reset_database`, which stamps them with
+the latest revision. Revisions in `versions/` bring existing databases up to date with the entities.
+"""
+
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine
+from backend.database import _engine_str
+from backend import entities
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+# Scripts stamp databases in-process, so the loggers of the app, such as `backend.sql`, are kept enabled.
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = entities.EntityBase.metadata
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL to stdout rather than executing it."""
+    context.configure(url=_engine_str(), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = context.config.attributes.get("connection") or create_engine(_engine_str())
+    if hasattr(connectable, "connect"):
+        with connectable.connect() as connection:
+            _run_migrations(connection)
+    else:
+        _run_migrations(connectable)
+
+
+def _run_migrations(connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
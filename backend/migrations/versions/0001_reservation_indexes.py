@@ -0,0 +1,33 @@
+"""Index desk reservations by desk, user and date.
+
+Every reservation listing filters on `date` together with `desk_id` or `user_id`. The unique
+indexes also enforce at most one reservation per desk and per user for each slot. Indexes are
+built concurrently so that live booking traffic is not blocked while they are created; this fails
+if existing reservations already violate uniqueness, which must then be resolved by hand.
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-04-24
+"""
+
+from alembic import op
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS reservation_detail ON desk_reservation (desk_id, date)')
+        op.execute('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS user_reservation_time ON desk_reservation (user_id, date)')
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_desk_reservation_date ON desk_reservation (date)')
+    op.execute('ALTER TABLE desk_reservation ADD CONSTRAINT reservation_detail UNIQUE USING INDEX reservation_detail')
+    op.execute('ALTER TABLE desk_reservation ADD CONSTRAINT user_reservation_time UNIQUE USING INDEX user_reservation_time')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_desk_reservation_date', table_name='desk_reservation')
+    op.drop_constraint('user_reservation_time', 'desk_reservation', type_='unique')
+    op.drop_constraint('reservation_detail', 'desk_reservation', type_='unique')
@@ -0,0 +1,34 @@
+"""Archive old desk reservations to a history table.
+
+The retention job moves reservations past the retention period from `desk_reservation` into
+`desk_reservation_history` rather than dropping them.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2023-04-26
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'desk_reservation_history',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('desk_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_desk_reservation_history_date', 'desk_reservation_history', ['date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_desk_reservation_history_date', table_name='desk_reservation_history')
+    op.drop_table('desk_reservation_history')
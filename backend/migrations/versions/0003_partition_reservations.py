@@ -0,0 +1,80 @@
+"""Partition desk reservations by month.
+
+The existing table is renamed aside and its reservations are copied into a new table partitioned by
+range of `date`, with one partition per month from the oldest reservation through two months from
+now and a default partition for any other month. The primary key becomes (id, date) as Postgres
+requires the partition key in every unique constraint. Bookings must be stopped while this runs.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2023-04-28
+"""
+
+from alembic import op
+from sqlalchemy import text
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+_RENAMED = ['reservation_detail', 'user_reservation_time', 'ix_desk_reservation_date']
+
+
+def _rename_aside(table: str, primary_key: str) -> None:
+    op.execute(f'ALTER TABLE desk_reservation RENAME TO {table}')
+    op.execute(f'ALTER INDEX {primary_key} RENAME TO {table}_pkey')
+    for index in _RENAMED:
+        op.execute(f'ALTER INDEX {index} RENAME TO {table}_{index}')
+    for constraint in ['desk_reservation_desk_id_fkey', 'desk_reservation_user_id_fkey']:
+        op.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {constraint} TO {table}_{constraint}')
+
+
+def _move_reservations(table: str) -> None:
+    op.execute(f'INSERT INTO desk_reservation (id, date, desk_id, user_id) SELECT id, date, desk_id, user_id FROM {table}')
+    op.execute('ALTER SEQUENCE desk_reservation_id_seq OWNED BY desk_reservation.id')
+    op.execute(f'DROP TABLE {table}')
+
+
+def upgrade() -> None:
+    _rename_aside('desk_reservation_unpartitioned', 'desk_reservation_pkey')
+    op.execute('''
+        CREATE TABLE desk_reservation (
+            id integer NOT NULL DEFAULT nextval('desk_reservation_id_seq'),
+            date timestamp without time zone NOT NULL,
+            desk_id integer REFERENCES desk (id),
+            user_id integer REFERENCES "user" (id),
+            CONSTRAINT desk_reservation_pkey PRIMARY KEY (id, date),
+            CONSTRAINT reservation_detail UNIQUE (desk_id, date),
+            CONSTRAINT user_reservation_time UNIQUE (user_id, date)
+        ) PARTITION BY RANGE (date)''')
+    op.execute('CREATE INDEX ix_desk_reservation_date ON desk_reservation (date)')
+    op.execute('CREATE TABLE desk_reservation_default PARTITION OF desk_reservation DEFAULT')
+
+    months = op.get_bind().execute(text('''
+        SELECT generate_series(date_trunc('month', least(min(date), LOCALTIMESTAMP)),
+                               date_trunc('month', LOCALTIMESTAMP) + interval '2 months',
+                               interval '1 month')
+        FROM desk_reservation_unpartitioned''')).scalars().all()
+    for month in months:
+        op.execute(f'''
+            CREATE TABLE desk_reservation_p{month:%Y%m} PARTITION OF desk_reservation
+            FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{month:%Y-%m-%d}'::timestamp + interval '1 month')''')
+
+    _move_reservations('desk_reservation_unpartitioned')
+
+
+def downgrade() -> None:
+    _rename_aside('desk_reservation_partitioned', 'desk_reservation_pkey')
+    op.execute('''
+        CREATE TABLE desk_reservation (
+            id integer NOT NULL DEFAULT nextval('desk_reservation_id_seq'),
+            date timestamp without time zone NOT NULL,
+            desk_id integer REFERENCES desk (id),
+            user_id integer REFERENCES "user" (id),
+            CONSTRAINT desk_reservation_pkey PRIMARY KEY (id),
+            CONSTRAINT reservation_detail UNIQUE (desk_id, date),
+            CONSTRAINT user_reservation_time UNIQUE (user_id, date)
+        )''')
+    op.execute('CREATE INDEX ix_desk_reservation_date ON desk_reservation (date)')
+    _move_reservations('desk_reservation_partitioned')
@@ -0,0 +1,25 @@
+"""Index users for search by the words of their names, onyen and email, and by onyen prefix.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2023-05-02
+"""
+
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('''
+        CREATE INDEX ix_user_search ON "user"
+        USING gin (to_tsvector('simple', first_name || ' ' || last_name || ' ' || onyen || ' ' || replace(email, '@', ' ')))''')
+    op.execute('CREATE INDEX ix_user_onyen_prefix ON "user" (lower(onyen) text_pattern_ops)')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_onyen_prefix', table_name='user')
+    op.drop_index('ix_user_search', table_name='user')
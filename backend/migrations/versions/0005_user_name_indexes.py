@@ -0,0 +1,23 @@
+"""Index users by first and last name, so that listing them by name reads each page from an index.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2023-05-03
+"""
+
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_first_name', 'user', ['first_name', 'id'])
+    op.create_index('ix_user_last_name', 'user', ['last_name', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_last_name', table_name='user')
+    op.drop_index('ix_user_first_name', table_name='user')
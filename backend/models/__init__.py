@@ -1,12 +1,16 @@
 """Package for all models in the application."""
 
-from .pagination import Paginated, PaginationParams
+from .pagination import Paginated, PaginationParams, CursorPaginated, CursorPaginationParams
 from .permission import Permission
 from .user import User, ProfileForm, NewUser
 from .role import Role
 from .role_details import RoleDetails
 from .desk import Desk
 from .desk_reservation import DeskReservation
+from .availability import Availability, DeskAvailability, AvailabilityEvent
+from .bulk_reservation import BulkReservationRequest, BulkReservationResult, Recurrence, SlotReservation
+from .retention import RetentionStatus
+from .health import Readiness, PoolHealth, CacheHealth
 
 __authors__ = ["Kailash Muthu"]
 __copyright__ = "Copyright 2023"
@@ -0,0 +1,38 @@
+"""Availability models summarize which hourly slots of each desk are reserved over a window of time."""
+
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Literal
+from .desk import Desk
+
+
+class DeskAvailability(BaseModel):
+    """Reserved hourly slots of a single desk.
+
+    `reserved` is a base64 encoded bitset with one bit per hourly slot of the enclosing
+    `Availability` window. Bit `i` (most significant bit first) is set when the hour
+    `start + i hours` is already reserved."""
+    desk_id: int
+    tag: str = ""
+    desk_type: str = ""
+    reserved: str = ""
+
+
+class Availability(BaseModel):
+    start: datetime
+    end: datetime
+    slots: int
+    desks: list[DeskAvailability]
+
+
+class AvailabilityEvent(BaseModel):
+    """A change to the availability of desks, pushed to the clients watching them.
+
+    `booked` and `freed` concern the slot of `desk_id` at `date`. `desk` carries the desk after it was
+    created or updated, with `freed_from` set when all of its reservations from then on were removed.
+    `reset` tells the client that events were lost and availability must be fetched again."""
+    type: Literal['booked', 'freed', 'desk', 'desk_removed', 'reset']
+    desk_id: int | None = None
+    date: datetime | None = None
+    desk: Desk | None = None
+    freed_from: datetime | None = None
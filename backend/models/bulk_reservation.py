@@ -0,0 +1,36 @@
+"""Bulk reservation models book many hourly slots of a desk at once, either listed or by recurrence."""
+
+from pydantic import BaseModel
+from datetime import date, datetime
+from typing import Literal
+from .desk_reservation import DeskReservation
+
+
+class Recurrence(BaseModel):
+    """Slots repeating every week, e.g. weekdays from 10 to 12 for two weeks.
+
+    Every hour in `hours` is reserved on each day from `start` to `end` (inclusive) whose
+    weekday (Monday is 0) is in `weekdays`. Hours are wall clock hours in `timezone`."""
+    start: date
+    end: date
+    weekdays: list[int] = [0, 1, 2, 3, 4]
+    hours: list[int]
+    timezone: str = "UTC"
+
+
+class BulkReservationRequest(BaseModel):
+    desk_id: int
+    dates: list[datetime] = []
+    recurrence: Recurrence | None = None
+
+
+class SlotReservation(BaseModel):
+    """Outcome of a single slot: `conflict` when the desk or the user is already reserved at `date`,
+    `invalid` when `date` lies outside the booking window."""
+    date: datetime
+    status: Literal['reserved', 'conflict', 'invalid']
+    reservation: DeskReservation | None = None
+
+
+class BulkReservationResult(BaseModel):
+    slots: list[SlotReservation]
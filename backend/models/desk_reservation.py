@@ -5,4 +5,6 @@ from datetime import datetime
 
 class DeskReservation(BaseModel):
     id: int | None = None
-    date: datetime | None = None
\ No newline at end of file
+    date: datetime | None = None
+    desk_id: int | None = None
+    user_id: int | None = None
\ No newline at end of file
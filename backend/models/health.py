@@ -0,0 +1,34 @@
+"""Readiness reports whether the process is fit to serve traffic, and the state of what it depends upon."""
+
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class PoolHealth(BaseModel):
+    """Connections of a pool checked out by requests, out of the most it opens, size and overflow included.
+
+    Pools whose overflow is unbounded have neither `capacity` nor `utilization`."""
+    checked_out: int
+    capacity: int | None
+    utilization: float | None
+
+
+class CacheHealth(BaseModel):
+    """A cache is warm once it has answered a lookup, or for indexes loaded in full, once loaded."""
+    warm: bool
+    hit_ratio: float | None = None
+
+
+class Readiness(BaseModel):
+    """Readiness of the process, with the `reasons` it is not ready, if any.
+
+    The database is checked in the background; `database_checked` is the time of the last check and
+    `replication_lag` the seconds the replicas, or the database itself if a replica, lag behind."""
+    ready: bool
+    reasons: list[str] = []
+    database: bool
+    database_checked: datetime | None = None
+    database_latency_ms: float | None = None
+    replication_lag: float | None = None
+    pools: dict[str, PoolHealth] = {}
+    caches: dict[str, CacheHealth] = {}
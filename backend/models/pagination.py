@@ -17,3 +17,22 @@ class Paginated(GenericModel, Generic[T]):
     items: list[T]
     length: int
     params: PaginationParams
+
+
+class CursorPaginationParams(BaseModel):
+    cursor: str = ""
+    page_size: int = 50
+    order_by: str = ""
+    filter: str = ""
+
+
+class CursorPaginated(GenericModel, Generic[T]):
+    """Generic, abstract class for paginating models by position rather than page number.
+
+    Pass `next_cursor` as the `cursor` of the following request; it is None on the last page.
+    Unlike page offsets, a cursor stays cheap to resolve however deep into the listing it points.
+    `length` is the number of items of the whole listing, possibly estimated, if the listing tells it."""
+    items: list[T]
+    next_cursor: str | None
+    params: CursorPaginationParams
+    length: int | None = None
@@ -0,0 +1,24 @@
+"""Retention status reports the progress of archiving old reservations."""
+
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class RetentionStatus(BaseModel):
+    """Progress of the retention job since the process started.
+
+    `running` is True while a run is archiving batches, whose progress so far is `last_archived`."""
+    enabled: bool
+    running: bool = False
+    retention_days: int
+    interval: float
+    batch_size: int
+    runs: int = 0
+    batches: int = 0
+    archived: int = 0
+    last_started: datetime | None = None
+    last_finished: datetime | None = None
+    last_archived: int = 0
+    last_rows_per_second: float = 0.0
+    last_error: str | None = None
+    partitions_created: int = 0
@@ -0,0 +1,311 @@
+"""Generate a realistic dataset of any size and load it with COPY, for load testing.
+
+`reset_database` inserts the few demo entities of `script.dev_data` through the ORM, which takes
+hours for the millions of rows a load test needs. This script installs the same demo data, so that
+the mock personas work as usual, then generates labs of desks, users, roles and months of hourly
+reservations, and streams them into each table with a single `COPY` as they are generated.
+
+Demand for desks follows the hours of the day, `DIURNAL`, and the days of the week, `WEEKLY`, peaking
+at `--peak` of the desks taken. Past reservations span `--months` months; future ones thin out
+towards the end of the `--days-ahead` booking window, as they would when students book ahead. No
+desk and no user holds two reservations in the same hour.
+
+    python3 -m backend.script.generate_data --labs 20 --desks-per-lab 150 --users 50000 --months 3
+
+Like `reset_database`, this drops every table of the database first and only runs in development
+mode; pass `--database` to fill another database, created if it does not exist, such as one dedicated to
+load tests.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Session
+
+from ..database import _engine_str
+from ..env import getenv
+from .. import entities
+from ..entities import UserEntity, RoleEntity, PermissionEntity
+from ..services.partition import ensure_partitions
+from .dev_data import users as dev_users, roles as dev_roles, user_roles, permissions, desks as dev_desks
+
+__authors__ = ["Kailash Muthu"]
+__copyright__ = "Copyright 2023"
+__license__ = "MIT"
+
+FIRST_NAMES = ['Aaliyah', 'Alex', 'Amara', 'Ben', 'Carmen', 'Chen', 'Daniel', 'Devon', 'Elena', 'Emily', 'Fatima', 'Gabriel',
+               'Hannah', 'Isaac', 'Jamal', 'Jordan', 'Kai', 'Laila', 'Lucas', 'Maria', 'Mateo', 'Mei', 'Noah', 'Olivia',
+               'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Sofia', 'Taylor', 'Uma', 'Victor', 'Wei', 'Xavier', 'Yara', 'Zoe']
+LAST_NAMES = ['Adams', 'Brown', 'Chen', 'Davis', 'Evans', 'Garcia', 'Gupta', 'Harris', 'Ibrahim', 'Johnson', 'Kim', 'Lee',
+              'Lopez', 'Martin', 'Miller', 'Nguyen', 'Okafor', 'Patel', 'Quintero', 'Robinson', 'Rodriguez', 'Smith',
+              'Taylor', 'Thompson', 'Usman', 'Vasquez', 'Walker', 'Williams', 'Xu', 'Young', 'Zhang']
+
+BUILDINGS = ['SN', 'FB', 'BK', 'DV', 'GL', 'HM', 'KN', 'MN', 'PH', 'RN']
+"""Codes of the buildings labs are named after, numbered once every building has a lab."""
+
+DIURNAL = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.05, 0.2, 0.45, 0.7, 0.85, 0.8, 0.9,
+           1.0, 0.95, 0.85, 0.7, 0.55, 0.45, 0.35, 0.25, 0.1, 0.0)
+"""Demand for desks in each hour of the day, relative to the busiest hour."""
+
+WEEKLY = (1.0, 1.0, 0.95, 0.9, 0.7, 0.3, 0.45)
+"""Demand for desks on each day of the week from Monday, relative to the busiest day."""
+
+UNAVAILABLE = 0.02
+"""Fraction of the desks out of service."""
+
+ROLE_MEMBERS = 25
+ROLE_PERMISSIONS = [('checkin.*', 'checkin/{lab}'), ('reservation.*', 'reservation/{lab}'), ('user.search', '*'), ('admin.*', 'desk/{lab}')]
+"""Permissions granted by each generated role, over the desks of its lab."""
+
+TABLES = ['user', 'role', 'user_role', 'permission', 'desk', 'desk_reservation']
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def generate(engine: Engine, labs: int = 20, desks_per_lab: int = 150, users: int = 50000, roles: int = 20,
+             months: int = 3, days_ahead: int = 14, peak: float = 0.85, seed: int = 0,
+             now: datetime | None = None) -> dict[str, int]:
+    """Recreate the schema and fill it, returning the number of rows loaded into each table."""
+    desks = labs * desks_per_lab
+    if users < desks:
+        raise ValueError('users must be at least the number of desks, so that every desk taken in an hour has a user')
+    rng = random.Random(seed)
+    now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    start = (now - timedelta(days=30 * months)).replace(hour=0)
+    end = (now + timedelta(days=days_ahead)).replace(hour=0)
+
+    entities.EntityBase.metadata.drop_all(engine)
+    entities.EntityBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        config = Config(os.path.join(os.path.dirname(__file__), '..', 'alembic.ini'))
+        config.attributes['connection'] = connection
+        command.stamp(config, 'head')
+
+    with Session(engine) as session:
+        _add_dev_data(session)
+        ensure_partitions(session, start, end)
+
+    first_user = len(dev_users.models) + 1
+    first_role = len(dev_roles.models) + 1
+    first_desk = len(dev_desks.models) + 1
+    user_ids = range(first_user, first_user + users)
+    lab_codes = [_lab_code(lab) for lab in range(labs)]
+    desk_rows = list(_desks(rng, lab_codes, desks_per_lab, first_desk))
+    available = [desk_id for desk_id, _, _, _, is_available in desk_rows if is_available]
+
+    counts = {}
+    # Building the indexes and checking the foreign keys of the largest tables once they are loaded
+    # is several times faster than maintaining them row by row.
+    with deferred_indexes(engine, ['user', 'desk_reservation']):
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                counts['user'] = copy_rows(cursor, 'user', ('id', 'pid', 'onyen', 'email', 'first_name', 'last_name', 'pronouns'),
+                                           _users(user_ids))
+                counts['desk'] = copy_rows(cursor, 'desk', ('id', 'tag', 'desk_type', 'included_resource', 'available'), desk_rows)
+                # Each role is over the desks of one lab, and labs get more than one role when there are more roles than labs.
+                role_labs = {first_role + role: lab_codes[role % labs] for role in range(roles)}
+                counts['role'] = copy_rows(cursor, 'role', ('id', 'name'),
+                                           ((role_id, f'{code} Lab {(role_id - first_role) // labs + 1}') for role_id, code in role_labs.items()))
+                counts['user_role'] = copy_rows(cursor, 'user_role', ('user_id', 'role_id'),
+                                                ((user_id, role_id) for role_id in role_labs
+                                                 for user_id in rng.sample(user_ids, min(ROLE_MEMBERS, users))))
+                counts['permission'] = copy_rows(cursor, 'permission', ('action', 'resource', 'role_id'),
+                                                 ((action, resource.format(lab=code), role_id) for role_id, code in role_labs.items()
+                                                  for action, resource in ROLE_PERMISSIONS))
+                counts['desk_reservation'] = copy_rows(cursor, 'desk_reservation', ('id', 'desk_id', 'user_id', 'date'),
+                                                       _reservations(rng, available, user_ids, start, end, now, days_ahead, peak))
+            connection.commit()
+        finally:
+            connection.close()
+
+    with Session(engine) as session:
+        reset_sequences(session, TABLES)
+        session.commit()
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as autocommit:
+        autocommit.execute(text('VACUUM ANALYZE'))
+    return counts
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+    """Stream `rows` into `table` with a single COPY as they are generated, returning their number."""
+    stream = _CopyStream(rows)
+    cursor.copy_expert(f'COPY "{table}" ({", ".join(columns)}) FROM STDIN', stream, size=_CopyStream.CHUNK_SIZE)
+    return stream.rows
+
+
+@contextmanager
+def deferred_indexes(engine: Engine, tables: Iterable[str]) -> Iterator[None]:
+    """Drop the indexes and the unique and foreign key constraints of `tables` but their primary keys, and
+    recreate them after the block, which must have committed what it loaded."""
+    recreate = []
+    with engine.begin() as connection:
+        for table in tables:
+            constraints = connection.execute(text('''
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = CAST(:table AS regclass) AND contype IN ('u', 'f')'''), {'table': f'"{table}"'}).all()
+            indexes = connection.execute(text('''
+                SELECT CAST(indexrelid AS regclass)::text, pg_get_indexdef(indexrelid) FROM pg_index
+                WHERE indrelid = CAST(:table AS regclass) AND NOT indisprimary
+                  AND NOT EXISTS (SELECT FROM pg_constraint WHERE conrelid = indrelid AND conindid = indexrelid)'''),
+                {'table': f'"{table}"'}).all()
+            for name, definition in constraints:
+                connection.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"'))
+                recreate.append(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+            for name, definition in indexes:
+                connection.execute(text(f'DROP INDEX {name}'))
+                # The definition of the index of a partitioned table only covers the table itself, not its partitions.
+                recreate.insert(0, definition.replace(' ON ONLY ', ' ON ', 1))
+    yield
+    with engine.begin() as connection:
+        for statement in recreate:
+            connection.execute(text(statement))
+
+
+def reset_sequences(session: Session, tables: Iterable[str]) -> None:
+    """Make the id sequence of each of `tables` continue after the largest id, or start over if it is empty."""
+    for table in tables:
+        if 'id' in entities.EntityBase.metadata.tables[table].columns:
+            session.execute(text(f'''
+                SELECT setval(pg_get_serial_sequence('"{table}"', 'id'), coalesce(max(id), 0) + 1, false) FROM "{table}"'''))
+
+
+class _CopyStream:
+    """File-like reader of the text format of COPY, encoding rows into chunks as psycopg2 reads them."""
+
+    CHUNK_SIZE = 1 << 18
+
+    def __init__(self, rows: Iterable[tuple]):
+        self.rows = 0
+        self._rows = iter(rows)
+        self._buffer = b''
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        lines = []
+        length = len(self._buffer)
+        while length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = '\t'.join([_copy_value(value) for value in row]) + '\n'
+            lines.append(line)
+            length += len(line)
+            self.rows += 1
+        data = self._buffer + ''.join(lines).encode()
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value)
+
+
+def _add_dev_data(session: Session) -> None:
+    user_entities = {model.id: UserEntity.from_model(model) for model in dev_users.models}
+    role_entities = {model.id: RoleEntity.from_model(model) for model in dev_roles.models}
+    session.add_all([*user_entities.values(), *role_entities.values()])
+    for user, role in user_roles.pairs:
+        user_entities[user.id].roles.append(role_entities[role.id])
+    for role, permission in permissions.pairs:
+        entity = PermissionEntity.from_model(permission)
+        entity.role = role_entities[role.id]
+        session.add(entity)
+    session.add_all([entities.DeskEntity.from_model(model) for model in dev_desks.models])
+    session.commit()
+
+
+def _lab_code(lab: int) -> str:
+    building = BUILDINGS[lab % len(BUILDINGS)]
+    return building if lab < len(BUILDINGS) else f'{building}{lab // len(BUILDINGS) + 1}'
+
+
+def _desks(rng: random.Random, lab_codes: list[str], desks_per_lab: int, first_id: int) -> Iterator[tuple]:
+    kinds = [(desk.desk_type, desk.included_resource) for desk in dev_desks.models]
+    desk_id = first_id
+    for code in lab_codes:
+        # Each lab furnishes most of its desks alike, as a room of computer desks or of study carrels.
+        main_kind = rng.choice(kinds)
+        for number in range(1, desks_per_lab + 1):
+            desk_type, resource = main_kind if rng.random() < 0.7 else rng.choice(kinds)
+            yield desk_id, f'{code}-{number}', desk_type, resource, rng.random() >= UNAVAILABLE
+            desk_id += 1
+
+
+def _users(user_ids: range) -> Iterator[tuple]:
+    for user_id in user_ids:
+        first_name = FIRST_NAMES[user_id % len(FIRST_NAMES)]
+        last_name = LAST_NAMES[user_id // len(FIRST_NAMES) % len(LAST_NAMES)]
+        onyen = f'{first_name[0]}{last_name[:8]}{user_id}'.lower()
+        yield user_id, 200000000 + user_id, onyen, f'{onyen}@unc.edu', first_name, last_name, 'they / them'
+
+
+def _reservations(rng: random.Random, desk_ids: list[int], user_ids: range, start: datetime, end: datetime,
+                  now: datetime, days_ahead: int, peak: float) -> Iterator[tuple]:
+    reservation_id = 0
+    hour = start
+    while hour < end:
+        demand = peak * DIURNAL[hour.hour] * WEEKLY[hour.weekday()]
+        if hour > now:
+            # Fewer of the hours further ahead are booked yet.
+            demand *= max(0.0, 1 - (hour - now) / timedelta(days=days_ahead))
+        expected = len(desk_ids) * demand
+        taken = round(rng.gauss(expected, math.sqrt(expected * (1 - demand)))) if expected > 0 else 0
+        taken = min(max(taken, 0), len(desk_ids))
+        if taken:
+            stamp = hour.isoformat(sep=' ')
+            for desk_id, user_id in zip(rng.sample(desk_ids, taken), rng.sample(user_ids, taken)):
+                reservation_id += 1
+                yield reservation_id, desk_id, user_id, stamp
+        hour += timedelta(hours=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=getenv('POSTGRES_DATABASE'), help='database to fill, created if it does not exist')
+    parser.add_argument('--labs', type=int, default=20)
+    parser.add_argument('--desks-per-lab', type=int, default=150)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--roles', type=int, default=20)
+    parser.add_argument('--months', type=int, default=3, help='months of past reservations')
+    parser.add_argument('--days-ahead', type=int, default=14, help='days of future reservations')
+    parser.add_argument('--peak', type=float, default=0.85, help='fraction of the desks taken in the busiest hour')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator, for repeatable datasets')
+    args = parser.parse_args()
+
+    if getenv('MODE') != 'development':
+        print('This script can only be run in development mode.', file=sys.stderr)
+        print("Add MODE=development to your .env file in workspace's `backend/` directory")
+        exit(1)
+
+    with create_engine(_engine_str(''), isolation_level='AUTOCOMMIT').connect() as connection:
+        try:
+            connection.execute(text(f'CREATE DATABASE {args.database}'))
+        except ProgrammingError:
+            ...
+
+    started = time.monotonic()
+    counts = generate(create_engine(_engine_str(args.database)), args.labs, args.desks_per_lab, args.users, args.roles,
+                      args.months, args.days_ahead, args.peak, args.seed)
+    elapsed = time.monotonic() - started
+    print(json.dumps({**counts, 'seconds': round(elapsed, 1), 'rows_per_second': round(sum(counts.values()) / elapsed)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
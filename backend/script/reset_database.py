@@ -1,6 +1,10 @@
 """Reset the database by dropping all tables, creating tables, and inserting demo data."""
 
+import os
 import sys
+from datetime import datetime
+from alembic import command
+from alembic.config import Config
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
@@ -31,6 +35,9 @@ entities.EntityBase.metadata.drop_all(engine)
 # Create Tables
 entities.EntityBase.metadata.create_all(engine)
 
+# Mark the freshly created schema as up to date with all migrations
+command.stamp(Config(os.path.join(os.path.dirname(__file__), '..', 'alembic.ini')), 'head')
+
 # Insert Dev Data from `script.dev_data`
 
 # Add Users
@@ -92,3 +99,9 @@ with Session(engine) as session:
         session.add(entity)
     session.execute(text(f'ALTER SEQUENCE {entities.DeskReservationEntity.__table__}_id_seq RESTART WITH {len(desk_reservations.models) + 1}'))
     session.commit()
+
+# Create the partitions of the demo reservations and of the upcoming months
+with Session(engine) as session:
+    from ..services.partition import maintain_partitions
+    from ..services.retention import RETENTION
+    maintain_partitions(session, datetime.now() - RETENTION)
@@ -1,5 +1,6 @@
 from .user import UserService
 from .permission import PermissionService, UserPermissionError
 from .role import RoleService
-from .desk_reservation import DeskReservationService
-from .desk import DeskService
\ No newline at end of file
+from .desk_reservation import DeskReservationService, ReservationConflictError
+from .desk import DeskService
+from .async_services import AsyncPermissionService, AsyncUserService, AsyncRoleService, AsyncDeskReservationService, AsyncDeskService
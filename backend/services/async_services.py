@@ -0,0 +1,186 @@
+"""Async variants of the services for `async def` routes.
+
+Each async service wraps its synchronous counterpart and runs it on an `AsyncSession` via
+`AsyncSession.run_sync`. SQLAlchemy executes the synchronous ORM code in a greenlet which yields
+to the event loop whenever the asyncpg driver waits on the database, so the service logic is
+written once while a request no longer occupies a threadpool worker for its whole duration.
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
+from typing import Generic, TypeVar
+from fastapi import Depends
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import async_db_session
+from ..models import User, Desk, DeskReservation, Availability, Permission, Role, RoleDetails, Paginated, PaginationParams, CursorPaginated, CursorPaginationParams, BulkReservationRequest, BulkReservationResult, RetentionStatus
+from .permission import PermissionService
+from .user import UserService
+from .role import RoleService
+from .desk import DeskService
+from .desk_reservation import DeskReservationService, admin_reservation
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+S = TypeVar('S')
+T = TypeVar('T')
+
+
+class AsyncService(ABC, Generic[S]):
+    """Abstract base of async services running a synchronous service of type `S` on an `AsyncSession`."""
+
+    _session: AsyncSession
+
+    def __init__(self, session: AsyncSession = Depends(async_db_session)):
+        self._session = session
+
+    @abstractmethod
+    def _service(self, session: Session) -> S:
+        """Construct the synchronous service around the session `run_sync` provides."""
+
+    async def _run(self, call: Callable[[S], T]) -> T:
+        return await self._session.run_sync(lambda session: call(self._service(session)))
+
+
+class AsyncPermissionService(AsyncService[PermissionService]):
+
+    def _service(self, session: Session) -> PermissionService:
+        return PermissionService(session)
+
+    async def get_permissions(self, subject: User) -> list[Permission]:
+        return await self._run(lambda service: service.get_permissions(subject))
+
+    async def grant(self, grantor: User, grantee: User | Role | RoleDetails, permission: Permission) -> bool:
+        return await self._run(lambda service: service.grant(grantor, grantee, permission))
+
+    async def revoke(self, revoker: User, permission: Permission) -> bool:
+        return await self._run(lambda service: service.revoke(revoker, permission))
+
+    async def enforce(self, subject: User, action: str, resource: str) -> None:
+        return await self._run(lambda service: service.enforce(subject, action, resource))
+
+    async def check(self, subject: User, action: str, resource: str) -> bool:
+        return await self._run(lambda service: service.check(subject, action, resource))
+
+
+class AsyncUserService(AsyncService[UserService]):
+
+    def _service(self, session: Session) -> UserService:
+        return UserService(session, PermissionService(session))
+
+    async def get(self, pid: int) -> User | None:
+        return await self._run(lambda service: service.get(pid))
+
+    async def search(self, subject: User, query: str) -> list[User]:
+        return await self._run(lambda service: service.search(subject, query))
+
+    async def list(self, subject: User, pagination_params: PaginationParams) -> Paginated[User]:
+        return await self._run(lambda service: service.list(subject, pagination_params))
+
+    async def page(self, subject: User, params: CursorPaginationParams) -> CursorPaginated[User]:
+        return await self._run(lambda service: service.page(subject, params))
+
+    async def create(self, subject: User, user: User) -> User:
+        return await self._run(lambda service: service.create(subject, user))
+
+    async def update(self, subject: User, user: User) -> User:
+        return await self._run(lambda service: service.update(subject, user))
+
+
+class AsyncRoleService(AsyncService[RoleService]):
+
+    def _service(self, session: Session) -> RoleService:
+        return RoleService(session, PermissionService(session))
+
+    async def list(self, subject: User) -> list[Role]:
+        return await self._run(lambda service: service.list(subject))
+
+    async def details(self, subject: User, id: int) -> RoleDetails:
+        return await self._run(lambda service: service.details(subject, id))
+
+    async def grant(self, subject: User, id: int, permission: Permission) -> RoleDetails:
+        return await self._run(lambda service: service.grant(subject, id, permission))
+
+    async def revoke(self, subject: User, id: int, permissionId: int) -> bool:
+        return await self._run(lambda service: service.revoke(subject, id, permissionId))
+
+    async def add(self, subject: User, id: int, member: User) -> RoleDetails:
+        return await self._run(lambda service: service.add(subject, id, member))
+
+    async def remove(self, subject: User, id: int, userId: int) -> bool:
+        return await self._run(lambda service: service.remove(subject, id, userId))
+
+
+class AsyncDeskService(AsyncService[DeskService]):
+
+    def _service(self, session: Session) -> DeskService:
+        return DeskService(session, PermissionService(session))
+
+    async def list_all_desks(self, subject: User) -> list[Desk]:
+        return await self._run(lambda service: service.list_all_desks(subject))
+
+    async def list_available_desks(self) -> list[Desk]:
+        return await self._run(lambda service: service.list_available_desks())
+
+    async def create_desk(self, desk: Desk, subject: User) -> Desk:
+        return await self._run(lambda service: service.create_desk(desk, subject))
+
+    async def remove_desk(self, desk: Desk, subject: User) -> Desk:
+        return await self._run(lambda service: service.remove_desk(desk, subject))
+
+    async def toggle_desk_availability(self, desk: Desk, subject: User) -> Desk:
+        return await self._run(lambda service: service.toggle_desk_availability(desk, subject))
+
+    async def get_desk_by_id(self, desk_id: int) -> Desk:
+        return await self._run(lambda service: service.get_desk_by_id(desk_id))
+
+    async def update_desk(self, desk_id: int, desk: Desk, subject: User) -> Desk:
+        return await self._run(lambda service: service.update_desk(desk_id, desk, subject))
+
+
+class AsyncDeskReservationService(AsyncService[DeskReservationService]):
+
+    def _service(self, session: Session) -> DeskReservationService:
+        return DeskReservationService(session, PermissionService(session))
+
+    async def list_future_desk_reservations_for_admin(self, subject: User) -> list[(DeskReservation, Desk, User)]:
+        return await self._run(lambda service: service.list_future_desk_reservations_for_admin(subject))
+
+    async def list_past_desk_reservations_for_admin(self, subject: User) -> list[(DeskReservation, Desk, User)]:
+        return await self._run(lambda service: service.list_past_desk_reservations_for_admin(subject))
+
+    async def page_desk_reservations_for_admin(self, subject: User, past: bool, params: CursorPaginationParams) -> CursorPaginated[tuple[DeskReservation, Desk, User]]:
+        return await self._run(lambda service: service.page_desk_reservations_for_admin(subject, past, params))
+
+    async def stream_desk_reservations_for_admin(self, subject: User, past: bool) -> AsyncIterator[tuple[DeskReservation, Desk, User]]:
+        # A live iterator cannot be returned out of `run_sync`, so rows stream from the AsyncSession directly.
+        stmt = await self._run(lambda service: service.stream_statement_for_admin(subject, past))
+        result = await self._session.stream(stmt)
+        return (admin_reservation(row) async for row in result)
+
+    async def remove_old_reservations(self, subject: User) -> int:
+        return await self._run(lambda service: service.remove_old_reservations(subject))
+
+    async def retention_status(self, subject: User) -> RetentionStatus:
+        return await self._run(lambda service: service.retention_status(subject))
+
+    async def list_desk_reservations_by_user(self, user: User) -> list[(DeskReservation, Desk)]:
+        return await self._run(lambda service: service.list_desk_reservations_by_user(user))
+
+    async def list_reservations_by_desk(self, desk_id: int) -> list[DeskReservation]:
+        return await self._run(lambda service: service.list_reservations_by_desk(desk_id))
+
+    async def create_desk_reservation(self, desk: Desk, user: User, reservation: DeskReservation) -> DeskReservation:
+        return await self._run(lambda service: service.create_desk_reservation(desk, user, reservation))
+
+    async def create_desk_reservations(self, user: User, request: BulkReservationRequest) -> BulkReservationResult:
+        return await self._run(lambda service: service.create_desk_reservations(user, request))
+
+    async def remove_desk_reservation(self, desk: Desk, user: User, reservation: DeskReservation) -> Desk:
+        return await self._run(lambda service: service.remove_desk_reservation(desk, user, reservation))
+
+    async def get_availability(self, start: datetime | None = None, end: datetime | None = None, desk_type: str | None = None) -> Availability:
+        return await self._run(lambda service: service.get_availability(start, end, desk_type))
@@ -5,8 +5,67 @@ from ..database import db_session
 from ..models import User, Desk
 from ..entities import DeskEntity, DeskReservationEntity
 from .permission import PermissionService
+from .occupancy import occupancy_index
+from .cache import TTLCache
+from . import request_context
+from ..env import getenv
 from datetime import datetime
 
+
+class DeskCatalog:
+    """Responses of the desk catalog routes, serialized along with their ETag, by route and desk.
+
+    Desks only change through the admin routes of `DeskService`, which publish the change to the
+    occupancy index of every worker, upon which the catalog is invalidated. Entries are tagged with the
+    version of the catalog they were built at, so that a response built from desks read before a change
+    is not cached after it. Entries also expire after `ttl` seconds, in case a change of another worker
+    goes unseen while the occupancy index is disabled."""
+
+    def __init__(self, ttl: float):
+        self.version = 0
+        self._entries: TTLCache[tuple, tuple[str, bytes]] = TTLCache(maxsize=10_000, ttl=ttl)
+
+    @property
+    def hits(self) -> int:
+        return self._entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self._entries.misses
+
+    def get(self, key: tuple) -> tuple[str, bytes] | None:
+        """The ETag and body of the response cached for `key`, if any."""
+        return self._entries.get(key)
+
+    def put(self, key: tuple, version: int, tag: str, body: bytes) -> None:
+        """Cache a response built from desks read while the catalog was at `version`."""
+        if version == self.version:
+            self._entries.set(key, (tag, body))
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self._entries.clear()
+
+
+desk_catalog = DeskCatalog(ttl=float(getenv('DESK_CATALOG_TTL', '300')))
+"""Desk catalog shared by all requests of this process."""
+
+
+def _invalidate_catalog(change: dict) -> None:
+    if change['op'] in ('desk', 'remove'):
+        desk_catalog.invalidate()
+
+
+occupancy_index.subscribe(_invalidate_catalog)
+
+
+def find_desk(session: Session, desk_id: int) -> Desk | None:
+    """The desk `desk_id`, or None if there is none, read once per request until a desk changes."""
+    def load() -> Desk | None:
+        desk_entity = session.get(DeskEntity, desk_id)
+        return desk_entity.to_model() if desk_entity is not None else None
+    return request_context.lookup('desk', desk_id, desk_catalog.version, load)
+
 class DeskService:
     def __init__(self, session: Session = Depends(db_session), permission: PermissionService = Depends()):
         self._session = session
@@ -37,6 +96,9 @@ class DeskService:
         Returns:
             list[Desk]: A list of available desk entities.
         """
+        desks = occupancy_index.available_desks()
+        if desks is not None:
+            return desks
         stmt = select(DeskEntity).where(DeskEntity.available == True).order_by(DeskEntity.id)
         desk_entities = self._session.execute(stmt).scalars()
         return [desk_entity.to_model() for desk_entity in desk_entities]
@@ -57,7 +119,10 @@ class DeskService:
         self._permission.enforce(subject, 'admin/', 'desk')
         desk_entity = DeskEntity.from_model(desk)
         self._session.add(desk_entity)
+        self._session.flush()
+        change = occupancy_index.publish(self._session, occupancy_index.desk_changed(desk_entity.to_model()))
         self._session.commit()
+        occupancy_index.apply(change)
         return desk_entity.to_model()
 
 
@@ -76,7 +141,9 @@ class DeskService:
         self._permission.enforce(subject, 'admin/', 'desk')
         desk_entity = self._session.get(DeskEntity, desk.id)
         self._session.delete(desk_entity)
+        change = occupancy_index.publish(self._session, occupancy_index.desk_removed(desk_entity.id))
         self._session.commit()
+        occupancy_index.apply(change)
         return desk_entity.to_model()
     
     
@@ -93,12 +160,16 @@ class DeskService:
             desk_entity.available = False
         else:
             desk_entity.available = True
+        freed_from = None
         if not desk_entity.available:
+            freed_from = datetime.now().replace(minute=0, second=0, microsecond=0)
             stmt = delete(DeskReservationEntity)\
                 .where(DeskReservationEntity.desk_id == desk.id) \
-                .where(DeskReservationEntity.date >= datetime.now().replace(minute=0, second=0, microsecond=0))
+                .where(DeskReservationEntity.date >= freed_from)
             self._session.execute(stmt)
+        change = occupancy_index.publish(self._session, occupancy_index.desk_changed(desk_entity.to_model(), freed_from))
         self._session.commit()
+        occupancy_index.apply(change)
         return desk_entity.to_model()
     
 
@@ -111,9 +182,7 @@ class DeskService:
         Returns:
             Desk: The desk entity with the specified ID.
         """
-        stmt = select(DeskEntity).where(DeskEntity.id == desk_id)
-        desk_entity = self._session.execute(stmt).scalar_one_or_none()
-        return desk_entity.to_model()
+        return find_desk(self._session, desk_id).copy()
     
     
     def update_desk(self, desk_id: int, desk: Desk, subject: User) -> Desk:
@@ -132,5 +201,7 @@ class DeskService:
         desk_entity.desk_type = desk.desk_type
         desk_entity.included_resource = desk.included_resource
         desk_entity.available = desk.available
+        change = occupancy_index.publish(self._session, occupancy_index.desk_changed(desk_entity.to_model()))
         self._session.commit()
+        occupancy_index.apply(change)
         return desk_entity.to_model()
\ No newline at end of file
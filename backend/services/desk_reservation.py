@@ -1,12 +1,44 @@
+import base64
+from collections.abc import Callable, Iterator, Sequence
 from fastapi import Depends
-from sqlalchemy import select, delete
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, and_, tuple_, Row, Select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import InstrumentedAttribute, Session
+from pydantic import BaseModel
 from ..database import db_session
-from ..models import User, Desk, DeskReservation
+from ..metrics import timed
+from ..models import User, Desk, DeskReservation, Availability, DeskAvailability, CursorPaginated, CursorPaginationParams, BulkReservationRequest, BulkReservationResult, Recurrence, SlotReservation, RetentionStatus
 from ..entities import UserEntity, DeskEntity, DeskReservationEntity
 from .permission import PermissionService
-from datetime import datetime, timedelta
+from .retention import retention_worker
+from .occupancy import occupancy_index
+from .desk import find_desk
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+BOOKING_WINDOW = timedelta(days=30)
+"""Reservations can be made at most this far into the future."""
+
+SLOT = timedelta(hours=1)
+"""Duration of a single reservable slot."""
+
+MAX_PAGE_SIZE = 500
+"""Largest page of reservations returned by cursor pagination."""
+
+STREAM_BATCH_SIZE = 1000
+"""Rows fetched per round trip from the server-side cursor when streaming reservations."""
+
+MAX_BULK_SLOTS = BOOKING_WINDOW // SLOT
+"""Most slots a single bulk reservation may request, enough to cover the whole booking window."""
+
+
+class ReservationConflictError(Exception):
+    def __init__(self, date: datetime):
+        super().__init__(
+            f'The desk or user already has a reservation at `{date}`')
+
+
+@timed
 class DeskReservationService:
     def __init__(self, session: Session = Depends(db_session), permission: PermissionService = Depends()):
         self._session = session
@@ -20,19 +52,19 @@ class DeskReservationService:
             subject: The user performing the action.
 
         Returns:
-            list[(DeskReservation, Desk, User)]: A list of tuples, each containing a desk reservation entity, its associated desk entity, and the user who reserved the desk.
+            list[(DeskReservation, Desk, User)]: A list of tuples, each containing a desk reservation, its associated desk, and the user who reserved the desk.
         
         Raises:
             PermissionError: If the subject does not have permission to admin access.
         """
         self._permission.enforce(subject, 'admin/', 'desk_reservation')
-        stmt = select(DeskReservationEntity, DeskEntity, UserEntity)\
+        stmt = select(*ADMIN_RESERVATION_COLUMNS)\
+            .select_from(DeskReservationEntity)\
             .join(DeskEntity)\
             .join(UserEntity)\
             .where(DeskReservationEntity.date >= datetime.now().replace(minute=0, second=0, microsecond=0)) \
             .order_by(DeskReservationEntity.date)
-        reservation_entities = self._session.execute(stmt).all()
-        return [(desk_reservation_entity, desk_entity, user_entity) for desk_reservation_entity, desk_entity, user_entity in reservation_entities]
+        return [admin_reservation(row) for row in self._session.execute(stmt)]
     
 
     def list_past_desk_reservations_for_admin(self, subject: User) -> list[(DeskReservation, Desk, User)]:
@@ -42,39 +74,124 @@ class DeskReservationService:
             subject: The user performing the action.
 
         Returns:
-            list[(DeskReservation, Desk, User)]: A list of tuples, each containing a desk reservation entity, its associated desk entity, and the user who reserved the desk.
+            list[(DeskReservation, Desk, User)]: A list of tuples, each containing a desk reservation, its associated desk, and the user who reserved the desk.
         
         Raises:
             PermissionError: If the subject does not have permission to admin access.
         """
         self._permission.enforce(subject, 'admin/', 'desk_reservation')
-        stmt = select(DeskReservationEntity, DeskEntity, UserEntity)\
+        stmt = select(*ADMIN_RESERVATION_COLUMNS)\
+            .select_from(DeskReservationEntity)\
             .join(DeskEntity)\
             .join(UserEntity)\
             .where(DeskReservationEntity.date < datetime.now().replace(minute=0, second=0, microsecond=0)) \
             .order_by(DeskReservationEntity.date)
-        reservation_entities = self._session.execute(stmt).all()
-        return [(desk_reservation_entity, desk_entity, user_entity) for desk_reservation_entity, desk_entity, user_entity in reservation_entities]
+        return [admin_reservation(row) for row in self._session.execute(stmt)]
     
 
+    def page_desk_reservations_for_admin(self, subject: User, past: bool, params: CursorPaginationParams) -> CursorPaginated[tuple[DeskReservation, Desk, User]]:
+        """Page through future or past desk reservations for admin.
+
+        Future reservations are listed soonest first and past reservations most recent first. Each page
+        resumes after the date and id of the last reservation of the previous page, so that deep pages
+        are as cheap as the first one.
+
+        Args:
+            subject: The user performing the action.
+            past: Whether to list past rather than future reservations.
+            params: The cursor of the page to retrieve and its size.
+
+        Returns:
+            CursorPaginated[tuple[DeskReservation, Desk, User]]: A page of tuples, each containing a desk reservation, its desk, and the user who reserved the desk.
+
+        Raises:
+            PermissionError: If the subject does not have permission to admin access.
+            ValueError: If the cursor is malformed.
+        """
+        self._permission.enforce(subject, 'admin/', 'desk_reservation')
+        params = CursorPaginationParams(cursor=params.cursor, page_size=max(1, min(params.page_size, MAX_PAGE_SIZE)))
+        stmt = _admin_reservations_query(past)
+        if params.cursor != '':
+            key = tuple_(DeskReservationEntity.date, DeskReservationEntity.id)
+            after = tuple_(*_decode_cursor(params.cursor))
+            stmt = stmt.where(key < after if past else key > after)
+        rows = self._session.execute(stmt.limit(params.page_size + 1)).all()
+        items = [admin_reservation(row) for row in rows[:params.page_size]]
+        next_cursor = _encode_cursor(items[-1][0]) if len(rows) > params.page_size else None
+        return CursorPaginated(items=items, next_cursor=next_cursor, params=params)
+
+
+    def stream_desk_reservations_for_admin(self, subject: User, past: bool) -> Iterator[tuple[DeskReservation, Desk, User]]:
+        """Iterate over all future or past desk reservations for admin in the order of `page_desk_reservations_for_admin`.
+
+        Rows are fetched from a server-side cursor in batches, so memory use does not grow with the number of reservations.
+
+        Args:
+            subject: The user performing the action.
+            past: Whether to list past rather than future reservations.
+
+        Returns:
+            Iterator[tuple[DeskReservation, Desk, User]]: Tuples of each desk reservation, its desk, and the user who reserved the desk.
+
+        Raises:
+            PermissionError: If the subject does not have permission to admin access.
+        """
+        return (admin_reservation(row) for row in self._session.execute(self.stream_statement_for_admin(subject, past)))
+
+
+    def stream_statement_for_admin(self, subject: User, past: bool) -> Select:
+        """The statement of `stream_desk_reservations_for_admin`, whose rows `admin_reservation` turns into models,
+        for sessions which stream rows themselves such as an `AsyncSession`.
+
+        Args:
+            subject: The user performing the action.
+            past: Whether to select past rather than future reservations.
+
+        Returns:
+            Select: The statement, fetching rows in batches of STREAM_BATCH_SIZE.
+
+        Raises:
+            PermissionError: If the subject does not have permission to admin access.
+        """
+        self._permission.enforce(subject, 'admin/', 'desk_reservation')
+        return _admin_reservations_query(past).execution_options(yield_per=STREAM_BATCH_SIZE)
+
+
     def remove_old_reservations(self, subject: User) -> int:
-        """Remove desk reservations older than 1 month.
-        
+        """Archive desk reservations older than 1 month, in bounded batches committed one at a time.
+
+        The run is left to the background retention worker when it is started, and made right away
+        otherwise; either way its progress is reported by `retention_status`.
+
         Args:
             subject: The user performing the action.
         Returns:
-            None
+            int: 202 if the background worker was triggered, 204 once the run is done.
         Raises:
             PermissionError: If the subject does not have permission to admin access.
         """
         self._permission.enforce(subject, 'admin/', 'desk_reservation')
-        stmt = delete(DeskReservationEntity)\
-            .where(DeskReservationEntity.date < (datetime.now() - timedelta(days=30)))
-        self._session.execute(stmt)
-        self._session.commit()
+        if retention_worker.running:
+            retention_worker.trigger()
+            return 202
+        retention_worker.run_once(self._session)
         return 204
 
 
+    def retention_status(self, subject: User) -> RetentionStatus:
+        """Report the progress of the background retention job.
+
+        Args:
+            subject: The user performing the action.
+        Returns:
+            RetentionStatus: Counters of the reservations archived by this process.
+        Raises:
+            PermissionError: If the subject does not have permission to admin access.
+        """
+        self._permission.enforce(subject, 'admin/', 'desk_reservation')
+        return retention_worker.status()
+
+
     def list_desk_reservations_by_user(self, user: User) -> list[(DeskReservation, Desk)]:
         """List desk reservations by user.
 
@@ -82,15 +199,15 @@ class DeskReservationService:
             user: The user whose reservations to retrieve.
 
         Returns:
-            list[(DeskReservation, Desk)]: A list of tuples, each containing a desk reservation entity and its associated desk entity from from the current date onwards.
+            list[(DeskReservation, Desk)]: A list of tuples, each containing a desk reservation and its associated desk from the current date onwards.
         """
-        stmt = select(DeskReservationEntity, DeskEntity)\
+        stmt = select(*USER_RESERVATION_COLUMNS)\
+            .select_from(DeskReservationEntity)\
             .join(DeskEntity)\
             .where(DeskReservationEntity.user_id == user.id)\
             .where(DeskReservationEntity.date >= datetime.now().replace(minute=0, second=0, microsecond=0)) \
             .order_by(DeskReservationEntity.date)
-        reservation_entities = self._session.execute(stmt).all()
-        return [(desk_reservation_entity, desk_entity) for desk_reservation_entity, desk_entity in reservation_entities]
+        return [_user_reservation(row) for row in self._session.execute(stmt)]
     
 
     def list_reservations_by_desk(self, desk_id: int) -> list[DeskReservation]:
@@ -103,11 +220,10 @@ class DeskReservationService:
             list[DeskReservation]: A list of desk reservation entities.
         """
 
-        stmt = select(DeskReservationEntity)\
+        stmt = select(*DESK_RESERVATION_COLUMNS)\
             .where(DeskReservationEntity.desk_id == desk_id) \
             .where(DeskReservationEntity.date >= datetime.now().replace(minute=0, second=0, microsecond=0))
-        reservations = self._session.execute(stmt).scalars()
-        return [reservation.to_model() for reservation in reservations]
+        return [_desk_reservation(row)[0] for row in self._session.execute(stmt)]
 
 
     def create_desk_reservation(self, desk: Desk, user: User, reservation: DeskReservation) -> DeskReservation:
@@ -120,16 +236,82 @@ class DeskReservationService:
 
         Returns:
             DeskReservation: The created desk reservation entity.
-        """
 
+        Raises:
+            ReservationConflictError: If the desk or the user is already reserved at that date.
+        """
         reservation_entity = DeskReservationEntity.from_model(reservation)
-        reservation_entity.user_id = user.id
-        reservation_entity.desk_id = desk.id
-        self._session.add(reservation_entity)
+        # The id is always assigned by the sequence; the primary key (id, date) cannot tell client ids apart.
+        values = {'date': reservation_entity.date, 'desk_id': desk.id, 'user_id': user.id}
+
+        # A single statement both claims the slot and detects a conflicting reservation.
+        stmt = insert(DeskReservationEntity)\
+            .values(values)\
+            .on_conflict_do_nothing()\
+            .returning(DeskReservationEntity)
+        reservation_entity = self._session.scalars(stmt).one_or_none()
+        if reservation_entity is None:
+            self._session.commit()
+            raise ReservationConflictError(values['date'])
+        change = occupancy_index.publish(self._session, occupancy_index.reserved(desk.id, [reservation_entity.date]))
         self._session.commit()
+        occupancy_index.apply(change)
         return reservation_entity.to_model()
 
 
+    def create_desk_reservations(self, user: User, request: BulkReservationRequest) -> BulkReservationResult:
+        """Reserve many slots of a desk in a single transaction.
+
+        All slots are claimed by one multi-row insert which skips the slots already taken by the desk or
+        the user, so slots are reserved independently of each other and no conflicting slot fails the batch.
+
+        Args:
+            user: The user reserving the desk.
+            request: The desk and the slots to reserve, listed or as a recurrence.
+
+        Returns:
+            BulkReservationResult: The outcome of each requested slot in chronological order.
+
+        Raises:
+            ValueError: If the desk is not available, the recurrence is malformed, or no or too many slots are requested.
+        """
+        dates = [_floor_hour(date) for date in request.dates]
+        if request.recurrence is not None:
+            dates.extend(_recurring_slots(request.recurrence))
+        dates = sorted(set(dates))
+        if len(dates) == 0:
+            raise ValueError('No slots to reserve')
+        if len(dates) > MAX_BULK_SLOTS:
+            raise ValueError(f'At most {MAX_BULK_SLOTS} slots can be reserved at once')
+
+        desk = find_desk(self._session, request.desk_id)
+        if desk is None or not desk.available:
+            raise ValueError(f'Desk {request.desk_id} is not available')
+
+        start = _floor_hour(datetime.now())
+        valid = [date for date in dates if start <= date < start + BOOKING_WINDOW]
+        reserved = {}
+        if valid:
+            stmt = insert(DeskReservationEntity)\
+                .values([{'date': date, 'desk_id': desk.id, 'user_id': user.id} for date in valid])\
+                .on_conflict_do_nothing()\
+                .returning(DeskReservationEntity)
+            reserved = {entity.date: entity.to_model() for entity in self._session.scalars(stmt)}
+            change = occupancy_index.publish(self._session, occupancy_index.reserved(desk.id, list(reserved)))
+            self._session.commit()
+            occupancy_index.apply(change)
+
+        slots = []
+        for date in dates:
+            if date in reserved:
+                slots.append(SlotReservation(date=date, status='reserved', reservation=reserved[date]))
+            elif start <= date < start + BOOKING_WINDOW:
+                slots.append(SlotReservation(date=date, status='conflict'))
+            else:
+                slots.append(SlotReservation(date=date, status='invalid'))
+        return BulkReservationResult(slots=slots)
+
+
     def remove_desk_reservation(self, desk: Desk, user: User, reservation: DeskReservation) -> Desk:
         """Remove a desk reservation.
 
@@ -140,15 +322,152 @@ class DeskReservationService:
 
         Returns:
             Desk: The updated desk entity.
+
+        Raises:
+            ValueError: If the reservation does not exist.
         """
         
-        reservation_entity = self._session.get(DeskReservationEntity, reservation.id)
+        # The table is partitioned by date, so the date both completes the primary key and prunes the partitions.
+        stmt = select(DeskReservationEntity).where(DeskReservationEntity.id == reservation.id)
+        if reservation.date is not None:
+            stmt = stmt.where(DeskReservationEntity.date == reservation.date)
+        reservation_entity = self._session.scalars(stmt).one_or_none()
+        if reservation_entity is None:
+            raise ValueError(f'Reservation {reservation.id} does not exist')
+        change = occupancy_index.publish(self._session, occupancy_index.freed(reservation_entity.desk_id, [reservation_entity.date]))
         reservation_entity.user_id = user.id
         reservation_entity.desk_id = desk.id
         self._session.delete(reservation_entity)
         self._session.commit()
+        occupancy_index.apply(change)
         return reservation_entity.to_model()
-      
-    
-    
-    
\ No newline at end of file
+
+
+    def get_availability(self, start: datetime | None = None, end: datetime | None = None, desk_type: str | None = None) -> Availability:
+        """Summarize the reserved hourly slots of every available desk, from the occupancy index when loaded
+        or else in a single query.
+
+        Args:
+            start: The beginning of the window, defaults to the current hour.
+            end: The end of the window (exclusive), defaults to and is capped at `start` plus the booking window.
+            desk_type: Only include desks of this type when given.
+
+        Returns:
+            Availability: A bitset of reserved slots per desk, see `DeskAvailability`.
+
+        Raises:
+            ValueError: If the window is empty.
+        """
+        start = _floor_hour(start if start is not None else datetime.now())
+        end = _floor_hour(end) if end is not None else start + BOOKING_WINDOW
+        end = min(end, start + BOOKING_WINDOW)
+        if end <= start:
+            raise ValueError('end must be at least one hour after start')
+        availability = occupancy_index.availability(start, end, desk_type)
+        if availability is not None:
+            return availability
+        slots = (end - start) // SLOT
+
+        hour = func.date_trunc('hour', DeskReservationEntity.date)
+        stmt = select(DeskEntity.id, DeskEntity.tag, DeskEntity.desk_type, func.array_agg(hour).filter(DeskReservationEntity.id != None))\
+            .outerjoin(DeskReservationEntity, and_(
+                DeskReservationEntity.desk_id == DeskEntity.id,
+                DeskReservationEntity.date >= start,
+                DeskReservationEntity.date < end))\
+            .where(DeskEntity.available == True)\
+            .group_by(DeskEntity.id)\
+            .order_by(DeskEntity.id)
+        if desk_type:
+            stmt = stmt.where(DeskEntity.desk_type == desk_type)
+
+        desks = []
+        for desk_id, tag, desk_type, reserved_hours in self._session.execute(stmt):
+            bitset = bytearray((slots + 7) // 8)
+            for reserved_hour in reserved_hours or []:
+                slot = (reserved_hour - start) // SLOT
+                bitset[slot >> 3] |= 0x80 >> (slot & 7)
+            desks.append(DeskAvailability(desk_id=desk_id, tag=tag, desk_type=desk_type, reserved=base64.b64encode(bitset).decode()))
+        return Availability(start=start, end=end, slots=slots, desks=desks)
+
+
+def _floor_hour(date: datetime) -> datetime:
+    """Truncate a datetime to the hour, converting aware datetimes to the naive UTC dates reservations are stored in."""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def _recurring_slots(recurrence: Recurrence) -> list[datetime]:
+    """Expand a recurrence into the naive UTC dates of its slots."""
+    if any(not 0 <= weekday <= 6 for weekday in recurrence.weekdays):
+        raise ValueError('weekdays must be between 0 (Monday) and 6 (Sunday)')
+    if any(not 0 <= hour <= 23 for hour in recurrence.hours):
+        raise ValueError('hours must be between 0 and 23')
+    if recurrence.end < recurrence.start:
+        raise ValueError('end must not be before start')
+    if (recurrence.end - recurrence.start) > BOOKING_WINDOW:
+        raise ValueError(f'A recurrence spans at most {BOOKING_WINDOW.days} days')
+    try:
+        tz = ZoneInfo(recurrence.timezone)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f'Unknown timezone `{recurrence.timezone}`') from e
+
+    slots = []
+    for offset in range((recurrence.end - recurrence.start).days + 1):
+        day = recurrence.start + timedelta(days=offset)
+        if day.weekday() in recurrence.weekdays:
+            slots.extend(_floor_hour(datetime.combine(day, time(hour), tzinfo=tz)) for hour in recurrence.hours)
+    return slots
+
+
+def _projection(*groups: tuple[type[BaseModel], Sequence[InstrumentedAttribute]]) -> tuple[list[InstrumentedAttribute], Callable[[Row], tuple]]:
+    """Columns to select and a function building a tuple of models from each of their rows.
+
+    Selecting plain columns rather than entities skips the identity map and instance state the ORM
+    maintains for every entity, and `construct` skips validation of values which came from the database.
+    """
+    columns = []
+    slices = []
+    for model, group in groups:
+        slices.append((model, [column.key for column in group], len(columns), len(columns) + len(group)))
+        columns.extend(group)
+
+    def to_models(row: Row) -> tuple:
+        return tuple(model.construct(**dict(zip(keys, row[start:end]))) for model, keys, start, end in slices)
+    return columns, to_models
+
+
+_RESERVATION = (DeskReservation, (DeskReservationEntity.id, DeskReservationEntity.date, DeskReservationEntity.desk_id, DeskReservationEntity.user_id))
+_DESK = (Desk, (DeskEntity.id, DeskEntity.tag, DeskEntity.desk_type, DeskEntity.included_resource, DeskEntity.available))
+_USER = (User, (UserEntity.id, UserEntity.pid, UserEntity.onyen, UserEntity.email, UserEntity.first_name, UserEntity.last_name, UserEntity.pronouns))
+
+ADMIN_RESERVATION_COLUMNS, admin_reservation = _projection(_RESERVATION, _DESK, _USER)
+USER_RESERVATION_COLUMNS, _user_reservation = _projection(_RESERVATION, _DESK)
+DESK_RESERVATION_COLUMNS, _desk_reservation = _projection(_RESERVATION)
+
+
+def _admin_reservations_query(past: bool) -> Select:
+    """Reservations with their desk and user, future ones soonest first or past ones most recent first."""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    stmt = select(*ADMIN_RESERVATION_COLUMNS)\
+        .select_from(DeskReservationEntity)\
+        .join(DeskEntity)\
+        .join(UserEntity)
+    if past:
+        return stmt.where(DeskReservationEntity.date < now)\
+            .order_by(DeskReservationEntity.date.desc(), DeskReservationEntity.id.desc())
+    else:
+        return stmt.where(DeskReservationEntity.date >= now)\
+            .order_by(DeskReservationEntity.date, DeskReservationEntity.id)
+
+
+def _encode_cursor(reservation: DeskReservation) -> str:
+    return base64.urlsafe_b64encode(f'{reservation.date.isoformat()}|{reservation.id}'.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        date, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(date), int(id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor `{cursor}`') from e
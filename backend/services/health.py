@@ -6,16 +6,52 @@ In more complex deployments, where multiple backing services may be depended upo
 would necessarily also become more complex to reflect the health of all subsystems.
 
 In this context health does not refer to correctness as much as running, connected, and responsive.
+
+Orchestrators probe often, so readiness is not checked against the database on every probe. The
+`health_monitor` checks the database every HEALTH_INTERVAL seconds in a background thread, over a
+connection of its own so that a saturated pool does not make the check fail, and readiness probes are
+answered from its last result along with the state of the pools. The process reports not ready,
+shedding traffic to other instances, while:
+
+* the last check of the database failed, or is older than three intervals;
+* a pool of the app has more than HEALTH_MAX_POOL_UTILIZATION of its connections checked out;
+* the replicas lag more than HEALTH_MAX_REPLICATION_LAG seconds behind;
+* the process is shutting down.
 """
 
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any
 from fastapi import Depends
-from sqlalchemy import text
-from ..database import Session, db_session
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.pool import QueuePool
+from ..database import Session, db_session, engine, async_engine, _engine_str
+from ..env import getenv
+from ..models import Readiness, PoolHealth, CacheHealth
 
 __authors__ = ["Kailash Muthu"]
 __copyright__ = "Copyright 2023"
 __license__ = "MIT"
 
+MAX_POOL_UTILIZATION = float(getenv('HEALTH_MAX_POOL_UTILIZATION', '0.9'))
+"""Share of the connections of a pool checked out beyond which the process is overloaded."""
+
+MAX_REPLICATION_LAG = float(getenv('HEALTH_MAX_REPLICATION_LAG', '30'))
+"""Seconds of replication lag beyond which the process is not ready."""
+
+logger = logging.getLogger(__name__)
+
+# On a replica, the lag is the age of the last transaction replayed, which also grows while the primary
+# is idle. On a primary, it is the replay lag of its slowest replica, or NULL without replicas.
+_CHECK = text("""
+SELECT NOW(), CASE WHEN pg_is_in_recovery()
+    THEN extract(epoch FROM NOW() - pg_last_xact_replay_timestamp())
+    ELSE (SELECT extract(epoch FROM max(replay_lag)) FROM pg_stat_replication) END
+""")
+
 
 class HealthService:
     _session: Session
@@ -28,3 +64,115 @@ class HealthService:
         result = self._session.execute(stmt)
         row = result.all()[0]
         return str(f"{row[0]} @ {row[1]}")
+
+
+class HealthMonitor:
+    """Background thread checking the database every `interval` seconds, whose last check readiness is reported from."""
+
+    def __init__(self, engine: Engine, pools: Mapping[str, QueuePool], interval: float):
+        self._engine = engine
+        self._pools = pools
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked: float | None = None
+        self._database = False
+        self._database_checked: datetime | None = None
+        self._latency: float | None = None
+        self._lag: float | None = None
+        self._error: str | None = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopping = False
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop checking the database, and report not ready from now on."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self, max_age: float = 0.0) -> None:
+        """Check the database, unless it was checked less than `max_age` seconds ago."""
+        if self._checked is not None and time.monotonic() - self._checked < max_age:
+            return
+        started = time.perf_counter()
+        try:
+            with self._engine.connect() as connection:
+                checked, lag = connection.execute(_CHECK).one()
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    logger.warning('Database check failed', exc_info=True)
+                self._database, self._latency, self._lag = False, None, None
+                self._error = type(e).__name__
+        else:
+            with self._lock:
+                self._database, self._database_checked = True, checked
+                self._latency = round((time.perf_counter() - started) * 1000, 1)
+                self._lag = None if lag is None else float(lag)
+                self._error = None
+        self._checked = time.monotonic()
+
+    def readiness(self, caches: Mapping[str, Any]) -> Readiness:
+        """Readiness of the process from the last check of the database, the pools and the `caches`, see `api.metrics.CACHES`."""
+        with self._lock:
+            readiness = Readiness(ready=True, database=self._database, database_checked=self._database_checked,
+                                  database_latency_ms=self._latency, replication_lag=self._lag)
+            checked, error = self._checked, self._error
+        reasons = readiness.reasons
+        if self._stopping:
+            reasons.append('shutting down')
+        if checked is None:
+            reasons.append('database not checked yet')
+        elif error is not None:
+            reasons.append(f'database check failed: {error}')
+        elif self.running and time.monotonic() - checked > 3 * self.interval:
+            reasons.append('database check is stale')
+        if readiness.replication_lag is not None and readiness.replication_lag > MAX_REPLICATION_LAG:
+            reasons.append(f'replication lags {readiness.replication_lag:.0f}s behind')
+        for name, pool in self._pools.items():
+            readiness.pools[name] = health = _pool_health(pool)
+            if health.utilization is not None and health.utilization > MAX_POOL_UTILIZATION:
+                reasons.append(f'{name} pool has {health.checked_out} of {health.capacity} connections checked out')
+        for name, cache in caches.items():
+            lookups = cache.hits + cache.misses
+            readiness.caches[name] = CacheHealth(warm=getattr(cache, 'loaded', cache.hits > 0),
+                                                 hit_ratio=round(cache.hits / lookups, 3) if lookups else None)
+        readiness.ready = not reasons
+        return readiness
+
+    def _loop(self) -> None:
+        while not self._stopping:
+            self.refresh()
+            self._wake.wait(self.interval)
+
+
+def _pool_health(pool: QueuePool) -> PoolHealth:
+    checked_out = pool.checkedout()
+    # A negative overflow lets the pool open connections without bound beyond its size, so it is never full.
+    if pool._max_overflow < 0:
+        return PoolHealth(checked_out=checked_out, capacity=None, utilization=None)
+    capacity = pool.size() + pool._max_overflow
+    return PoolHealth(checked_out=checked_out, capacity=capacity, utilization=round(checked_out / capacity, 3) if capacity else 0.0)
+
+
+health_monitor = HealthMonitor(
+    create_engine(_engine_str(), pool_size=1, max_overflow=0, pool_timeout=5, pool_pre_ping=True,
+                  connect_args={'connect_timeout': 5, 'options': '-c statement_timeout=5000'}),
+    pools={'sync': engine.pool, 'async': async_engine.pool},
+    interval=float(getenv('HEALTH_INTERVAL', '5')),
+)
+"""Process-wide health monitor, started along with the application."""
@@ -0,0 +1,120 @@
+"""Live availability, pushing the slots booked and freed to the clients watching some desks or days.
+
+Every change to reservations and desks reaches the occupancy index of each worker, either applied
+by the service which committed it or received from another worker by the index' listener, see
+`services.occupancy`. The broadcaster turns each change into events and hands them to the
+subscriptions of this worker which watch the desk and day concerned. Subscriptions live on the
+event loop of the request streaming them, while changes arrive on other threads, so events are
+handed over with `call_soon_threadsafe`.
+
+A subscription falling more than `max_queued` events behind is ended with a `reset` event, upon
+which the client should fetch availability again and subscribe anew.
+"""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator
+from datetime import date
+from ..models import AvailabilityEvent, Desk
+from .occupancy import date_of, occupancy_index
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+
+class Subscription:
+    """Events of the desks `desk_ids`, or of every desk if None, on `day`, or on every day if None."""
+
+    def __init__(self, desk_ids: set[int] | None, day: date | None, max_queued: int):
+        self.desk_ids = desk_ids
+        self.day = day
+        self.max_queued = max_queued
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[AvailabilityEvent] = asyncio.Queue()
+
+    def watches(self, event: AvailabilityEvent) -> bool:
+        if self.desk_ids is not None and event.desk_id not in self.desk_ids:
+            return False
+        return self.day is None or event.date is None or event.date.date() == self.day
+
+    def put(self, events: list[AvailabilityEvent]) -> None:
+        """Queue `events` from any thread. Raises RuntimeError if the event loop of the subscription was closed."""
+        self._loop.call_soon_threadsafe(self._put, events)
+
+    def _put(self, events: list[AvailabilityEvent]) -> None:
+        if self.overflowed:
+            return
+        if self._queue.qsize() + len(events) > self.max_queued:
+            self.overflowed = True
+            self._queue.put_nowait(AvailabilityEvent(type='reset'))
+            return
+        for event in events:
+            self._queue.put_nowait(event)
+
+    async def events(self, keepalive: float) -> AsyncIterator[AvailabilityEvent | None]:
+        """Yield events as they come, or None when none came for `keepalive` seconds, until a `reset`."""
+        while True:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            yield event
+            if event.type == 'reset':
+                return
+
+
+class AvailabilityBroadcaster:
+
+    def __init__(self, max_queued: int = 1000):
+        self.max_queued = max_queued
+        self._subscriptions: set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, desk_ids: set[int] | None = None, day: date | None = None) -> Subscription:
+        """Subscribe to the events of some desks and day. Must be called on the event loop streaming them."""
+        subscription = Subscription(desk_ids, day, self.max_queued)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, change: dict) -> None:
+        """Hand the events of an occupancy index change to the subscriptions watching them."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if not subscriptions:
+            return
+        events = _events(change)
+        for subscription in subscriptions:
+            watched = [event for event in events if subscription.watches(event)]
+            if watched:
+                try:
+                    subscription.put(watched)
+                except RuntimeError:
+                    self.unsubscribe(subscription)
+
+
+def _events(change: dict) -> list[AvailabilityEvent]:
+    desk_id = change['desk']
+    if change['op'] in ('reserve', 'free'):
+        type = 'booked' if change['op'] == 'reserve' else 'freed'
+        return [AvailabilityEvent(type=type, desk_id=desk_id, date=date_of(hour)) for hour in change['hours']]
+    if change['op'] == 'desk':
+        freed_from = date_of(change['from']) if change['from'] is not None else None
+        return [AvailabilityEvent(type='desk', desk_id=desk_id, desk=Desk(**change['model']), freed_from=freed_from)]
+    return [AvailabilityEvent(type='desk_removed', desk_id=desk_id)]
+
+
+availability_broadcaster = AvailabilityBroadcaster()
+"""Broadcaster of the changes to the occupancy index of this process."""
+
+occupancy_index.subscribe(availability_broadcaster.publish)
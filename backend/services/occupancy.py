@@ -0,0 +1,267 @@
+"""In-process index of which hourly slots of each desk are reserved, answering availability without the database.
+
+Each desk's reserved slots are held as the bits of a Python integer, bit `i` being the hour `i` hours
+after the hour the index was loaded at. The index is loaded from the database with a single
+aggregate, and kept up to date by the services which reserve and free slots or change desks:
+
+1.  Before committing, a service `publish`es the change with `pg_notify`, so that it is only sent
+    to the other application server workers if the transaction commits.
+2.  After committing, the service `apply`s the change to the index of its own process.
+3.  The `listen` thread of every worker applies the changes published by the other workers, and
+    reloads the index every OCCUPANCY_RELOAD_INTERVAL seconds, and after reconnecting, in case
+    some change was missed.
+
+Reads fall back to the database whenever the index is not loaded, as in tests, scripts, or while the
+listener is reconnecting. Set OCCUPANCY_INDEX=false to always read from the database.
+"""
+
+import base64
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, func, select as select_stmt, text
+from sqlalchemy.orm import Session
+from ..env import getenv
+from ..models import Availability, Desk, DeskAvailability
+from ..entities import DeskEntity
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+CHANNEL = 'occupancy'
+"""Postgres notification channel the changes to the index are published on."""
+
+ENABLED = getenv('OCCUPANCY_INDEX', 'true').lower() in ('1', 'true')
+
+RELOAD_INTERVAL = float(getenv('OCCUPANCY_RELOAD_INTERVAL', '3600'))
+
+_EPOCH = datetime(1970, 1, 1)
+_HOUR = timedelta(hours=1)
+_REVERSED_BITS = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+"""Translation table reversing the order of the bits of each byte."""
+
+logger = logging.getLogger(__name__)
+
+
+def hour_of(date: datetime) -> int:
+    """Number of the hour of a naive UTC `date` since the epoch."""
+    return (date - _EPOCH) // _HOUR
+
+
+def date_of(hour: int) -> datetime:
+    """Naive UTC date of the `hour` since the epoch."""
+    return _EPOCH + hour * _HOUR
+
+
+class OccupancyIndex:
+    """Process-wide bitsets of the reserved slots of every desk, along with the desks themselves.
+
+    The bitsets are only ever read and written as whole integers, which the GIL makes atomic; writes
+    also take `_lock` so that concurrent read-modify-writes of the same desk are not lost.
+
+    Changes applied while the index is being loaded may be missing from the snapshot it is loaded
+    from, so they are kept and applied again to the loaded bitsets, which setting and clearing bits
+    allows."""
+
+    def __init__(self, window: timedelta):
+        self.window = window
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self._origin = f'{os.getpid()}-{id(self)}'
+        self._base = 0
+        self._bits: dict[int, int] = {}
+        self._desks: dict[int, Desk] = {}
+        self._sorted: list[Desk] | None = None
+        self._loading: list[dict] | None = None
+        self._lock = threading.Lock()
+        self._subscribers: list[Callable[[dict], None]] = []
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def load(self, session: Session, now: datetime | None = None) -> None:
+        """Replace the index with the desks and the reservations from the current hour on."""
+        now = now or datetime.now()
+        base = hour_of(now)
+        with self._lock:
+            self._loading = []
+        try:
+            bits, desks = self._snapshot(session, now, base)
+        except BaseException:
+            with self._lock:
+                self._loading = None
+            raise
+        with self._lock:
+            self._base, self._bits, self._desks, self._sorted = base, bits, desks, None
+            for change in self._loading:
+                self._apply(change)
+            self._loading = None
+            self.loaded = True
+
+    def _snapshot(self, session: Session, now: datetime, base: int) -> tuple[dict[int, int], dict[int, Desk]]:
+        latest = session.scalar(text('SELECT max(date) FROM desk_reservation')) or now
+        slots = max(hour_of(latest), hour_of(now + self.window)) - base + 1
+        rows = session.execute(text(f'''
+            SELECT desk_id, bit_or(B'1'::bit({slots}) >> (floor(extract(epoch FROM date) / 3600)::int - :base))::text
+            FROM desk_reservation
+            WHERE date >= :start AND desk_id IS NOT NULL
+            GROUP BY desk_id'''), {'base': base, 'start': date_of(base)})
+        bits = {desk_id: int(reserved[::-1], 2) for desk_id, reserved in rows}
+        desks = {entity.id: entity.to_model() for entity in session.scalars(select_stmt(DeskEntity))}
+        return bits, desks
+
+    def unload(self) -> None:
+        with self._lock:
+            self._bits, self._desks, self._sorted = {}, {}, None
+            self.loaded = False
+
+    def availability(self, start: datetime, end: datetime, desk_type: str | None = None) -> Availability | None:
+        """The reserved slots of the available desks between the hours `start` and `end`, in the format of
+        `DeskReservationService.get_availability`, or None if the index cannot answer."""
+        first = hour_of(start)
+        if not self.loaded or first < self._base:
+            self.misses += 1
+            return None
+        self.hits += 1
+        slots = hour_of(end) - first
+        offset, mask, size = first - self._base, (1 << slots) - 1, (slots + 7) // 8
+        bits = self._bits
+        desks = []
+        for desk in self.available_desks():
+            if desk_type and desk.desk_type != desk_type:
+                continue
+            reserved = (bits.get(desk.id, 0) >> offset) & mask
+            bitset = reserved.to_bytes(size, 'little').translate(_REVERSED_BITS)
+            desks.append(DeskAvailability.construct(desk_id=desk.id, tag=desk.tag, desk_type=desk.desk_type,
+                                                    reserved=base64.b64encode(bitset).decode()))
+        return Availability.construct(start=start, end=end, slots=slots, desks=desks)
+
+    def available_desks(self) -> list[Desk] | None:
+        """The available desks ordered by id, or None if the index is not loaded."""
+        if not self.loaded:
+            return None
+        desks = self._sorted
+        if desks is None:
+            desks = self._sorted = sorted((desk for desk in self._desks.values() if desk.available), key=lambda desk: desk.id)
+        return desks
+
+    # Changes
+
+    def reserved(self, desk_id: int, dates: list[datetime]) -> dict:
+        return {'op': 'reserve', 'desk': desk_id, 'hours': [hour_of(date) for date in dates]}
+
+    def freed(self, desk_id: int, dates: list[datetime]) -> dict:
+        return {'op': 'free', 'desk': desk_id, 'hours': [hour_of(date) for date in dates]}
+
+    def desk_changed(self, desk: Desk, freed_from: datetime | None = None) -> dict:
+        """The desk was created or updated, and all of its reservations from `freed_from` on were removed if given."""
+        return {'op': 'desk', 'desk': desk.id, 'model': desk.dict(), 'from': hour_of(freed_from) if freed_from else None}
+
+    def desk_removed(self, desk_id: int) -> dict:
+        return {'op': 'remove', 'desk': desk_id}
+
+    def publish(self, session: Session, change: dict) -> dict:
+        """Send `change` to the other workers once `session` commits. Call `apply` after it has."""
+        if ENABLED:
+            payload = json.dumps({**change, 'origin': self._origin}, separators=(',', ':'))
+            session.execute(select_stmt(func.pg_notify(CHANNEL, payload)))
+        return change
+
+    def subscribe(self, callback: Callable[[dict], None]) -> None:
+        """Call `callback` with every committed change, of this worker or received from the others."""
+        self._subscribers.append(callback)
+
+    def apply(self, change: dict) -> None:
+        """Apply a committed change to the index of this process."""
+        for callback in self._subscribers:
+            try:
+                callback(change)
+            except Exception:
+                logger.exception('Occupancy subscriber failed')
+        with self._lock:
+            if self._loading is not None:
+                self._loading.append(change)
+            if self.loaded:
+                self._apply(change)
+
+    def _apply(self, change: dict) -> None:
+        desk_id = change['desk']
+        bits = self._bits.get(desk_id, 0)
+        if change['op'] == 'reserve':
+            for hour in change['hours']:
+                if hour >= self._base:
+                    bits |= 1 << (hour - self._base)
+        elif change['op'] == 'free':
+            for hour in change['hours']:
+                if hour >= self._base:
+                    bits &= ~(1 << (hour - self._base))
+        elif change['op'] == 'desk':
+            self._desks[desk_id] = Desk(**change['model'])
+            self._sorted = None
+            if change['from'] is not None:
+                bits &= (1 << max(change['from'] - self._base, 0)) - 1
+        elif change['op'] == 'remove':
+            self._desks.pop(desk_id, None)
+            self._sorted = None
+            bits = 0
+        self._bits[desk_id] = bits
+
+    # Listener
+
+    def start(self, engine: Engine) -> None:
+        """Load the index and keep it up to date with the changes of the other workers in a background thread."""
+        if not ENABLED or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, args=(engine,), name='occupancy-listener', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.unload()
+
+    def _listen(self, engine: Engine) -> None:
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                # A connection of its own, taken out of the pool, which does nothing but wait for notifications.
+                pooled = engine.raw_connection()
+                connection = pooled.driver_connection
+                pooled.detach()
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {CHANNEL}')
+                while not self._stopping.is_set():
+                    with Session(engine) as session:
+                        self.load(session)
+                    reload_at = time.monotonic() + RELOAD_INTERVAL
+                    while not self._stopping.is_set() and time.monotonic() < reload_at:
+                        self._receive(connection, timeout=1.0)
+            except Exception:
+                logger.exception('Occupancy index listener failed, reconnecting')
+                self.unload()
+                self._stopping.wait(5.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _receive(self, connection, timeout: float) -> None:
+        if select.select([connection], [], [], timeout) == ([], [], []):
+            return
+        connection.poll()
+        while connection.notifies:
+            change = json.loads(connection.notifies.pop(0).payload)
+            if change.pop('origin', None) != self._origin:
+                self.apply(change)
+
+
+occupancy_index = OccupancyIndex(timedelta(days=30))
+"""Occupancy index shared by all services of this process, covering the booking window."""
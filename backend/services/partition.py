@@ -0,0 +1,204 @@
+"""Monthly range partitions of the desk_reservation table.
+
+Reservations are partitioned by the month of their `date`, so that listings bounded on `date`
+only touch the partitions of the months they span, and so that reservations past the retention
+period are archived by detaching and dropping whole partitions rather than deleting row by row.
+
+Partitions are named `desk_reservation_pYYYYMM`. Reservations of months without a partition are
+kept in `desk_reservation_default`; creating the partition of a month moves its reservations out
+of the default partition. `maintain_partitions` keeps PARTITION_MONTHS_AHEAD months of partitions
+ahead of the current one. The `PartitionWorker` runs it when the application starts and every
+PARTITION_INTERVAL seconds after that, whether or not old reservations are archived in the
+background. The retention worker also runs it before each of its runs, and `script.reset_database`
+runs it after loading the demo data.
+
+Every worker process of the application server maintains the partitions. Each transaction creating,
+archiving or dropping a partition takes an advisory lock first, and checks that the partition is
+still missing, or still there, once it holds it, so that concurrent runs leave it to the first one.
+"""
+
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, text
+from sqlalchemy.orm import Session
+from ..env import getenv
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+TABLE = 'desk_reservation'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+MONTHS_AHEAD = int(getenv('PARTITION_MONTHS_AHEAD', '2'))
+"""Partitions are created this many months past the current one, beyond the booking window."""
+
+logger = logging.getLogger(__name__)
+
+_LOCK = int.from_bytes(b'dr-parts', 'big')
+"""Key of the advisory lock serializing the changes to the partitions."""
+
+_BOUNDS = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def month_of(date: datetime) -> datetime:
+    return date.replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def next_month(date: datetime) -> datetime:
+    return month_of(month_of(date) + timedelta(days=32))
+
+
+def partition_name(month: datetime) -> str:
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def list_partitions(session: Session) -> dict[str, tuple[datetime, datetime]]:
+    """The monthly partitions of desk_reservation, by name, with their [lower, upper) bounds."""
+    rows = session.execute(text('''
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST(:table AS regclass)'''), {'table': TABLE})
+    partitions = {}
+    for name, bound in rows:
+        match = _BOUNDS.search(bound)
+        if match is not None:
+            partitions[name] = (datetime.fromisoformat(match[1]), datetime.fromisoformat(match[2]))
+    return partitions
+
+
+def create_partition(session: Session, month: datetime) -> str | None:
+    """Create the partition of `month`, moving its reservations out of the default partition, and commit.
+
+    Returns the name of the partition, or None if another process created it first.
+
+    The partition is filled while still detached, and attached once a check constraint proves its
+    rows are within bounds so that attaching does not scan it. Attaching only takes a lock on
+    desk_reservation that lets reads and writes go on, though it locks the default partition.
+    """
+    name, lower, upper = partition_name(month), month_of(month), next_month(month)
+    bounds = {'lower': lower, 'upper': upper}
+    if not _lock(session, name, exists=False):
+        return None
+    session.execute(text(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)'))
+    session.execute(text(f'''
+        WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :lower AND date < :upper RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved'''), bounds)
+    session.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (date >= '{lower}' AND date < '{upper}')"))
+    session.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    session.execute(text(f'ALTER TABLE {name} DROP CONSTRAINT {name}_bounds'))
+    session.commit()
+    return name
+
+
+def _lock(session: Session, name: str, exists: bool) -> bool:
+    """Take the advisory lock for the rest of the transaction, and tell whether the table `name` exists as
+    expected once it is held, rolling back otherwise."""
+    session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _LOCK})
+    if (session.scalar(text('SELECT to_regclass(:name)'), {'name': name}) is not None) == exists:
+        return True
+    session.rollback()
+    return False
+
+
+def ensure_partitions(session: Session, start: datetime, end: datetime) -> list[str]:
+    """Create the missing partitions of the months from `start` through `end`, returning their names."""
+    existing = list_partitions(session)
+    created = []
+    month = month_of(start)
+    while month <= end:
+        if partition_name(month) not in existing and (name := create_partition(session, month)) is not None:
+            created.append(name)
+        month = next_month(month)
+    return created
+
+
+def drop_partitions_before(session: Session, before: datetime) -> dict[str, int]:
+    """Archive and drop the partitions whose reservations are all older than `before`.
+
+    Each partition is copied to the history table in a transaction of its own, and then detached and
+    dropped in a short one, so that desk_reservation is only locked exclusively for the latter. No
+    reservation can be added to a partition past the booking window in the meantime.
+
+    Returns:
+        dict[str, int]: The number of reservations archived from each dropped partition, by name.
+    """
+    dropped = {}
+    for name, (_, upper) in sorted(list_partitions(session).items()):
+        if upper > before or not _lock(session, name, exists=True):
+            continue
+        archived = session.execute(text(f'''
+            INSERT INTO desk_reservation_history (id, date, desk_id, user_id)
+            SELECT id, date, desk_id, user_id FROM {name}
+            ON CONFLICT DO NOTHING''')).rowcount
+        session.commit()
+        if not _lock(session, name, exists=True):
+            continue
+        session.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {name}'))
+        session.execute(text(f'DROP TABLE {name}'))
+        session.commit()
+        dropped[name] = archived
+    return dropped
+
+
+def maintain_partitions(session: Session, before: datetime, now: datetime | None = None) -> list[str]:
+    """Create the partitions from the current month through MONTHS_AHEAD months ahead, and those of the
+    reservations in the default partition dated after `before`, returning the names of those created."""
+    now = now or datetime.now()
+    start = month_of(now)
+    oldest = session.scalar(text(f'SELECT min(date) FROM {DEFAULT_PARTITION}'))
+    if oldest is not None and oldest < start:
+        # Months that are entirely past the retention period are left to the batched archiving.
+        start = max(month_of(oldest), month_of(before))
+    end = month_of(now)
+    for _ in range(MONTHS_AHEAD):
+        end = next_month(end)
+    return ensure_partitions(session, start, end)
+
+
+class PartitionWorker:
+    """Background thread maintaining the partitions once started, and then every `interval` seconds unless it is 0.
+
+    Months entirely older than `retention` are not given partitions, see `maintain_partitions`."""
+
+    def __init__(self, engine: Engine, interval: float, retention: timedelta):
+        self._engine = engine
+        self.interval = interval
+        self.retention = retention
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._loop, name='reservation-partitions', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> list[str]:
+        """Create the missing partitions, returning the names of those created."""
+        with Session(self._engine) as session:
+            return maintain_partitions(session, datetime.now() - self.retention)
+
+    def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                created = self.run_once()
+                if created:
+                    logger.info('Created partitions %s', ', '.join(created))
+            except Exception:
+                logger.exception('Maintaining the partitions of %s failed', TABLE)
+            if self.interval <= 0:
+                return
+            self._wake.wait(self.interval)
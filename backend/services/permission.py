@@ -1,11 +1,15 @@
 import re
+import time
 from fastapi import Depends
 from functools import lru_cache
-from sqlalchemy import select
+from sqlalchemy import select, or_
 from sqlalchemy.orm import Session
 from ..database import db_session
+from ..metrics import timed
 from ..models import User, Permission, Role, RoleDetails
-from ..entities import UserEntity, PermissionEntity, RoleEntity
+from ..entities import UserEntity, PermissionEntity, RoleEntity, user_role_table
+from .cache import TTLCache
+from . import request_context
 
 
 class UserPermissionError(Exception):
@@ -14,6 +18,55 @@ class UserPermissionError(Exception):
             f'Not authorized to perform `{action}` on `{resource}`')
 
 
+class PermissionIndex:
+    """Process-wide index of each user's permissions compiled into a single regular expression.
+
+    Entries are tagged with the version of the index they were compiled at. Any change to
+    permissions or role membership calls `invalidate`, which bumps the version and makes every
+    entry stale. Since other processes cannot bump this process' version, entries also expire
+    after `max_age` seconds to bound staleness across application server workers."""
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[int, tuple[int, float, re.Pattern | None]] = {}
+        self._dependents: list[TTLCache] = []
+
+    def get(self, user_id: int) -> tuple[bool, re.Pattern | None]:
+        """Returns whether a fresh entry was found and, if so, the user's compiled permissions."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            version, compiled_at, pattern = entry
+            if version == self.version and time.monotonic() - compiled_at < self.max_age:
+                self.hits += 1
+                return True, pattern
+        self.misses += 1
+        return False, None
+
+    def put(self, user_id: int, version: int, pattern: re.Pattern | None) -> None:
+        """Store compiled permissions loaded while the index was at `version`."""
+        if version == self.version:
+            self._entries[user_id] = (version, time.monotonic(), pattern)
+
+    def invalidate(self) -> None:
+        """Mark all entries stale. Call after committing any change to permissions or roles."""
+        self.version += 1
+        self._entries = {}
+        for cache in self._dependents:
+            cache.clear()
+
+    def register_dependent(self, cache: TTLCache) -> None:
+        """Clear `cache` along with the index, for caches holding data derived from permissions."""
+        self._dependents.append(cache)
+
+
+permission_index = PermissionIndex()
+"""Permission index shared by all `PermissionService` instances of this process."""
+
+
+@timed
 class PermissionService:
 
     _session: Session
@@ -47,6 +100,7 @@ class PermissionService:
 
         self._session.add(permission_entity)
         self._session.commit()
+        permission_index.invalidate()
         return True
 
     def revoke(self, revoker: User, permission: Permission) -> bool:
@@ -62,6 +116,7 @@ class PermissionService:
 
         self._session.delete(permission_entity)
         self._session.commit()
+        permission_index.invalidate()
         return True
 
     def enforce(self, subject: User, action: str, resource: str) -> None:
@@ -69,14 +124,34 @@ class PermissionService:
             raise UserPermissionError(action, resource)
 
     def check(self, subject: User, action: str, resource: str) -> bool:
-        # Check user permissions
-        user_perms = self._get_user_permissions(subject)
-        if self._has_permission(user_perms, action, resource):
-            return True
-
-        # Check role permissions
-        role_permissions = self._get_user_roles_permissions(subject)
-        return self._has_permission(role_permissions, action, resource)
+        pattern = self._compiled_permissions(subject)
+        return pattern is not None and pattern.fullmatch(f'{action}\0{resource}') is not None
+
+    def _compiled_permissions(self, subject: User) -> re.Pattern | None:
+        """Returns all of the subject's permissions, direct and through roles, as one pattern
+        matching `action` and `resource` joined by a NUL character, or None without permissions."""
+        if subject.id is None:
+            return None
+        return request_context.lookup('permissions', subject.id, permission_index.version, lambda: self._load_compiled_permissions(subject))
+
+    def _load_compiled_permissions(self, subject: User) -> re.Pattern | None:
+        found, pattern = permission_index.get(subject.id)
+        if found:
+            return pattern
+
+        version = permission_index.version
+        role_ids = select(user_role_table.c.role_id).where(
+            user_role_table.c.user_id == subject.id)
+        query = select(PermissionEntity.action, PermissionEntity.resource).where(or_(
+            PermissionEntity.user_id == subject.id,
+            PermissionEntity.role_id.in_(role_ids)))
+        alternatives = [
+            f'(?:{_pattern_regex(action)})\0(?:{_pattern_regex(resource)})'
+            for action, resource in self._session.execute(query)
+        ]
+        pattern = re.compile('|'.join(alternatives)) if alternatives else None
+        permission_index.put(subject.id, version, pattern)
+        return pattern
 
     def _get_user_permissions(self, subject: User) -> list[PermissionEntity]:
         user_query = select(PermissionEntity).where(
@@ -95,21 +170,19 @@ class PermissionService:
             PermissionEntity.role_id.in_(role_ids))
         return [p for p in self._session.execute(role_query).scalars()]
 
-    def _has_permission(self, permissions: list[PermissionEntity], action: str, resource: str) -> bool:
-        for permission in permissions:
-            if self._check_permission(permission, action, resource):
-                return True
-        return False
-
     def _check_permission(self, permission: PermissionEntity, action: str, resource: str) -> bool:
-        action_re = self._expand_pattern(permission.action)
+        action_re = _expand_pattern(permission.action)
         if action_re.fullmatch(action) is not None:
-            resource_re = self._expand_pattern(permission.resource)
+            resource_re = _expand_pattern(permission.resource)
             return resource_re.fullmatch(resource) is not None
         else:
             return False
 
-    @lru_cache()
-    def _expand_pattern(self, pattern: str) -> re.Pattern:
-        search = pattern.replace('*', '.*')
-        return re.compile(f'^{search}$')
+
+def _pattern_regex(pattern: str) -> str:
+    return pattern.replace('*', '.*')
+
+
+@lru_cache(maxsize=1024)
+def _expand_pattern(pattern: str) -> re.Pattern:
+    return re.compile(f'^{_pattern_regex(pattern)}$')
@@ -0,0 +1,186 @@
+"""Request-scoped memo of the lookups the services of a request repeat, and accounting of the SQL statements it runs.
+
+Handling one request often looks up the same things several times: the permissions of the subject
+are checked by each `PermissionService.enforce` of every service the route calls, and the user and
+desks involved are read by more than one service. While a request is handled by the app, see
+`api.middleware.RequestContextMiddleware`, such lookups are memoized in its `RequestContext`. Each
+memoized value is tagged with the version of the process-wide structure it is derived from, so that
+a change made earlier in the same request, which bumps that version, is seen by the lookups after it.
+
+Every SQL statement but transaction control executed by any engine while a context is current is
+counted on it, along with the time spent executing it, so that tests can bound the statements a
+request runs:
+
+    with request_scope() as context:
+        role_service.grant(subject, role.id, permission)
+    assert context.statements <= 9
+
+Outside of a request, as in scripts and background workers, lookups are not memoized.
+
+Statements taking longer than `SLOW_QUERY_MS`, and requests running more than `SQL_STATEMENTS_WARNING`
+statements, are logged as JSON by the `backend.sql` logger, a `SLOW_QUERY_SAMPLE_RATE` fraction of
+them. Statements are logged by their fingerprint, their text with every literal and parameter
+replaced by `?`, and their parameters by type only, so that no personal data reaches the log. Those
+of a request are logged by `report` once it is handled, along with its route; the log of a request
+running too many statements lists those it repeated the most, such as the query of each role of an
+N+1 lookup of permissions:
+
+    {"event": "many_statements", "route": "GET /api/roles", "statements": 61, "db_ms": 48.2,
+     "repeated": [["SELECT permission.id, ... WHERE ? = permission.role_id", 58]]}
+"""
+
+import functools
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from collections.abc import Callable, Hashable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, TypeVar
+from sqlalchemy import Engine, event
+from ..env import getenv
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+T = TypeVar('T')
+
+_SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+SLOW_QUERY_SECONDS = float(getenv('SLOW_QUERY_MS', '100')) / 1000
+"""Statements taking longer are logged."""
+
+STATEMENTS_WARNING = int(getenv('SQL_STATEMENTS_WARNING', '50'))
+"""Requests running more statements are logged."""
+
+SAMPLE_RATE = float(getenv('SLOW_QUERY_SAMPLE_RATE', '1'))
+"""Fraction of the slow statements and requests which are logged."""
+
+sql_logger = logging.getLogger('backend.sql')
+
+
+class RequestContext:
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        """Time spent executing statements, summed over those run concurrently."""
+        self.fingerprints: Counter[str] = Counter()
+        self.slow_queries: list[dict[str, Any]] = []
+        self._lookups: dict[tuple[str, Hashable], tuple[Hashable, Any]] = {}
+
+    def lookup(self, kind: str, key: Hashable, version: Hashable, load: Callable[[], T]) -> T:
+        """The value of the `kind` of thing identified by `key`, loaded by `load` the first time it is
+        looked up at `version` of the structure it is derived from."""
+        memo = self._lookups.get((kind, key))
+        if memo is not None and memo[0] == version:
+            return memo[1]
+        value = load()
+        self._lookups[(kind, key)] = (version, value)
+        return value
+
+    def forget(self, kind: str, key: Hashable) -> None:
+        """Drop the memoized value of `key`, after changing it."""
+        self._lookups.pop((kind, key), None)
+
+
+_current: ContextVar[RequestContext | None] = ContextVar('request_context', default=None)
+
+
+def current() -> RequestContext | None:
+    """Context of the request being handled, or None outside of a request."""
+    return _current.get()
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestContext]:
+    """Make a new context current for the duration of the block."""
+    context = RequestContext()
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+def lookup(kind: str, key: Hashable, version: Hashable, load: Callable[[], T]) -> T:
+    """`RequestContext.lookup` of the current context, or just `load()` outside of a request."""
+    context = _current.get()
+    return load() if context is None else context.lookup(kind, key, version, load)
+
+
+def forget(kind: str, key: Hashable) -> None:
+    context = _current.get()
+    if context is not None:
+        context.forget(kind, key)
+
+
+def report(context: RequestContext, route: str) -> None:
+    """Log the slow statements of a handled request, and its statements if it ran more than `STATEMENTS_WARNING` of them."""
+    for slow_query in context.slow_queries:
+        _log('slow_query', route=route, **slow_query)
+    if context.statements > STATEMENTS_WARNING and random.random() < SAMPLE_RATE:
+        _log('many_statements', route=route, statements=context.statements, db_ms=round(context.db_seconds * 1000, 1),
+             repeated=context.fingerprints.most_common(3))
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """The statement with its literals, parameters and lists of them replaced by `?`, and whitespace collapsed."""
+    statement = _LITERALS.sub('?', statement)
+    statement = _LISTS.sub('(?)', statement)
+    return ' '.join(statement.split())
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\$\d+|(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def redact(parameters: Any) -> Any:
+    """The types of the parameters of a statement, without their values."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return [redact(parameters[0]), f'... {len(parameters)} rows']
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _log(event_name: str, **fields: Any) -> None:
+    sql_logger.warning(json.dumps({'event': event_name, **fields}, default=str))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(connection, cursor, statement, parameters, context, executemany) -> None:
+    # The async engine runs its statements in a greenlet which SQLAlchemy spawns with the context of
+    # the calling task, so that statements run through `AsyncSession.run_sync` are counted as well.
+    # Savepoints are not counted, just as BEGIN and COMMIT, which do not go through the cursor.
+    request = _current.get()
+    if request is not None and not statement.startswith(_SAVEPOINT_STATEMENTS):
+        request.statements += 1
+        request.fingerprints[fingerprint(statement)] += 1
+    # The start is kept on the execution context of the statement, which is left behind if it fails.
+    if context is not None:
+        context._statement_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _time_statement(connection, cursor, statement, parameters, context, executemany) -> None:
+    started = getattr(context, '_statement_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    request = _current.get()
+    if request is not None:
+        request.db_seconds += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS and random.random() < SAMPLE_RATE:
+        slow_query = {'duration_ms': round(elapsed * 1000, 1), 'fingerprint': fingerprint(statement), 'parameters': redact(parameters)}
+        if request is None:
+            _log('slow_query', **slow_query)
+        else:
+            request.slow_queries.append(slow_query)
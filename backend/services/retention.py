@@ -0,0 +1,196 @@
+"""Retention of desk reservations, archiving those past the retention period in bounded batches.
+
+Each batch moves the oldest reservations to `desk_reservation_history` with a single statement and
+commits it right away, so that rows are only locked for the duration of one small batch. Rows locked
+by live bookings are skipped and picked up by a later batch, and concurrent runs in several worker
+processes never archive the same reservation twice.
+
+Reservations older than RETENTION_DAYS are archived by detaching and dropping whole monthly
+partitions where possible, see `services.partition`, and the rest is archived in batches.
+
+The `retention_worker` runs the job, along with the creation of upcoming partitions, in a background
+thread of the application process every RETENTION_INTERVAL seconds (0 disables it), archiving
+RETENTION_BATCH_SIZE reservations at a time and pausing RETENTION_BATCH_PAUSE seconds between
+batches to leave room for booking traffic.
+"""
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from ..database import engine
+from ..env import getenv
+from ..models import RetentionStatus
+from ..entities import DeskReservationEntity, DeskReservationHistoryEntity
+from .partition import PartitionWorker, drop_partitions_before, maintain_partitions
+
+__authors__ = ['Kailash Muthu']
+__copyright__ = 'Copyright 2023'
+__license__ = 'MIT'
+
+RETENTION = timedelta(days=int(getenv('RETENTION_DAYS', '30')))
+"""Reservations older than this are archived."""
+
+BATCH_SIZE = int(getenv('RETENTION_BATCH_SIZE', '1000'))
+"""Most reservations archived by a single statement."""
+
+logger = logging.getLogger(__name__)
+
+
+def archive_batch(session: Session, before: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """Move the oldest `batch_size` reservations dated before `before` to the history table and commit.
+
+    Returns:
+        int: The number of reservations archived, fewer than `batch_size` once none are left.
+    """
+    oldest = select(DeskReservationEntity.id)\
+        .where(DeskReservationEntity.date < before)\
+        .order_by(DeskReservationEntity.date)\
+        .limit(batch_size)\
+        .with_for_update(skip_locked=True)
+    moved = delete(DeskReservationEntity)\
+        .where(DeskReservationEntity.id.in_(oldest))\
+        .returning(DeskReservationEntity.id, DeskReservationEntity.date, DeskReservationEntity.desk_id, DeskReservationEntity.user_id)\
+        .cte('moved')
+    stmt = insert(DeskReservationHistoryEntity)\
+        .from_select(['id', 'date', 'desk_id', 'user_id'], select(moved))\
+        .on_conflict_do_nothing()
+    archived = session.execute(stmt).rowcount
+    session.commit()
+    return archived
+
+
+def archive_old_reservations(session: Session, batch_size: int = BATCH_SIZE, pause: float = 0.0,
+                             progress: Callable[[int], None] | None = None) -> int:
+    """Archive all reservations past the retention period, dropping the monthly partitions entirely past it
+    and then deleting the remaining ones one batch at a time.
+
+    Args:
+        session: The session to run the batches in, committed after each batch.
+        batch_size: The most reservations archived per batch.
+        pause: Seconds to wait between batches.
+        progress: Called with the number of reservations archived by each batch or dropped partition.
+
+    Returns:
+        int: The number of reservations archived.
+    """
+    before = datetime.now() - RETENTION
+    total = 0
+    for name, archived in drop_partitions_before(session, before).items():
+        logger.info('Archived %d reservations by dropping partition %s', archived, name)
+        total += archived
+        if progress is not None:
+            progress(archived)
+    while True:
+        archived = archive_batch(session, before, batch_size)
+        total += archived
+        if progress is not None:
+            progress(archived)
+        if archived < batch_size:
+            return total
+        time.sleep(pause)
+
+
+class RetentionWorker:
+    """Background thread archiving old reservations every `interval` seconds, and whenever triggered."""
+
+    def __init__(self, engine: Engine, interval: float, batch_size: int = BATCH_SIZE, pause: float = 0.0):
+        self._engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._status = RetentionStatus(enabled=interval > 0, retention_days=RETENTION.days, interval=interval, batch_size=batch_size)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._loop, name='reservation-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background thread is started, as it is unless RETENTION_INTERVAL is 0."""
+        return self._thread is not None
+
+    def trigger(self) -> None:
+        """Start a run now rather than at the next interval."""
+        self._wake.set()
+
+    def status(self) -> RetentionStatus:
+        with self._lock:
+            return self._status.copy()
+
+    def run_once(self, session: Session | None = None) -> int:
+        """Archive all reservations past the retention period, in `session` or one of its own, recording progress in `status`."""
+        started = time.perf_counter()
+        with self._lock:
+            self._status.running = True
+            self._status.last_started = datetime.now()
+            self._status.last_archived = 0
+
+        def progress(archived: int) -> None:
+            with self._lock:
+                self._status.batches += 1
+                self._status.archived += archived
+                self._status.last_archived += archived
+
+        error = None
+        try:
+            if session is None:
+                with Session(self._engine) as session:
+                    return self._archive(session, progress)
+            return self._archive(session, progress)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._status.running = False
+                self._status.runs += 1
+                self._status.last_finished = datetime.now()
+                self._status.last_rows_per_second = round(self._status.last_archived / elapsed, 1) if elapsed > 0 else 0.0
+                self._status.last_error = error
+
+    def _archive(self, session: Session, progress: Callable[[int], None]) -> int:
+        created = maintain_partitions(session, datetime.now() - RETENTION)
+        with self._lock:
+            self._status.partitions_created += len(created)
+        return archive_old_reservations(session, self.batch_size, self.pause, progress)
+
+    def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                archived = self.run_once()
+                logger.info('Archived %d reservations older than %d days', archived, RETENTION.days)
+            except Exception:
+                logger.exception('Archiving old reservations failed')
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+retention_worker = RetentionWorker(
+    engine,
+    interval=float(getenv('RETENTION_INTERVAL', '3600')),
+    pause=float(getenv('RETENTION_BATCH_PAUSE', '0.1')),
+)
+"""Process-wide retention worker, started along with the application."""
+
+partition_worker = PartitionWorker(engine, interval=float(getenv('PARTITION_INTERVAL', '3600')), retention=RETENTION)
+"""Process-wide partition worker, started along with the application whatever RETENTION_INTERVAL is."""
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from ..database import db_session
 from ..models import User, Role, RoleDetails, Permission
 from ..entities import RoleEntity, PermissionEntity, UserEntity
-from .permission import PermissionService
+from .permission import PermissionService, permission_index
 
 
 class RoleService:
@@ -37,6 +37,7 @@ class RoleService:
         assert role is permission.role
         self._session.delete(permission)
         self._session.commit()
+        permission_index.invalidate()
         return True
 
     def add(self, subject: User, id: int, member: User):
@@ -46,6 +47,7 @@ class RoleService:
         if user:
             role.users.append(user)
             self._session.commit()
+            permission_index.invalidate()
         return self.details(subject, id)
 
     def remove(self, subject: User, id: int, userId: int):
@@ -54,4 +56,5 @@ class RoleService:
         user = self._session.get(UserEntity, userId)
         role.users.remove(user)
         self._session.commit()
+        permission_index.invalidate()
         return True
\ No newline at end of file
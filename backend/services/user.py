@@ -3,19 +3,50 @@
 The User Service provides access to the User model and its associated database operations.
 """
 
+import base64
+import json
+import re
 from fastapi import Depends
-from sqlalchemy import select, or_, func
-from sqlalchemy.orm import Session
+from sqlalchemy import ColumnElement, case, literal_column, select, or_, func, tuple_
+from sqlalchemy.orm import Session, aliased
 from ..database import db_session
-from ..models import User, Paginated, PaginationParams
+from ..models import User, Paginated, PaginationParams, CursorPaginated, CursorPaginationParams
 from ..entities import UserEntity
-from .permission import PermissionService
+from .permission import PermissionService, permission_index
+from .cache import TTLCache
+from . import request_context
 
 __authors__ = ['Kailash Muthu']
 __copyright__ = 'Copyright 2023'
 __license__ = 'MIT'
 
 
+registered_users: TTLCache[int, User] = TTLCache(maxsize=10_000, ttl=60.0)
+"""Users resolved by `UserService.get`, with their permissions, keyed by PID.
+
+Authenticating a request resolves the user on every call, so this cache makes a typical
+authenticated request cost no queries. Entries are invalidated by `UserService.create` and
+`UserService.update` and cleared by the permission index whenever permissions or roles change."""
+permission_index.register_dependent(registered_users)
+
+PID_DIGITS = 9
+"""Length of a PID, making a query of fewer digits the prefix of a range of PIDs."""
+
+SORTABLE = ('first_name', 'last_name', 'onyen', 'email', 'pid', 'id')
+"""Columns users can be listed by, each backed by an index ending with `id`, or unique."""
+
+MAX_PAGE_SIZE = 500
+"""Largest page of users returned by cursor pagination."""
+
+EXACT_LENGTH_BELOW = 10_000
+"""Number of users below which listing every user counts them rather than estimating their number."""
+
+_ESTIMATED_USERS = literal_column('''(
+    SELECT CASE WHEN relpages > 0 THEN (reltuples / relpages * (pg_relation_size(oid) / current_setting('block_size')::int))::bigint ELSE 0 END
+    FROM pg_class WHERE oid = '"user"'::regclass)''')
+"""Number of users estimated from the statistics of the table scaled to its current size, as the query planner does."""
+
+
 class UserService:
 
     _session: Session
@@ -29,12 +60,24 @@ class UserService:
     def get(self, pid: int) -> User | None:
         """Get a User by PID.
 
+        Resolved users are served from the `registered_users` cache until invalidated, and looked up
+        once per request. Each call returns a deep copy, permissions included, which callers may change.
+
         Args:
             pid: The PID of the user.
 
         Returns:
             User | None: The user or None if not found.
         """
+        model = request_context.lookup('user', pid, permission_index.version, lambda: self._resolve(pid))
+        return model.copy(deep=True) if model is not None else None
+
+    def _resolve(self, pid: int) -> User | None:
+        model = registered_users.get(pid)
+        if model is not None:
+            return model
+
+        version = permission_index.version
         query = select(UserEntity).where(UserEntity.pid == pid)
         user_entity: UserEntity = self._session.scalar(query)
         if user_entity is None:
@@ -42,11 +85,17 @@ class UserService:
         else:
             model = user_entity.to_model()
             model.permissions = self._permission.get_permissions(model)
+            if version == permission_index.version:
+                registered_users.set(pid, model)
             return model
 
     def search(self, _subject: User, query: str) -> list[User]:
         """Search for users by their name, onyen, email.
 
+        Users match when every word of the query begins a word of their names, onyen or email, when
+        their onyen begins with the query, or when their PID begins with a query of digits. Exact
+        matches of the onyen or PID come first, then the users whose words match best.
+
         Args:
             subject: The user performing the action.
             query: The search query.
@@ -55,57 +104,76 @@ class UserService:
             list[User]: The list of users matching the query.
         """
         statement = select(UserEntity)
-        criteria = or_(
-            UserEntity.first_name.ilike(f'%{query}%'),
-            UserEntity.last_name.ilike(f'%{query}%'),
-            UserEntity.onyen.ilike(f'%{query}%'),
-            UserEntity.email.ilike(f'%{query}%'),
-        )
-        statement = statement.where(criteria).limit(10)
+        search = _search(query)
+        if search is not None:
+            criteria, ranking = search
+            statement = statement.where(criteria).order_by(*ranking)
+        statement = statement.limit(10)
         entities = self._session.execute(statement).scalars()
         return [entity.to_model() for entity in entities]
 
     def list(self, subject: User, pagination_params: PaginationParams) -> Paginated[User]:
         """List Users.
 
-        The subject must have the 'user.list' permission on the 'user/' resource.
+        The subject must have the 'user.list' permission on the 'user/' resource. The page and the
+        number of users listed are selected together, see `_listing`.
 
         Args:
             subject: The user performing the action.
-            pagination_params: The pagination parameters.
+            pagination_params: The pagination parameters, ordered by one of `SORTABLE`, descending if prefixed with `-`.
 
         Returns:
             Paginated[User]: The paginated list of users.
 
         Raises:
-            PermissionError: If the subject does not have the required permission."""
+            PermissionError: If the subject does not have the required permission.
+            ValueError: If the users cannot be ordered by `order_by`."""
         self._permission.enforce(subject, 'user.list', 'user/')
-
-        statement = select(UserEntity)
-        length_statement = select(func.count()).select_from(UserEntity)
-        if pagination_params.filter != '':
-            query = pagination_params.filter
-            criteria = or_(
-                UserEntity.first_name.ilike(f'%{query}%'),
-                UserEntity.last_name.ilike(f'%{query}%'),
-                UserEntity.onyen.ilike(f'%{query}%'),
-            )
-            statement = statement.where(criteria)
-            length_statement = length_statement.where(criteria)
+        order_by, descending = _sort_key(pagination_params.order_by)
+        users, length = _listing(pagination_params.filter)
 
         offset = pagination_params.page * pagination_params.page_size
         limit = pagination_params.page_size
+        statement = select(users, length).order_by(*_ordering(users, order_by, descending)).offset(offset).limit(limit)
+        rows = self._session.execute(statement).all()
 
-        if pagination_params.order_by != '':
-            statement = statement.order_by(
-                getattr(UserEntity, pagination_params.order_by))
+        # A page past the end holds no row to read the length from.
+        length = rows[0][1] if rows else self._session.scalar(select(length))
+        return Paginated(items=[entity.to_model() for entity, _length in rows], length=length, params=pagination_params)
 
-        statement = statement.offset(offset).limit(limit)
+    def page(self, subject: User, params: CursorPaginationParams) -> CursorPaginated[User]:
+        """Page through users, resuming after the last user of the previous page.
 
-        length = self._session.execute(length_statement).scalar()
-        entities = self._session.execute(statement).scalars()
+        Unlike `list`, deep pages are as cheap as the first one, each page being read from the index
+        of the column ordered by from where the previous page stopped.
+
+        Args:
+            subject: The user performing the action.
+            params: The cursor of the page to retrieve, its size, the column of `SORTABLE` to order by,
+                descending if prefixed with `-`, and the search filtering users.
 
-        return Paginated(items=[entity.to_model() for entity in entities], length=length, params=pagination_params)
+        Returns:
+            CursorPaginated[User]: A page of users, along with the number of users listed.
+
+        Raises:
+            PermissionError: If the subject does not have the required permission.
+            ValueError: If the users cannot be ordered by `order_by`, or the cursor is malformed."""
+        self._permission.enforce(subject, 'user.list', 'user/')
+        params = params.copy(update={'page_size': max(1, min(params.page_size, MAX_PAGE_SIZE))})
+        order_by, descending = _sort_key(params.order_by)
+        users, length = _listing(params.filter)
+
+        statement = select(users, length).order_by(*_ordering(users, order_by, descending)).limit(params.page_size + 1)
+        if params.cursor != '':
+            key = tuple_(getattr(users, order_by), users.id)
+            after = tuple_(*_decode_cursor(params.cursor, order_by))
+            statement = statement.where(key < after if descending else key > after)
+        rows = self._session.execute(statement).all()
+
+        items = [entity.to_model() for entity, _length in rows[:params.page_size]]
+        next_cursor = _encode_cursor(items[-1], order_by) if len(rows) > params.page_size else None
+        length = rows[0][1] if rows else self._session.scalar(select(length))
+        return CursorPaginated(items=items, next_cursor=next_cursor, params=params, length=length)
 
     def create(self, subject: User, user: User) -> User:
         """Create a User.
@@ -126,6 +194,8 @@ class UserService:
         entity = UserEntity.from_model(user)
         self._session.add(entity)
         self._session.commit()
+        registered_users.invalidate(entity.pid)
+        request_context.forget('user', entity.pid)
         return entity.to_model()
 
     def update(self, subject: User, user: User) -> User:
@@ -147,4 +217,73 @@ class UserService:
         entity = self._session.get(UserEntity, user.id)
         entity.update(user)
         self._session.commit()
+        registered_users.invalidate(entity.pid)
+        request_context.forget('user', entity.pid)
         return entity.to_model()
+
+
+def _search(query: str) -> tuple[ColumnElement[bool], list[ColumnElement]] | None:
+    """Criteria matching the users searched for by `query` and the order ranking them, or None if it has no words.
+
+    Each criterion is answered by an index: the words by the GIN index of `search`, the onyen prefix
+    by `ix_user_onyen_prefix`, and the PID prefix, a range of PIDs, by the unique index of `pid`."""
+    words = re.findall(r'[^\W_]+', query.lower())
+    if not words:
+        return None
+    terms = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+    term = query.strip().lower()
+    escaped = term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    onyen = func.lower(UserEntity.onyen)
+    criteria = [UserEntity.search.op('@@')(terms), onyen.like(f'{escaped}%', escape='/')]
+    ranking = [(onyen == term).desc()]
+    if term.isdigit() and len(term) <= PID_DIGITS:
+        scale = 10 ** (PID_DIGITS - len(term))
+        pid = int(term)
+        criteria += [UserEntity.pid == pid, UserEntity.pid.between(pid * scale, (pid + 1) * scale - 1)]
+        ranking.append((UserEntity.pid == pid).desc())
+    ranking += [func.ts_rank(UserEntity.search, terms).desc(), UserEntity.id]
+    return or_(*criteria), ranking
+
+
+def _listing(query: str) -> tuple[type[UserEntity], ColumnElement[int]]:
+    """Users searched for by `query`, or every user if empty, to select a page from, and the number of them.
+
+    The number is selected along with the page so as to cost no round trip. The users searched for are
+    counted, as are all users while there are few; otherwise their number is estimated in constant time,
+    as counting a large table scans all of it."""
+    search = _search(query) if query != '' else None
+    count = select(func.count())
+    if search is None:
+        count = count.select_from(UserEntity).scalar_subquery()
+        return UserEntity, case((_ESTIMATED_USERS < EXACT_LENGTH_BELOW, count), else_=_ESTIMATED_USERS)
+    # Materialized so that the users searched for are found through the indexes of `_search` and then
+    # ordered, rather than by walking the index of the column ordered by and searching every user on the way.
+    matches = select(UserEntity).where(search[0]).cte('matches').prefix_with('MATERIALIZED')
+    return aliased(UserEntity, matches), count.select_from(matches).scalar_subquery()
+
+
+def _sort_key(order_by: str) -> tuple[str, bool]:
+    """Column of `SORTABLE` named by `order_by`, and whether it is prefixed with `-` to order descending."""
+    column = order_by.removeprefix('-') or 'id'
+    if column not in SORTABLE:
+        raise ValueError(f'Cannot order users by `{order_by}`, only by one of {", ".join(SORTABLE)}')
+    return column, order_by.startswith('-')
+
+
+def _ordering(users: type[UserEntity], order_by: str, descending: bool) -> list[ColumnElement]:
+    columns = [getattr(users, order_by), users.id]
+    return [column.desc() for column in columns] if descending else columns
+
+
+def _encode_cursor(user: User, order_by: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([order_by, getattr(user, order_by), user.id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str, order_by: str) -> tuple[str | int, int]:
+    try:
+        column, value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid cursor `{cursor}`') from e
+    if column != order_by or not isinstance(id, int) or not isinstance(value, int if order_by in ('pid', 'id') else str):
+        raise ValueError(f'Invalid cursor `{cursor}` for users ordered by `{order_by}`')
+    return value, id
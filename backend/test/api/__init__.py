@@ -0,0 +1 @@
+# Treat `api` as a package.
\ No newline at end of file
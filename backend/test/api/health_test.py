@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+
+from ...main import app
+from ...api import health
+from ...services.health import HealthMonitor
+
+
+@pytest.fixture()
+def monitor(test_engine: Engine, monkeypatch: pytest.MonkeyPatch) -> HealthMonitor:
+    monitor = HealthMonitor(test_engine, pools={'test': test_engine.pool}, interval=5)
+    monkeypatch.setattr(health, 'health_monitor', monitor)
+    return monitor
+
+
+def test_live():
+    assert TestClient(app).get('/api/health/live').json() == 'OK'
+
+
+def test_ready(monitor: HealthMonitor):
+    response = TestClient(app).get('/api/health/ready')
+    assert response.status_code == 200
+    assert response.json()['ready'] is True
+    assert set(response.json()['caches']) == {'permission_index', 'registered_users', 'desk_catalog', 'occupancy_index'}
+
+
+def test_not_ready_sheds_traffic(monitor: HealthMonitor):
+    monitor.stop()
+    response = TestClient(app).get('/api/health/ready')
+    assert response.status_code == 503
+    assert response.json()['reasons'] == ['shutting down']
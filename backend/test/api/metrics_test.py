@@ -0,0 +1,37 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from ...api import metrics
+from ...api.middleware import MetricsMiddleware
+
+
+def test_metrics_by_route_and_status():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.api)
+
+    @app.get('/metrics_test/{item_id}')
+    def item(item_id: int) -> int:
+        return item_id
+
+    @app.get('/metrics_test_failure')
+    def failure() -> None:
+        raise RuntimeError('failed')
+
+    client = TestClient(app, raise_server_exceptions=False)
+    for item_id in range(3):
+        assert client.get(f'/metrics_test/{item_id}').status_code == 200
+    assert client.get('/metrics_test/x').status_code == 422
+    assert client.get('/metrics_test_failure').status_code == 500
+    assert client.get('/metrics_test_missing').status_code == 404
+
+    response = client.get('/api/metrics')
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    lines = response.text.splitlines()
+    assert 'http_requests_total{method="GET",route="/metrics_test/{item_id}",status="200"} 3' in lines
+    assert 'http_requests_total{method="GET",route="/metrics_test/{item_id}",status="422"} 1' in lines
+    assert 'http_requests_total{method="GET",route="/metrics_test_failure",status="500"} 1' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/metrics_test/{item_id}"} 4' in lines
+    assert any(line.startswith('http_requests_total{method="GET",route="unmatched",status="404"}') for line in lines)
+    assert any(line.startswith('db_pool_connections{pool="sync",state="size"}') for line in lines)
+    assert any(line.startswith('cache_hits_total{cache="permission_index"}') for line in lines)
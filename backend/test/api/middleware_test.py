@@ -0,0 +1,66 @@
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, text
+
+from ...api.middleware import RequestContextMiddleware
+from ...services import request_context
+
+
+def test_statements_counted_per_request(test_engine: Engine):
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get('/statements')
+    def statements(count: int) -> int:
+        with test_engine.connect() as connection:
+            for _ in range(count):
+                connection.execute(text('SELECT 1'))
+        return request_context.current().statements
+
+    client = TestClient(app)
+    assert client.get('/statements', params={'count': 3}).json() == 3
+    assert client.get('/statements', params={'count': 1}).json() == 1
+    assert request_context.current() is None
+
+
+def test_server_timing(test_engine: Engine):
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get('/statements')
+    def statements(count: int) -> None:
+        with test_engine.connect() as connection:
+            for _ in range(count):
+                connection.execute(text('SELECT 1'))
+
+    timing = TestClient(app).get('/statements', params={'count': 2}).headers['server-timing']
+    db, app_timing = timing.split(', ')
+    assert db.startswith('db;dur=') and db.endswith(';desc="2 statements"')
+    assert app_timing.startswith('app;dur=')
+    assert float(db.split(';')[1].removeprefix('dur=')) <= float(app_timing.removeprefix('app;dur='))
+
+
+def test_many_statements_reported(test_engine: Engine, caplog: pytest.LogCaptureFixture, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(request_context, 'STATEMENTS_WARNING', 3)
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get('/users/{user_id}')
+    def lookups(user_id: int) -> None:
+        with test_engine.connect() as connection:
+            for role_id in range(4):
+                connection.execute(text('SELECT :role_id'), {'role_id': role_id})
+            connection.execute(text('SELECT 2'))
+
+    with caplog.at_level(logging.WARNING, 'backend.sql'):
+        TestClient(app).get('/users/7')
+    (record,) = caplog.records
+    report = json.loads(record.getMessage())
+    assert report['event'] == 'many_statements'
+    assert report['route'] == 'GET /users/{user_id}'
+    assert report['statements'] == 5
+    assert report['repeated'][0] == ['SELECT ?', 5]
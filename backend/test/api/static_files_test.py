@@ -0,0 +1,64 @@
+"""Tests for serving the front-end bundle from memory."""
+
+import gzip
+import os
+import pytest
+
+import brotli
+from fastapi.testclient import TestClient
+from ...api.static_files import StaticBundle, IMMUTABLE, REVALIDATE
+
+INDEX = '<!doctype html><html><body><app-root></app-root>' + '<script src="main.0123456789abcdef.js"></script>' * 10 + '</body></html>'
+SCRIPT = 'console.log("reserve a desk");\n' * 100
+
+
+@pytest.fixture()
+def bundle(tmp_path):
+    (tmp_path / 'index.html').write_text(INDEX)
+    (tmp_path / 'main.0123456789abcdef.js').write_text(SCRIPT)
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'assets' / 'logo.png').write_bytes(os.urandom(512))
+    return tmp_path
+
+
+@pytest.fixture()
+def client(bundle):
+    return TestClient(StaticBundle(directory=bundle))
+
+
+def test_hashed_assets_are_immutable(client: TestClient):
+    response = client.get('/main.0123456789abcdef.js', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.text == SCRIPT
+    assert response.headers['cache-control'] == IMMUTABLE
+    assert 'content-encoding' not in response.headers
+
+
+def test_index_is_revalidated_and_served_for_unknown_paths(client: TestClient):
+    index = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert index.text == INDEX
+    assert index.headers['cache-control'] == REVALIDATE
+    deep_link = client.get('/coworking/reservations', headers={'Accept-Encoding': 'identity'})
+    assert deep_link.text == INDEX
+    assert client.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': index.headers['etag']}).status_code == 304
+
+
+def test_negotiates_content_encoding(client: TestClient):
+    stream = lambda headers: client.stream('GET', '/main.0123456789abcdef.js', headers=headers)
+    with stream({'Accept-Encoding': 'gzip, deflate, br'}) as response:
+        assert response.headers['content-encoding'] == 'br'
+        assert response.headers['vary'] == 'Accept-Encoding'
+        assert brotli.decompress(b''.join(response.iter_raw())).decode() == SCRIPT
+    with stream({'Accept-Encoding': 'gzip, br;q=0'}) as response:
+        assert response.headers['content-encoding'] == 'gzip'
+        assert gzip.decompress(b''.join(response.iter_raw())).decode() == SCRIPT
+    # Binary files are not compressed.
+    assert 'content-encoding' not in client.get('/assets/logo.png', headers={'Accept-Encoding': 'br'}).headers
+
+
+def test_serves_precompressed_files(bundle):
+    (bundle / 'main.0123456789abcdef.js.gz').write_bytes(gzip.compress(SCRIPT.encode(), compresslevel=1))
+    client = TestClient(StaticBundle(directory=bundle))
+    with client.stream('GET', '/main.0123456789abcdef.js', headers={'Accept-Encoding': 'gzip'}) as response:
+        assert b''.join(response.iter_raw()) == (bundle / 'main.0123456789abcdef.js.gz').read_bytes()
+    assert client.get('/main.0123456789abcdef.js.gz', headers={'Accept-Encoding': 'identity'}).text == INDEX
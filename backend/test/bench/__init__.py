@@ -0,0 +1 @@
+# Treat `bench` as a package.
\ No newline at end of file
@@ -0,0 +1,47 @@
+import pytest
+import asyncio
+import re
+
+from sqlalchemy import Engine, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from ...database import _engine_str
+from ...entities import DeskEntity, DeskReservationEntity, user_role_table
+from ...bench.seed import seed
+from ...bench.run import ROUTES, run
+from ...services.permission import permission_index
+from ..conftest import POSTGRES_DATABASE
+
+
+# Test that every benchmarked route succeeds against a small seed and leaves the data as it was.
+@pytest.mark.commits
+def test_bench_run(test_engine: Engine):
+    counts = seed(test_engine, desks=20, users_count=40, days=4)
+    assert counts['desk'] == 20 and counts['desk_reservation'] > 0
+    permission_index.invalidate()
+
+    async def bench(pattern: str = ''):
+        async_engine = create_async_engine(_engine_str(POSTGRES_DATABASE, dialect='postgresql+asyncpg'), poolclass=NullPool)
+        try:
+            return await run(test_engine, async_engine, requests=4, concurrency=2, warmup=1, pattern=pattern)
+        finally:
+            await async_engine.dispose()
+
+    with Session(test_engine) as session:
+        members = session.scalar(select(func.count()).select_from(user_role_table))
+    report = asyncio.run(bench())
+    assert list(report) == [route.name for route in ROUTES]
+    failed = {name: result['statuses'] for name, result in report.items() if set(result['statuses']) != {'200'}}
+    assert failed == {}
+    assert all(result['p50_ms'] <= result['p99_ms'] for result in report.values())
+
+    with Session(test_engine) as session:
+        assert session.scalar(select(func.count()).select_from(DeskEntity)) == counts['desk']
+        assert session.scalar(select(func.count()).select_from(DeskReservationEntity)) == counts['desk_reservation']
+        assert session.scalar(select(func.count()).select_from(user_role_table)) == members
+
+    # Members added without the route removing them again are removed once the run ends.
+    assert set(asyncio.run(bench(re.escape('POST /api/admin/roles/{id}/member')))) == {'POST /api/admin/roles/{id}/member'}
+    with Session(test_engine) as session:
+        assert session.scalar(select(func.count()).select_from(user_role_table)) == members
@@ -1,35 +1,101 @@
-"""Shared pytest fixtures for database dependent tests."""
+"""Shared pytest fixtures for database dependent tests.
+
+The schema of the entities is created once into a template database, and only created again when
+the entities change. Each test session clones the template into a test database of its own, one per
+pytest-xdist worker when tests run in parallel:
+
+    pytest -n auto --dist loadfile
+
+Each test then runs in a transaction which `test_session` rolls back when the test ends, so that
+tests start from empty tables without recreating them. The session commits to savepoints within the
+transaction, which other connections cannot see; tests which need their changes committed, such as
+to be seen by background threads, another engine or another session, are marked `commits` and
+recreate the tables once they end instead.
+"""
+
+import hashlib
+import os
 
 import pytest
 
-from sqlalchemy import create_engine, text, Engine
+from sqlalchemy import create_engine, create_mock_engine, event, text, Engine
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
 
 from ..database import _engine_str
 from ..env import getenv
 
-POSTGRES_DATABASE = f'{getenv("POSTGRES_DATABASE")}_test'
+POSTGRES_DATABASE = f'{getenv("POSTGRES_DATABASE")}_test{os.environ.get("PYTEST_XDIST_WORKER", "").removeprefix("gw")}'
+TEMPLATE_DATABASE = f'{getenv("POSTGRES_DATABASE")}_test_template'
 POSTGRES_USER = getenv('POSTGRES_USER')
 
+BENCHMARK = os.environ.get('BENCHMARK', '').lower() in ('1', 'true')
+"""Whether tests marked `benchmark` are run, as they are skipped by default."""
+
+_TEMPLATE_LOCK = int.from_bytes(b'csxl', 'big')
+"""Key of the advisory lock serializing the workers building and cloning the template."""
+
+
+def pytest_configure(config: pytest.Config):
+    config.addinivalue_line('markers', 'commits: the test commits its changes, and the tables are recreated after it')
+    config.addinivalue_line('markers', 'benchmark: the test times the code under test, and is skipped unless BENCHMARK=1')
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]):
+    if BENCHMARK:
+        return
+    skip = pytest.mark.skip(reason='benchmarks only run with BENCHMARK=1')
+    for item in items:
+        if item.get_closest_marker('benchmark') is not None:
+            item.add_marker(skip)
+
 
 def reset_database():
-    engine = create_engine(_engine_str(''))
+    """Clone the template database, building it first if it does not hold the current schema, into the test database."""
+    fingerprint = schema_fingerprint()
+    engine = create_engine(_engine_str(''), isolation_level='AUTOCOMMIT', poolclass=NullPool)
     with engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': _TEMPLATE_LOCK})
         try:
-            conn = connection.execution_options(autocommit=False)
-            conn.execute(text('ROLLBACK'))  # Get out of transactional mode...
-            conn.execute(text(f'DROP DATABASE {POSTGRES_DATABASE}'))
-        except ProgrammingError:
-            ...
-        except OperationalError:
-            print(
-                "Could not drop database because it's being accessed by others (psql open?)")
-            exit(1)
+            built = connection.scalar(text("SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = :name"),
+                                      {'name': TEMPLATE_DATABASE})
+            if built != fingerprint:
+                connection.execute(text(f'DROP DATABASE IF EXISTS {TEMPLATE_DATABASE}'))
+                connection.execute(text(f'CREATE DATABASE {TEMPLATE_DATABASE}'))
+                template = create_engine(_engine_str(TEMPLATE_DATABASE), poolclass=NullPool)
+                create_schema(template)
+                template.dispose()
+                connection.execute(text(f"COMMENT ON DATABASE {TEMPLATE_DATABASE} IS '{fingerprint}'"))
+            try:
+                connection.execute(text(f'DROP DATABASE IF EXISTS {POSTGRES_DATABASE}'))
+            except OperationalError:
+                print("Could not drop database because it's being accessed by others (psql open?)")
+                exit(1)
+            connection.execute(text(f'CREATE DATABASE {POSTGRES_DATABASE} TEMPLATE {TEMPLATE_DATABASE}'))
+            connection.execute(text(f'GRANT ALL PRIVILEGES ON DATABASE {POSTGRES_DATABASE} TO {POSTGRES_USER}'))
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _TEMPLATE_LOCK})
 
-        conn.execute(text(f'CREATE DATABASE {POSTGRES_DATABASE}'))
-        conn.execute(
-            text(f'GRANT ALL PRIVILEGES ON DATABASE {POSTGRES_DATABASE} TO {POSTGRES_USER}'))
+
+def schema_fingerprint() -> str:
+    """Digest of the DDL creating the schema of the entities."""
+    statements = []
+    engine = create_mock_engine(_engine_str(''), lambda sql, *args, **kwargs: statements.append(str(sql.compile(dialect=engine.dialect))))
+    create_schema(engine, checkfirst=False)
+    return hashlib.blake2b('\n'.join(statements).encode(), digest_size=16).hexdigest()
+
+
+def create_schema(engine: Engine, checkfirst: bool = True):
+    from .. import entities
+    entities.EntityBase.metadata.create_all(engine, checkfirst=checkfirst)
+
+
+def reset_schema(engine: Engine):
+    """Recreate the tables, after a test committed to them."""
+    from .. import entities
+    entities.EntityBase.metadata.drop_all(engine)
+    create_schema(engine)
 
 
 @pytest.fixture(scope='session')
@@ -38,13 +104,50 @@ def test_engine() -> Engine:
     return create_engine(_engine_str(POSTGRES_DATABASE))
 
 
+@pytest.fixture(scope='function', autouse=True)
+def committed(request: pytest.FixtureRequest):
+    """Recreate the tables after tests marked `commits`."""
+    if request.node.get_closest_marker('commits') is None:
+        yield False
+        return
+    engine = request.getfixturevalue('test_engine')
+    yield True
+    reset_schema(engine)
+
+
 @pytest.fixture(scope='function')
-def test_session(test_engine: Engine):
-    from .. import entities
-    entities.EntityBase.metadata.drop_all(test_engine)
-    entities.EntityBase.metadata.create_all(test_engine)
-    session = Session(test_engine)
+def test_session(test_engine: Engine, committed: bool):
+    from ..services.permission import permission_index
+    permission_index.invalidate()
+    if committed:
+        session = Session(test_engine)
+        try:
+            yield session
+        finally:
+            session.close()
+        return
+
+    connection = test_engine.connect()
+    transaction = connection.begin()
+    session = Session(connection, join_transaction_mode='create_savepoint')
     try:
         yield session
     finally:
         session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope='function')
+def statements(test_session: Session):
+    """SQL statements executed against the test database while the fixture is active."""
+    executed = []
+
+    def record(connection, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(test_session.bind, 'before_cursor_execute', record)
+    try:
+        yield executed
+    finally:
+        event.remove(test_session.bind, 'before_cursor_execute', record)
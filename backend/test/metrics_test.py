@@ -0,0 +1,78 @@
+import pytest
+import threading
+
+from ..metrics import Registry, service_method_duration, timed
+
+
+def test_counter_sums_threads():
+    registry = Registry()
+    counter = registry.counter('things_total', 'Things.', ('kind',))
+
+    def count():
+        for _ in range(1000):
+            counter.inc('a')
+        counter.inc('b', amount=2)
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.totals() == {('a',): [8000.0], ('b',): [16.0]}
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+    for value in [0.05, 0.1, 0.5, 3.0]:
+        histogram.observe(value, '/api/desk/{desk_id}')
+    assert registry.render().decode().splitlines() == [
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/api/desk/{desk_id}",le="0.1"} 2',
+        'latency_seconds_bucket{route="/api/desk/{desk_id}",le="1"} 3',
+        'latency_seconds_bucket{route="/api/desk/{desk_id}",le="+Inf"} 4',
+        'latency_seconds_sum{route="/api/desk/{desk_id}"} 3.65',
+        'latency_seconds_count{route="/api/desk/{desk_id}"} 4',
+    ]
+
+
+def test_collected_and_escaped_labels():
+    registry = Registry()
+    registry.collected('pool_connections', 'Connections.', ('state',), lambda: [(('checked "out"',), 3)])
+    assert 'pool_connections{state="checked \\"out\\""} 3' in registry.render().decode()
+
+
+def test_labels_must_match():
+    registry = Registry()
+    counter = registry.counter('things_total', 'Things.', ('kind',))
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        registry.counter('things_total', 'Things.')
+
+
+def test_timed_methods():
+    @timed
+    class Service:
+        def find(self, value: int) -> int:
+            return value
+
+        def scan(self, values: list[int]):
+            yield from values
+
+        def _private(self) -> None:
+            ...
+
+    def count(method: str) -> float:
+        # The count of observations is the sum of the buckets, which precede the sum of the values.
+        return sum(service_method_duration.totals().get(('Service', method), [0.0])[:-1])
+
+    before = count('find'), count('scan')
+    service = Service()
+    assert service.find(1) == 1
+    scan = service.scan([1, 2])
+    assert count('scan') == before[1]
+    assert list(scan) == [1, 2]
+    assert (count('find'), count('scan')) == (before[0] + 1, before[1] + 1)
+    assert ('Service', '_private') not in service_method_duration.totals()
@@ -0,0 +1 @@
+# Treat `script` as a package.
\ No newline at end of file
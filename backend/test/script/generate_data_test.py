@@ -0,0 +1,42 @@
+import pytest
+
+from datetime import datetime
+from sqlalchemy import Engine, select, text
+from sqlalchemy.orm import Session
+
+from ...entities import UserEntity, DeskReservationEntity
+from ...script.generate_data import DIURNAL, copy_rows, generate
+
+now = datetime(2023, 10, 18, 12)
+
+
+@pytest.mark.commits
+def test_generate(test_engine: Engine):
+    counts = generate(test_engine, labs=3, desks_per_lab=10, users=200, roles=4, months=1, days_ahead=7, seed=1, now=now)
+    assert counts['desk'] == 30 and counts['user'] == 200 and counts['role'] == 4
+    with Session(test_engine) as session:
+        assert session.scalar(select(text('count(*)')).select_from(DeskReservationEntity)) == counts['desk_reservation'] > 0
+        # Nobody reserves a desk at the hours without demand.
+        idle = [hour for hour, demand in enumerate(DIURNAL) if demand == 0]
+        assert session.scalar(text('SELECT count(*) FROM desk_reservation WHERE extract(hour FROM date) = ANY(:idle)'), {'idle': idle}) == 0
+        # The dropped indexes and constraints were recreated.
+        assert session.scalar(text("SELECT count(*) FROM pg_constraint WHERE conrelid = 'desk_reservation'::regclass")) == 5
+        # New rows continue after the generated ones.
+        user = UserEntity(pid=300000000, onyen='new', email='new@unc.edu')
+        session.add(user)
+        session.commit()
+        assert user.id == session.scalar(text('SELECT max(id) FROM "user"'))
+        assert user.id > counts['user']
+
+
+@pytest.mark.commits
+def test_copy_rows_escapes_text(test_engine: Engine, test_session: Session):
+    names = ['tab\there', 'back\\slash', 'new\nline', '\\N']
+    connection = test_engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            assert copy_rows(cursor, 'role', ('id', 'name'), enumerate(names, 1)) == len(names)
+        connection.commit()
+    finally:
+        connection.close()
+    assert test_session.scalars(text('SELECT name FROM role ORDER BY id')).all() == names
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from ...database import _engine_str
+from ...models import User, Desk, DeskReservation, Role
+from ...entities import UserEntity, DeskEntity, RoleEntity, PermissionEntity
+from ...services import AsyncDeskService, AsyncDeskReservationService, AsyncUserService, AsyncPermissionService, UserPermissionError
+from ..conftest import POSTGRES_DATABASE
+
+# The async services run on connections of their own, which only see committed changes.
+pytestmark = pytest.mark.commits
+
+# Mock Models #
+desk1 = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+desk2 = Desk(id=2, tag='CD1', desk_type='Standing Desk', included_resource='Windows Desktop i9', available=True)
+
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+student1 = User(id=2, pid=123456789, onyen='student1', email='student1@unc.edu')
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    root_user_entity = UserEntity.from_model(root)
+    test_session.add(root_user_entity)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    test_session.add(root_role_entity)
+    test_session.add(PermissionEntity(action='*', resource='*', role=root_role_entity))
+    test_session.add(UserEntity.from_model(student1))
+    test_session.add(DeskEntity.from_model(desk1))
+    test_session.add(DeskEntity.from_model(desk2))
+    test_session.commit()
+    yield
+
+
+def run(test):
+    """Run a coroutine taking an AsyncSession against the test database."""
+    async def with_session():
+        engine = create_async_engine(_engine_str(POSTGRES_DATABASE, dialect='postgresql+asyncpg'), poolclass=NullPool)
+        try:
+            async with AsyncSession(engine) as session:
+                return await test(session)
+        finally:
+            await engine.dispose()
+    return asyncio.run(with_session())
+
+
+def test_async_list_available_desks():
+    async def test(session: AsyncSession):
+        return await AsyncDeskService(session).list_available_desks()
+    assert [desk.tag for desk in run(test)] == ['AA1', 'CD1']
+
+
+def test_async_user_get_with_permissions():
+    async def test(session: AsyncSession):
+        return await AsyncUserService(session).get(root.pid)
+    user = run(test)
+    assert user.onyen == 'root'
+    assert [(p.action, p.resource) for p in user.permissions] == [('*', '*')]
+
+
+def test_async_enforce():
+    async def test(session: AsyncSession):
+        permission = AsyncPermissionService(session)
+        await permission.enforce(root, 'admin/', 'desk')
+        await permission.enforce(student1, 'admin/', 'desk')
+    with pytest.raises(UserPermissionError):
+        run(test)
+
+
+def test_async_create_and_list_reservations():
+    date = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    async def test(session: AsyncSession):
+        reservations = AsyncDeskReservationService(session)
+        await reservations.create_desk_reservation(desk1, student1, DeskReservation(date=date))
+        await reservations.create_desk_reservation(desk2, student1, DeskReservation(date=date + timedelta(hours=1)))
+        return await reservations.list_desk_reservations_by_user(student1), await reservations.list_reservations_by_desk(desk1.id)
+
+    by_user, by_desk = run(test)
+    assert [desk.tag for _, desk in by_user] == ['AA1', 'CD1']
+    assert [reservation.date for reservation in by_desk] == [date]
+
+
+def test_async_stream_reservations_for_admin():
+    date = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    async def test(session: AsyncSession):
+        reservations = AsyncDeskReservationService(session)
+        for hours, desk in enumerate([desk2, desk1]):
+            await reservations.create_desk_reservation(desk, student1, DeskReservation(date=date + timedelta(hours=hours)))
+        rows = await reservations.stream_desk_reservations_for_admin(root, False)
+        streamed = [(desk.tag, user.onyen) async for _, desk, user in rows]
+        try:
+            await reservations.stream_desk_reservations_for_admin(student1, False)
+        except UserPermissionError:
+            return streamed
+
+    assert run(test) == [('CD1', 'student1'), ('AA1', 'student1')]
@@ -0,0 +1,121 @@
+"""Micro-benchmark of serializing the admin reservation listing, reported in rows per second.
+
+The listing used to select full ORM entities and leave FastAPI's `jsonable_encoder` to walk them;
+it now selects plain columns into models built without validation and renders them with
+`ModelJSONResponse`. Both paths are timed over the same 100,000 reservations, from executing the
+query through rendering the response body. The encoding of the body alone, by FastAPI's default
+`jsonable_encoder` and stdlib `json` against orjson in `ModelJSONResponse`, is timed apart on the
+rows of the same listing.
+
+By default only a thousand reservations are seeded, and the paths are only checked to render the
+same body. The timed tests are marked `benchmark` and run over the full table with BENCHMARK=1:
+
+    BENCHMARK=1 pytest -s -m benchmark backend/test/services/desk_reservation_benchmark_test.py
+"""
+
+import json
+import pytest
+import time
+
+from collections.abc import Callable
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import Engine, select, text
+from sqlalchemy.orm import Session
+from ...models import User, Role
+from ...entities import UserEntity, RoleEntity, PermissionEntity, DeskEntity, DeskReservationEntity
+from ...services import DeskReservationService, PermissionService
+from ...services.permission import permission_index
+from ..conftest import BENCHMARK, reset_schema
+from ...api.responses import ModelJSONResponse
+
+DESKS = 100
+HOURS = 1000 if BENCHMARK else 10
+ROWS = DESKS * HOURS
+
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+
+
+@pytest.fixture(scope='module')
+def seeded_session(test_engine: Engine):
+    permission_index.invalidate()
+    session = Session(test_engine)
+
+    root_user_entity = UserEntity.from_model(root)
+    session.add(root_user_entity)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    session.add(root_role_entity)
+    session.add(PermissionEntity(action='*', resource='*', role=root_role_entity))
+    session.flush()
+
+    session.execute(text('''
+        INSERT INTO desk (id, tag, desk_type, included_resource, available)
+        SELECT d, 'D' || d, 'Computer Desk', 'Monitor', true FROM generate_series(1, :desks) d'''), {'desks': DESKS})
+    session.execute(text('''
+        INSERT INTO "user" (id, pid, onyen, email, first_name, last_name, pronouns)
+        SELECT u, 100000000 + u, 'student' || u, 'student' || u || '@unc.edu', 'First', 'Last', 'they / them'
+        FROM generate_series(2, :desks + 1) u'''), {'desks': DESKS})
+    session.execute(text('''
+        INSERT INTO desk_reservation (desk_id, user_id, date)
+        SELECT d, 1 + d, date_trunc('hour', LOCALTIMESTAMP) - (h + 1) * interval '1 hour'
+        FROM generate_series(1, :desks) d, generate_series(0, :hours - 1) h'''), {'desks': DESKS, 'hours': HOURS})
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        reset_schema(test_engine)
+
+
+def rows_per_second(session: Session, render: Callable[[], bytes]) -> tuple[float, bytes]:
+    session.expunge_all()
+    start = time.perf_counter()
+    body = render()
+    return ROWS / (time.perf_counter() - start), body
+
+
+def entities_body(session: Session) -> bytes:
+    """The admin listing as rendered from full ORM entities."""
+    stmt = select(DeskReservationEntity, DeskEntity, UserEntity)\
+        .join(DeskEntity)\
+        .join(UserEntity)\
+        .order_by(DeskReservationEntity.date)
+    rows = [(reservation, desk, user) for reservation, desk, user in session.execute(stmt)]
+    return JSONResponse(jsonable_encoder(rows)).body
+
+
+def projection_body(session: Session) -> bytes:
+    """The admin listing as rendered by the service."""
+    service = DeskReservationService(session, PermissionService(session))
+    return ModelJSONResponse(service.list_past_desk_reservations_for_admin(root)).body
+
+
+def test_serialize_admin_reservations(seeded_session: Session):
+    by_id = lambda rows: sorted(rows, key=lambda row: row[0]['id'])
+    expected = [[reservation, desk, {**user, 'permissions': []}] for reservation, desk, user in json.loads(entities_body(seeded_session))]
+    seeded_session.expunge_all()
+    assert by_id(json.loads(projection_body(seeded_session))) == by_id(expected)
+
+
+@pytest.mark.benchmark
+def test_serialize_admin_reservations_benchmark(seeded_session: Session):
+    before, _ = rows_per_second(seeded_session, lambda: entities_body(seeded_session))
+    after, _ = rows_per_second(seeded_session, lambda: projection_body(seeded_session))
+    print(f'\nSerialized {ROWS} reservations: entities {before:,.0f} rows/s, projection {after:,.0f} rows/s ({after / before:.1f}x)')
+    assert after > before
+
+
+def test_encode_admin_reservations(seeded_session: Session):
+    rows = DeskReservationService(seeded_session, PermissionService(seeded_session)).list_past_desk_reservations_for_admin(root)
+    assert json.loads(ModelJSONResponse(rows).body) == json.loads(JSONResponse(jsonable_encoder(rows)).body)
+
+
+@pytest.mark.benchmark
+def test_encode_admin_reservations_benchmark(seeded_session: Session):
+    rows = DeskReservationService(seeded_session, PermissionService(seeded_session)).list_past_desk_reservations_for_admin(root)
+    before, _ = rows_per_second(seeded_session, lambda: JSONResponse(jsonable_encoder(rows)).body)
+    after, _ = rows_per_second(seeded_session, lambda: ModelJSONResponse(rows).body)
+    print(f'\nEncoded {ROWS} reservations: jsonable_encoder and json {before:,.0f} rows/s, orjson {after:,.0f} rows/s ({after / before:.1f}x)')
+    assert after > before
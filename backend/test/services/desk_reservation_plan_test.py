@@ -0,0 +1,157 @@
+"""Verify the reservation hot paths are served by indexes rather than sequential scans.
+
+The desk_reservation table is seeded with over a million rows spread across the 30 days before
+and after now, which is what the table holds once old reservations are regularly removed, in the
+monthly partitions the retention worker maintains. Each
+service method is run while its SQL is recorded, and then every recorded statement touching
+desk_reservation is EXPLAINed with its original parameters. The unpaginated admin listings are not
+checked as they return a large share of the table, for which a sequential scan is the best plan.
+"""
+
+import json
+import pytest
+
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, event, text
+from sqlalchemy.orm import Session
+from ...models import User, Desk, Role, CursorPaginationParams
+from ...entities import UserEntity, RoleEntity, PermissionEntity
+from ...services import DeskReservationService, DeskService, PermissionService
+from ...services import retention
+from ...services.permission import permission_index
+from ..conftest import reset_schema
+from ...services.partition import ensure_partitions
+
+DESKS = 700
+STUDENTS = 5000
+HOURS = 60 * 24
+"""Every desk is reserved every hour from 30 days ago to 30 days from now: 1,008,000 reservations."""
+
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+student = User(id=42, pid=100000042, onyen='student42')
+
+
+@pytest.fixture(scope='module')
+def seeded_session(test_engine: Engine):
+    """The table is seeded once for the whole module since the tests only inspect query plans."""
+    permission_index.invalidate()
+    session = Session(test_engine)
+
+    root_user_entity = UserEntity.from_model(root)
+    session.add(root_user_entity)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    session.add(root_role_entity)
+    session.add(PermissionEntity(action='*', resource='*', role=root_role_entity))
+    session.commit()
+    ensure_partitions(session, datetime.now() - timedelta(hours=HOURS / 2), datetime.now() + timedelta(hours=HOURS / 2))
+
+    session.execute(text('''
+        INSERT INTO desk (id, tag, desk_type, included_resource, available)
+        SELECT d, 'D' || d, 'Computer Desk', '', true FROM generate_series(1, :desks) d'''), {'desks': DESKS})
+    session.execute(text('''
+        INSERT INTO "user" (id, pid, onyen, email, first_name, last_name, pronouns)
+        SELECT u, 100000000 + u, 'student' || u, 'student' || u || '@unc.edu', '', '', ''
+        FROM generate_series(2, :students + 1) u'''), {'students': STUDENTS})
+    session.execute(text('''
+        INSERT INTO desk_reservation (desk_id, user_id, date)
+        SELECT d, 2 + (d + h) % :students, date_trunc('hour', LOCALTIMESTAMP) + (h - :hours / 2) * interval '1 hour'
+        FROM generate_series(1, :desks) d, generate_series(0, :hours - 1) h'''),
+        {'desks': DESKS, 'students': STUDENTS, 'hours': HOURS})
+    session.execute(text('ANALYZE'))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        reset_schema(test_engine)
+
+
+@pytest.fixture()
+def desk_reservation_service(seeded_session: Session):
+    return DeskReservationService(seeded_session, PermissionService(seeded_session))
+
+
+def explain(session: Session, call: Callable[[], object]) -> list[tuple[str, dict]]:
+    """Run `call` and return the plan of each of its statements on desk_reservation."""
+    recorded = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if 'desk_reservation' in statement and not executemany:
+            recorded.append((statement, parameters))
+
+    event.listen(session.bind, 'before_cursor_execute', record)
+    try:
+        call()
+    finally:
+        event.remove(session.bind, 'before_cursor_execute', record)
+
+    assert recorded, 'expected at least one statement on desk_reservation'
+    plans = []
+    for statement, parameters in recorded:
+        plan = session.connection().exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plans.append((statement, plan[0]['Plan']))
+    return plans
+
+
+def sequential_scans(session: Session, call: Callable[[], object]) -> list[str]:
+    """Run `call` and return each of its statements on desk_reservation planned with a sequential scan of
+    one of its monthly partitions. The default partition is left out as it is empty."""
+    return [statement for statement, plan in explain(session, call)
+            if any(name.startswith('desk_reservation_p') for name in _scanned(plan, 'Seq Scan'))]
+
+
+def _scanned(node: dict, node_type: str | None = None) -> list[str]:
+    """Names of the relations scanned by the plan `node`, only by `node_type` scans if given."""
+    names = []
+    if 'Relation Name' in node and node_type in (None, node['Node Type']):
+        names.append(node['Relation Name'])
+    for child in node.get('Plans', []):
+        names.extend(_scanned(child, node_type))
+    return names
+
+
+def test_list_desk_reservations_by_user_plan(desk_reservation_service: DeskReservationService, seeded_session: Session):
+    assert sequential_scans(seeded_session, lambda: desk_reservation_service.list_desk_reservations_by_user(student)) == []
+
+
+def test_list_reservations_by_desk_plan(desk_reservation_service: DeskReservationService, seeded_session: Session):
+    assert sequential_scans(seeded_session, lambda: desk_reservation_service.list_reservations_by_desk(7)) == []
+
+
+def test_page_future_desk_reservations_for_admin_plan(desk_reservation_service: DeskReservationService, seeded_session: Session):
+    page = desk_reservation_service.page_desk_reservations_for_admin(root, False, CursorPaginationParams())
+    params = CursorPaginationParams(cursor=page.next_cursor)
+    assert sequential_scans(seeded_session, lambda: desk_reservation_service.page_desk_reservations_for_admin(root, False, params)) == []
+
+
+def test_page_past_desk_reservations_for_admin_plan(desk_reservation_service: DeskReservationService, seeded_session: Session):
+    page = desk_reservation_service.page_desk_reservations_for_admin(root, True, CursorPaginationParams())
+    params = CursorPaginationParams(cursor=page.next_cursor)
+    assert sequential_scans(seeded_session, lambda: desk_reservation_service.page_desk_reservations_for_admin(root, True, params)) == []
+
+
+def test_remove_old_reservations_plan(desk_reservation_service: DeskReservationService, seeded_session: Session,
+                                      monkeypatch: pytest.MonkeyPatch):
+    # The partitions are left as seeded for the other tests; their maintenance is covered by partition_test.
+    monkeypatch.setattr(retention, 'maintain_partitions', lambda *args: [])
+    assert sequential_scans(seeded_session, lambda: desk_reservation_service.remove_old_reservations(root)) == []
+
+
+def test_toggle_desk_availability_plan(seeded_session: Session):
+    desk_service = DeskService(seeded_session, PermissionService(seeded_session))
+    desk = Desk(id=7, tag='D7', desk_type='Computer Desk')
+    assert sequential_scans(seeded_session, lambda: desk_service.toggle_desk_availability(desk, root)) == []
+
+
+def test_page_future_desk_reservations_for_admin_prunes_partitions(desk_reservation_service: DeskReservationService, seeded_session: Session):
+    page = desk_reservation_service.page_desk_reservations_for_admin(root, False, CursorPaginationParams())
+    params = CursorPaginationParams(cursor=page.next_cursor)
+    for _, plan in explain(seeded_session, lambda: desk_reservation_service.page_desk_reservations_for_admin(root, False, params)):
+        scanned = {name for name in _scanned(plan) if name.startswith('desk_reservation')}
+        assert f'desk_reservation_p{datetime.now() - timedelta(days=31):%Y%m}' not in scanned
+        assert len(scanned - {'desk_reservation_default'}) <= 2
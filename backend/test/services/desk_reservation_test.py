@@ -1,11 +1,14 @@
+import base64
 import pytest
 
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from sqlalchemy import Engine, select, func, text
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
-from ...models import User, Desk, DeskReservation, Role
-from ...entities import UserEntity, DeskEntity, PermissionEntity, RoleEntity
-from ...services import DeskReservationService, PermissionService, UserPermissionError
+from ...models import User, Desk, DeskReservation, Role, CursorPaginationParams, BulkReservationRequest, Recurrence
+from ...entities import UserEntity, DeskEntity, PermissionEntity, RoleEntity, DeskReservationEntity
+from ...services import DeskReservationService, PermissionService, UserPermissionError, ReservationConflictError
+from ...services.retention import RetentionWorker, retention_worker
 
 # Mock Models #
 # Desks
@@ -66,6 +69,9 @@ def setup_teardown(test_session: Session):
 
     test_session.commit()
 
+    # Reservation ids are assigned by the sequence, which rollbacks do not rewind.
+    test_session.execute(text(f"SELECT setval('{DeskReservationEntity.__table__}_id_seq', 1, false)"))
+
     yield
 
 # pytest fixture to use for all the tests.
@@ -122,9 +128,20 @@ def test_remove_old_reservations(test_session: Session):
     desk_reservation_service.create_desk_reservation(desk2, student2, reservation5)
     desk_reservation_service.create_desk_reservation(desk1, student1, reservation6)
 
-    desk_reservation_service.remove_old_reservations(root)
+    runs = retention_worker.status().runs
+    assert desk_reservation_service.remove_old_reservations(root) == 204
     reservation = desk_reservation_service.list_past_desk_reservations_for_admin(root)
     assert len(reservation) == 2
+    assert retention_worker.status().runs == runs + 1
+
+
+def test_remove_old_reservations_triggers_running_worker(test_session: Session, monkeypatch: pytest.MonkeyPatch):
+    triggered = []
+    monkeypatch.setattr(RetentionWorker, 'running', True)
+    monkeypatch.setattr(retention_worker, 'trigger', lambda: triggered.append(True))
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    assert desk_reservation_service.remove_old_reservations(root) == 202
+    assert triggered == [True]
 
 # Test listing all desk reservations (Testing for student)
 def test_list_desk_reservations_as_student(test_session: Session):
@@ -158,7 +175,7 @@ def test_create_reservation(desk_reservation_service: DeskReservationService):
     reservation4 = DeskReservation(id=3, date=datetime.now() + timedelta(days=4))
     new_desk_reservation = desk_reservation_service.create_desk_reservation(desk4, student3, reservation4)
 
-    with pytest.raises(IntegrityError):
+    with pytest.raises(ReservationConflictError):
         desk_reservation_service.create_desk_reservation(desk4, student3, reservation4)
     
     assert new_desk_reservation.date == reservation4.date
@@ -174,6 +191,23 @@ def test_remove_desk_reservation(desk_reservation_service: DeskReservationServic
     assert remove_reservation.id == desk1.id
 
 
+# Test the sequence assigns reservation ids, whatever id the client sends.
+def test_create_reservation_ignores_client_id(desk_reservation_service: DeskReservationService):
+    first = desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(id=7, date=reservation1.date))
+    second = desk_reservation_service.create_desk_reservation(desk1, student2, DeskReservation(id=7, date=reservation2.date))
+
+    assert (first.id, second.id) == (1, 2)
+
+
+# Test removing a reservation which does not exist fails without removing another one.
+def test_remove_missing_desk_reservation(desk_reservation_service: DeskReservationService):
+    desk_reservation_service.create_desk_reservation(desk1, student1, reservation1)
+
+    with pytest.raises(ValueError):
+        desk_reservation_service.remove_desk_reservation(desk1, student1, reservation1.copy(update={'date': reservation2.date}))
+    assert len(desk_reservation_service.list_reservations_by_desk(desk1.id)) == 1
+
+
 # Test to list the desk reservations by desk.
 def test_list_desk_reservations_by_desk(desk_reservation_service: DeskReservationService):
     
@@ -184,7 +218,10 @@ def test_list_desk_reservations_by_desk(desk_reservation_service: DeskReservatio
     desk_reservations = desk_reservation_service.list_reservations_by_desk(desk1.id)
     
     assert len(desk_reservations) == 3
-    assert desk_reservations == [reservation1, reservation2, reservation3]
+    assert desk_reservations == [
+        reservation1.copy(update={'desk_id': desk1.id, 'user_id': student1.id}),
+        reservation2.copy(update={'desk_id': desk1.id, 'user_id': student2.id}),
+        reservation3.copy(update={'desk_id': desk1.id, 'user_id': student3.id})]
     assert desk_reservations[0].id == 1
     assert desk_reservations[1].date == reservation2.date
 
@@ -200,7 +237,9 @@ def test_reservation_by_desk_multiple_desk(desk_reservation_service: DeskReserva
     desk_reservations = desk_reservation_service.list_reservations_by_desk(desk1.id)
 
     assert len(desk_reservations) == 2
-    assert desk_reservations == [reservation1, reservation2]
+    assert desk_reservations == [
+        reservation1.copy(update={'desk_id': desk1.id, 'user_id': student1.id}),
+        reservation2.copy(update={'desk_id': desk1.id, 'user_id': student2.id})]
     assert desk_reservations[0].id == reservation1.id
 
 
@@ -216,3 +255,173 @@ def test_list_reservations_by_user_past_dates(desk_reservation_service: DeskRese
     reservations = desk_reservation_service.list_desk_reservations_by_user(student2)
     assert len(reservations) == 1
 
+
+
+# Test the availability grid marks reserved hours of each desk.
+def test_get_availability(desk_reservation_service: DeskReservationService):
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(id=1, date=start))
+    desk_reservation_service.create_desk_reservation(desk1, student2, DeskReservation(id=2, date=start + timedelta(hours=9, minutes=30)))
+    desk_reservation_service.create_desk_reservation(desk3, student3, DeskReservation(id=3, date=start + timedelta(hours=2)))
+    desk_reservation_service.create_desk_reservation(desk2, student1, DeskReservation(id=4, date=start + timedelta(hours=30)))
+
+    availability = desk_reservation_service.get_availability(start, start + timedelta(hours=24))
+
+    assert availability.slots == 24
+    assert [desk.desk_id for desk in availability.desks] == [1, 2, 3]
+    reserved = [base64.b64decode(desk.reserved) for desk in availability.desks]
+    assert reserved[0] == bytes([0b10000000, 0b01000000, 0])
+    assert reserved[1] == bytes(3)
+    assert reserved[2] == bytes([0b00100000, 0, 0])
+
+
+# Test the availability grid filters by desk type and caps the window at the booking window.
+def test_get_availability_desk_type(desk_reservation_service: DeskReservationService):
+    start = datetime.now()
+    availability = desk_reservation_service.get_availability(start, start + timedelta(days=60), 'Standing Desk')
+
+    assert [desk.tag for desk in availability.desks] == ['CD1', 'ND1']
+    assert availability.slots == 30 * 24
+    assert availability.end - availability.start == timedelta(days=30)
+
+
+# Test the availability grid rejects an empty window.
+def test_get_availability_empty_window(desk_reservation_service: DeskReservationService):
+    start = datetime.now()
+    with pytest.raises(ValueError):
+        desk_reservation_service.get_availability(start, start - timedelta(hours=1))
+
+
+# Test a desk cannot be reserved twice for the same slot, regardless of the user.
+def test_create_reservation_desk_conflict(desk_reservation_service: DeskReservationService):
+    date = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=date))
+
+    with pytest.raises(ReservationConflictError):
+        desk_reservation_service.create_desk_reservation(desk1, student2, DeskReservation(date=date))
+
+
+# Test a user cannot reserve two desks for the same slot.
+def test_create_reservation_user_conflict(desk_reservation_service: DeskReservationService):
+    date = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=date))
+
+    with pytest.raises(ReservationConflictError):
+        desk_reservation_service.create_desk_reservation(desk2, student1, DeskReservation(date=date))
+
+
+# Test exactly one of many concurrent bookings of the same slot wins.
+@pytest.mark.commits
+def test_create_reservation_concurrently(test_session: Session):
+    date = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=2)
+    engine: Engine = test_session.bind
+    students = [student1, student2, student3]
+
+    def book(attempt: int) -> bool:
+        with Session(engine) as session:
+            try:
+                DeskReservationService(session).create_desk_reservation(desk1, students[attempt % 3], DeskReservation(date=date))
+                return True
+            except ReservationConflictError:
+                return False
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        outcomes = list(executor.map(book, range(300)))
+
+    assert outcomes.count(True) == 1
+    count = select(func.count()).select_from(DeskReservationEntity).where(DeskReservationEntity.date == date)
+    assert test_session.scalar(count) == 1
+
+
+# Test paging through future reservations (for Admin) with cursors.
+def test_page_future_desk_reservations_for_admin(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    for reservation, desk, student in [(reservation3, desk3, student3), (reservation1, desk1, student1), (reservation2, desk2, student2), (reservation4, desk1, student1)]:
+        desk_reservation_service.create_desk_reservation(desk, student, reservation)
+
+    first = desk_reservation_service.page_desk_reservations_for_admin(root, False, CursorPaginationParams(page_size=2))
+    assert [reservation.id for reservation, _, _ in first.items] == [1, 2]
+    assert first.next_cursor is not None
+
+    second = desk_reservation_service.page_desk_reservations_for_admin(root, False, CursorPaginationParams(cursor=first.next_cursor, page_size=2))
+    assert [(reservation.id, desk.tag, user.onyen) for reservation, desk, user in second.items] == [(3, 'ND1', 'student3')]
+    assert second.next_cursor is None
+
+
+# Test paging through past reservations (for Admin) lists the most recent first.
+def test_page_past_desk_reservations_for_admin(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    for reservation, desk, student in [(reservation1, desk1, student1), (reservation4, desk1, student1), (reservation5, desk2, student2)]:
+        desk_reservation_service.create_desk_reservation(desk, student, reservation)
+
+    first = desk_reservation_service.page_desk_reservations_for_admin(root, True, CursorPaginationParams(page_size=1))
+    second = desk_reservation_service.page_desk_reservations_for_admin(root, True, CursorPaginationParams(cursor=first.next_cursor, page_size=1))
+    assert [reservation.id for reservation, _, _ in first.items + second.items] == [4, 5]
+    assert second.next_cursor is None
+
+
+# Test paging rejects malformed cursors and students.
+def test_page_desk_reservations_invalid(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    with pytest.raises(ValueError):
+        desk_reservation_service.page_desk_reservations_for_admin(root, False, CursorPaginationParams(cursor='garbage'))
+    with pytest.raises(UserPermissionError):
+        desk_reservation_service.page_desk_reservations_for_admin(student1, False, CursorPaginationParams())
+
+
+# Test streaming past reservations (for Admin) yields every row in order.
+def test_stream_desk_reservations_for_admin(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    for reservation, desk, student in [(reservation1, desk1, student1), (reservation4, desk1, student1), (reservation5, desk2, student2)]:
+        desk_reservation_service.create_desk_reservation(desk, student, reservation)
+
+    rows = desk_reservation_service.stream_desk_reservations_for_admin(root, True)
+    assert [(reservation.id, desk.tag) for reservation, desk, _ in rows] == [(4, 'AA1'), (5, 'CD1')]
+    with pytest.raises(UserPermissionError):
+        desk_reservation_service.stream_desk_reservations_for_admin(student1, True)
+
+
+# Test reserving many slots at once reports each slot and claims them with a single insert.
+def test_create_desk_reservations(test_session: Session, statements: list[str]):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    tomorrow = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    desk_reservation_service.create_desk_reservation(desk1, student2, DeskReservation(date=tomorrow + timedelta(hours=1)))
+    desk_reservation_service.create_desk_reservation(desk2, student1, DeskReservation(date=tomorrow + timedelta(hours=2)))
+    statements.clear()
+
+    dates = [tomorrow + timedelta(hours=hour) for hour in range(4)] + [tomorrow - timedelta(days=2), tomorrow + timedelta(days=40)]
+    result = desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk1.id, dates=dates + [tomorrow]))
+    assert [slot.status for slot in result.slots] == ['invalid', 'reserved', 'conflict', 'conflict', 'reserved', 'invalid']
+    assert result.slots[1].reservation.date == tomorrow
+    assert len([statement for statement in statements if statement.startswith('INSERT')]) == 1
+    assert test_session.scalar(select(func.count()).select_from(DeskReservationEntity).where(DeskReservationEntity.desk_id == desk1.id)) == 3
+
+
+# Test reserving recurring slots only reserves the chosen weekdays and hours.
+def test_create_desk_reservations_recurrence(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    start = date.today() + timedelta(days=1)
+    recurrence = Recurrence(start=start, end=start + timedelta(days=13), hours=[10, 11])
+    result = desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk2.id, recurrence=recurrence))
+    assert len(result.slots) == 20
+    assert all(slot.status == 'reserved' for slot in result.slots)
+    assert {slot.date.weekday() for slot in result.slots} == {0, 1, 2, 3, 4}
+    assert {slot.date.hour for slot in result.slots} == {10, 11}
+
+
+# Test reserving many slots rejects unavailable desks and malformed requests.
+def test_create_desk_reservations_invalid(test_session: Session):
+    desk_reservation_service = DeskReservationService(test_session, PermissionService(test_session))
+    tomorrow = datetime.now() + timedelta(days=1)
+    test_session.get(DeskEntity, desk3.id).available = False
+    test_session.commit()
+    with pytest.raises(ValueError):
+        desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk3.id, dates=[tomorrow]))
+    with pytest.raises(ValueError):
+        desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk1.id))
+    with pytest.raises(ValueError):
+        recurrence = Recurrence(start=tomorrow.date(), end=tomorrow.date(), hours=[24])
+        desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk1.id, recurrence=recurrence))
+    with pytest.raises(ValueError):
+        recurrence = Recurrence(start=tomorrow.date(), end=tomorrow.date(), hours=[10], timezone='Mars/Olympus_Mons')
+        desk_reservation_service.create_desk_reservations(student1, BulkReservationRequest(desk_id=desk1.id, recurrence=recurrence))
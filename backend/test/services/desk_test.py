@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from ...models import User, Desk, Role
 from ...entities import UserEntity, DeskEntity, RoleEntity, PermissionEntity
 from ...services import DeskService, PermissionService, UserPermissionError
+from ...services.desk import desk_catalog
 
 # Mock Models #
 # Desks
@@ -153,3 +154,26 @@ def test_update_desk_as_student(desk_service: DeskService):
     updated_desk = Desk(id=2, tag='CD1', desk_type='Computer Desk', included_resource='Windows Desktop i5', available=True)
     with pytest.raises(UserPermissionError):
         desk_service.update_desk(desk2.id, updated_desk, student1)
+
+
+# Test the desk catalog is invalidated by every change to desks.
+def test_desk_catalog_invalidated_by_desk_changes(desk_service: DeskService):
+    changes = [
+        lambda: desk_service.create_desk(Desk(id=3, tag='ZZ9', desk_type='Computer Desk', included_resource='', available=True), root),
+        lambda: desk_service.update_desk(3, Desk(id=3, tag='ZZ9', desk_type='Standing Desk', included_resource='', available=True), root),
+        lambda: desk_service.toggle_desk_availability(desk1, root),
+        lambda: desk_service.remove_desk(Desk(id=3, tag='ZZ9', desk_type='Standing Desk'), root),
+    ]
+    for change in changes:
+        desk_catalog.put(('available',), desk_catalog.version, '"tag"', b'[]')
+        assert desk_catalog.get(('available',)) == ('"tag"', b'[]')
+        change()
+        assert desk_catalog.get(('available',)) is None
+
+
+# Test responses built from desks read before a change are not cached after it.
+def test_desk_catalog_drops_stale_responses(desk_service: DeskService):
+    version = desk_catalog.version
+    desk_service.toggle_desk_availability(desk1, root)
+    desk_catalog.put(('available',), version, '"stale"', b'[]')
+    assert desk_catalog.get(('available',)) is None
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.pool import QueuePool
+
+from ...database import _engine_str
+from ...services import health
+from ...services.health import HealthMonitor
+from ...services.permission import PermissionIndex
+
+
+def test_ready_after_check(test_engine: Engine):
+    monitor = HealthMonitor(test_engine, pools={'test': test_engine.pool}, interval=5)
+    assert monitor.readiness({}).reasons == ['database not checked yet']
+    monitor.refresh()
+    readiness = monitor.readiness({})
+    assert readiness.ready and readiness.database
+    assert readiness.database_checked is not None and readiness.database_latency_ms >= 0
+    assert readiness.replication_lag is None
+    assert readiness.pools['test'].checked_out == 0
+
+
+def test_refresh_skipped_while_fresh(test_engine: Engine):
+    monitor = HealthMonitor(test_engine, pools={}, interval=5)
+    monitor.refresh()
+    checked = monitor.readiness({}).database_checked
+    monitor.refresh(max_age=60)
+    assert monitor.readiness({}).database_checked == checked
+
+
+def test_not_ready_without_database():
+    unreachable = create_engine(_engine_str('no_such_database'))
+    monitor = HealthMonitor(unreachable, pools={}, interval=5)
+    monitor.refresh()
+    readiness = monitor.readiness({})
+    assert not readiness.ready and not readiness.database
+    assert readiness.reasons == ['database check failed: OperationalError']
+
+
+def test_not_ready_while_pool_saturated(test_engine: Engine, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(health, 'MAX_POOL_UTILIZATION', 0.5)
+    pool = QueuePool(test_engine.pool._creator, pool_size=2, max_overflow=0)
+    monitor = HealthMonitor(test_engine, pools={'app': pool}, interval=5)
+    monitor.refresh()
+    connections = [pool.connect()]
+    assert monitor.readiness({}).ready
+    connections.append(pool.connect())
+    readiness = monitor.readiness({})
+    assert not readiness.ready
+    assert readiness.reasons == ['app pool has 2 of 2 connections checked out']
+    assert readiness.pools['app'].utilization == 1.0
+    for connection in connections:
+        connection.close()
+    assert monitor.readiness({}).ready
+
+
+def test_unbounded_pool_never_saturated(test_engine: Engine, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(health, 'MAX_POOL_UTILIZATION', 0.5)
+    pool = QueuePool(test_engine.pool._creator, pool_size=1, max_overflow=-1)
+    monitor = HealthMonitor(test_engine, pools={'app': pool}, interval=5)
+    monitor.refresh()
+    connections = [pool.connect() for _ in range(3)]
+    readiness = monitor.readiness({})
+    assert readiness.ready
+    assert (readiness.pools['app'].checked_out, readiness.pools['app'].capacity, readiness.pools['app'].utilization) == (3, None, None)
+    for connection in connections:
+        connection.close()
+    pool.dispose()
+
+
+def test_background_checks_and_shutdown(test_engine: Engine):
+    monitor = HealthMonitor(test_engine, pools={}, interval=0.05)
+    monitor.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not monitor.readiness({}).ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert monitor.readiness({}).ready
+    finally:
+        monitor.stop(timeout=5)
+    assert monitor.readiness({}).reasons == ['shutting down']
+
+
+def test_cache_warmness(test_engine: Engine):
+    monitor = HealthMonitor(test_engine, pools={}, interval=5)
+    cold, warm = PermissionIndex(), PermissionIndex()
+    warm.get(1)
+    warm.hits = 3
+    caches = monitor.readiness({'cold': cold, 'warm': warm}).caches
+    assert not caches['cold'].warm and caches['cold'].hit_ratio is None
+    assert caches['warm'].warm and caches['warm'].hit_ratio == 0.75
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from ...models import User, Desk, Role, DeskReservation, BulkReservationRequest
+from ...entities import UserEntity, DeskEntity, RoleEntity, PermissionEntity
+from ...services import DeskReservationService, DeskService, PermissionService
+from ...services.live import AvailabilityBroadcaster, availability_broadcaster
+
+desk1 = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+desk2 = Desk(id=2, tag='CD1', desk_type='Standing Desk', included_resource='Windows Desktop i9', available=True)
+
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+student1 = User(id=2, pid=123456789, onyen='student1', email='student1@unc.edu')
+
+tomorrow = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    root_user_entity = UserEntity.from_model(root)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    test_session.add_all([root_user_entity, root_role_entity, PermissionEntity(action='*', resource='*', role=root_role_entity)])
+    test_session.add_all([DeskEntity.from_model(desk1), DeskEntity.from_model(desk2), UserEntity.from_model(student1)])
+    test_session.commit()
+    yield
+
+
+async def _drain(subscription, timeout: float = 0.2) -> list:
+    events = []
+    async for event in subscription.events(timeout):
+        if event is None:
+            return events
+        events.append(event)
+        if event.type == 'reset':
+            return events
+    return events
+
+
+def test_reservation_events_reach_subscriptions_of_their_desk_and_day(test_session: Session):
+    reservations = DeskReservationService(test_session, PermissionService(test_session))
+
+    async def test():
+        desk = availability_broadcaster.subscribe({desk1.id})
+        day = availability_broadcaster.subscribe(day=tomorrow.date())
+        other_day = availability_broadcaster.subscribe({desk1.id}, (tomorrow + timedelta(days=1)).date())
+        try:
+            reservation = await asyncio.to_thread(reservations.create_desk_reservation, desk1, student1, DeskReservation(date=tomorrow))
+            await asyncio.to_thread(reservations.create_desk_reservations, student1,
+                                    BulkReservationRequest(desk_id=desk2.id, dates=[tomorrow + timedelta(hours=1), tomorrow + timedelta(days=1)]))
+            await asyncio.to_thread(reservations.remove_desk_reservation, desk1, student1, reservation)
+            return await _drain(desk), await _drain(day), await _drain(other_day)
+        finally:
+            for subscription in [desk, day, other_day]:
+                availability_broadcaster.unsubscribe(subscription)
+
+    desk, day, other_day = asyncio.run(test())
+    assert [(event.type, event.desk_id, event.date) for event in desk] == [('booked', 1, tomorrow), ('freed', 1, tomorrow)]
+    assert [(event.type, event.desk_id, event.date) for event in day] == [('booked', 1, tomorrow), ('booked', 2, tomorrow + timedelta(hours=1)), ('freed', 1, tomorrow)]
+    assert other_day == []
+    assert len(availability_broadcaster) == 0
+
+
+def test_desk_events(test_session: Session):
+    desks = DeskService(test_session, PermissionService(test_session))
+
+    async def test():
+        subscription = availability_broadcaster.subscribe({desk2.id}, tomorrow.date())
+        try:
+            await asyncio.to_thread(desks.toggle_desk_availability, desk2, root)
+            return await _drain(subscription)
+        finally:
+            availability_broadcaster.unsubscribe(subscription)
+
+    [event] = asyncio.run(test())
+    assert event.type == 'desk' and event.desk_id == desk2.id
+    assert event.desk.available is False
+    assert event.freed_from <= datetime.now()
+
+
+def test_subscriptions_falling_behind_are_reset():
+    broadcaster = AvailabilityBroadcaster(max_queued=2)
+
+    async def test():
+        subscription = broadcaster.subscribe()
+        for hour in range(3):
+            broadcaster.publish({'op': 'reserve', 'desk': 1, 'hours': [hour]})
+        await asyncio.sleep(0)
+        return await _drain(subscription), subscription
+
+    events, subscription = asyncio.run(test())
+    assert [event.type for event in events] == ['booked', 'booked', 'reset']
+    assert subscription.overflowed
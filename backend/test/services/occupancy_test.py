@@ -0,0 +1,130 @@
+import pytest
+import time
+
+from datetime import datetime, timedelta
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+from ...models import User, Desk, Role, DeskReservation, BulkReservationRequest
+from ...entities import UserEntity, DeskEntity, RoleEntity, PermissionEntity
+from ...services import DeskReservationService, DeskService, PermissionService
+from ...services.occupancy import OccupancyIndex, occupancy_index
+
+desk1 = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+desk2 = Desk(id=2, tag='CD1', desk_type='Standing Desk', included_resource='Windows Desktop i9', available=True)
+desk3 = Desk(id=3, tag='ND1', desk_type='Standing Desk', included_resource='iMac w/ Pro Display', available=False)
+
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+student1 = User(id=2, pid=123456789, onyen='student1', email='student1@unc.edu')
+student2 = User(id=3, pid=987654321, onyen='student2', email='student2@unc.edu')
+
+hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    root_user_entity = UserEntity.from_model(root)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    test_session.add_all([root_user_entity, root_role_entity, PermissionEntity(action='*', resource='*', role=root_role_entity)])
+    test_session.add_all([DeskEntity.from_model(desk) for desk in [desk1, desk2, desk3]])
+    test_session.add_all([UserEntity.from_model(student) for student in [student1, student2]])
+    test_session.commit()
+    yield
+    occupancy_index.stop()
+
+
+@pytest.fixture()
+def desk_reservation_service(test_session: Session):
+    return DeskReservationService(test_session, PermissionService(test_session))
+
+
+def _from_database(service: DeskReservationService, **window):
+    """Availability as computed by the database, with the index out of the way. Not meant for use while the
+    listener runs, as it would drop the changes it receives meanwhile."""
+    loaded, occupancy_index.loaded = occupancy_index.loaded, False
+    try:
+        return service.get_availability(**window)
+    finally:
+        occupancy_index.loaded = loaded
+
+
+def test_index_matches_database(test_session: Session, desk_reservation_service: DeskReservationService):
+    desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=hour + timedelta(hours=1)))
+    desk_reservation_service.create_desk_reservation(desk2, student2, DeskReservation(date=hour + timedelta(days=29, hours=23)))
+    desk_reservation_service.create_desk_reservation(desk1, student2, DeskReservation(date=hour - timedelta(hours=1)))
+    occupancy_index.load(test_session)
+
+    for window in [{}, {'start': hour + timedelta(hours=1), 'end': hour + timedelta(hours=9)}, {'desk_type': 'Standing Desk'}]:
+        assert desk_reservation_service.get_availability(**window) == _from_database(desk_reservation_service, **window)
+    assert [desk.desk_id for desk in desk_reservation_service.get_availability().desks] == [1, 2]
+    assert occupancy_index.hits >= 3
+
+
+def test_past_windows_fall_back_to_database(test_session: Session, desk_reservation_service: DeskReservationService):
+    occupancy_index.load(test_session)
+    misses = occupancy_index.misses
+    desk_reservation_service.get_availability(start=hour - timedelta(days=1))
+    assert occupancy_index.misses == misses + 1
+
+
+def test_services_keep_index_up_to_date(test_session: Session, desk_reservation_service: DeskReservationService):
+    occupancy_index.load(test_session)
+    desk_service = DeskService(test_session, PermissionService(test_session))
+
+    reservation = desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=hour + timedelta(hours=2)))
+    desk_reservation_service.create_desk_reservations(student2, BulkReservationRequest(desk_id=2, dates=[hour + timedelta(hours=h) for h in range(3, 6)]))
+    assert desk_reservation_service.get_availability() == _from_database(desk_reservation_service)
+
+    desk_reservation_service.remove_desk_reservation(desk1, student1, reservation)
+    desk_service.toggle_desk_availability(desk2, root)
+    desk_service.create_desk(Desk(id=4, tag='ZZ9', desk_type='Computer Desk', included_resource='', available=True), root)
+    desk_service.toggle_desk_availability(desk3, root)
+    assert desk_reservation_service.get_availability() == _from_database(desk_reservation_service)
+    assert [desk.id for desk in desk_service.list_available_desks()] == [1, 3, 4]
+
+    desk_reservation_service.create_desk_reservation(desk3, student1, DeskReservation(date=hour + timedelta(hours=7)))
+    desk_service.update_desk(3, Desk(id=3, tag='ND1', desk_type='Computer Desk', included_resource='', available=True), root)
+    assert desk_reservation_service.get_availability(desk_type='Computer Desk') == _from_database(desk_reservation_service, desk_type='Computer Desk')
+
+
+def test_changes_applied_while_loading_are_kept(test_session: Session, desk_reservation_service: DeskReservationService,
+                                                monkeypatch: pytest.MonkeyPatch):
+    snapshot = occupancy_index._snapshot
+
+    def snapshot_then_reserve(*args):
+        # A reservation committed after the snapshot, and applied before the index is swapped in.
+        loaded = snapshot(*args)
+        desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=hour + timedelta(hours=3)))
+        return loaded
+
+    monkeypatch.setattr(occupancy_index, '_snapshot', snapshot_then_reserve)
+    occupancy_index.load(test_session)
+    monkeypatch.undo()
+    assert desk_reservation_service.get_availability() == _from_database(desk_reservation_service)
+
+
+@pytest.mark.commits
+def test_listener_applies_changes_of_other_workers(test_session: Session, test_engine: Engine, desk_reservation_service: DeskReservationService):
+    occupancy_index.start(test_engine)
+    _wait_for(lambda: occupancy_index.loaded)
+
+    # Another worker's index publishes on the same channel, and this worker's listener applies it.
+    other = OccupancyIndex(timedelta(days=30))
+    date = hour + timedelta(hours=3)
+    with Session(test_engine) as session:
+        other.publish(session, other.reserved(desk2.id, [date]))
+        session.commit()
+    _wait_for(lambda: desk_reservation_service.get_availability().desks[1].reserved.startswith('EA'))
+    assert desk_reservation_service.get_availability().desks[1].reserved.startswith('EA')
+    assert desk_reservation_service.get_availability().desks[0].reserved.startswith('AA')
+
+    # Changes of this worker are applied once, when committed.
+    desk_reservation_service.create_desk_reservation(desk1, student1, DeskReservation(date=date))
+    assert desk_reservation_service.get_availability().desks[0].reserved.startswith('EA')
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
@@ -0,0 +1,104 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, select, func, text
+from sqlalchemy.orm import Session
+from ...entities import UserEntity, DeskEntity, DeskReservationEntity, DeskReservationHistoryEntity
+from ...models import User, Desk
+from ...services.partition import (PartitionWorker, list_partitions, create_partition, ensure_partitions, drop_partitions_before, maintain_partitions,
+                                   month_of, next_month, partition_name, MONTHS_AHEAD)
+
+desk = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+student = User(id=1, pid=123456789, onyen='student1', email='student1@unc.edu')
+
+now = datetime.now().replace(minute=0, second=0, microsecond=0)
+this_month = month_of(now)
+last_month = month_of(this_month - timedelta(days=1))
+two_months_ago = month_of(last_month - timedelta(days=1))
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    test_session.add(DeskEntity.from_model(desk))
+    test_session.add(UserEntity.from_model(student))
+    for date in [two_months_ago, two_months_ago + timedelta(days=3), last_month + timedelta(hours=5), now]:
+        test_session.add(DeskReservationEntity(desk_id=desk.id, user_id=student.id, date=date))
+    test_session.commit()
+    yield
+
+
+def _partition_counts(session: Session) -> dict[str, int]:
+    rows = session.execute(text('SELECT tableoid::regclass::text, count(*) FROM desk_reservation GROUP BY 1'))
+    return dict(rows.all())
+
+
+def test_month_arithmetic():
+    assert next_month(datetime(2023, 1, 31, 12)) == datetime(2023, 2, 1)
+    assert next_month(datetime(2023, 12, 15)) == datetime(2024, 1, 1)
+    assert partition_name(datetime(2023, 4, 1)) == 'desk_reservation_p202304'
+
+
+def test_reservations_without_partition_are_kept_in_default(test_session: Session):
+    assert list_partitions(test_session) == {}
+    assert _partition_counts(test_session) == {'desk_reservation_default': 4}
+
+
+def test_ensure_partitions_moves_reservations_out_of_default(test_session: Session):
+    created = ensure_partitions(test_session, two_months_ago, this_month)
+    assert created == [partition_name(two_months_ago), partition_name(last_month), partition_name(this_month)]
+    assert _partition_counts(test_session) == {partition_name(two_months_ago): 2, partition_name(last_month): 1, partition_name(this_month): 1}
+    assert list_partitions(test_session)[partition_name(last_month)] == (last_month, this_month)
+    assert ensure_partitions(test_session, two_months_ago, this_month) == []
+
+    # Reservations are routed to their partition, which still enforces one reservation per desk and slot.
+    test_session.add(DeskReservationEntity(desk_id=desk.id, user_id=student.id, date=last_month + timedelta(days=2)))
+    test_session.commit()
+    assert _partition_counts(test_session)[partition_name(last_month)] == 2
+
+
+@pytest.mark.commits
+def test_partitions_created_once_by_concurrent_workers(test_engine: Engine):
+    with ThreadPoolExecutor(4) as executor:
+        runs = list(executor.map(lambda _: _ensure_in_session(test_engine), range(4)))
+    created = [name for run in runs for name in run]
+    assert sorted(created) == [partition_name(two_months_ago), partition_name(last_month), partition_name(this_month)]
+    with Session(test_engine) as session:
+        assert create_partition(session, this_month) is None
+        assert drop_partitions_before(session, last_month + timedelta(days=1)) == {partition_name(two_months_ago): 2}
+        assert drop_partitions_before(session, last_month + timedelta(days=1)) == {}
+
+
+def _ensure_in_session(engine: Engine) -> list[str]:
+    with Session(engine) as session:
+        return ensure_partitions(session, two_months_ago, this_month)
+
+
+def test_drop_partitions_before_archives_them(test_session: Session):
+    ensure_partitions(test_session, two_months_ago, this_month)
+    assert drop_partitions_before(test_session, last_month + timedelta(days=1)) == {partition_name(two_months_ago): 2}
+    assert partition_name(two_months_ago) not in list_partitions(test_session)
+    assert test_session.scalar(select(func.count()).select_from(DeskReservationEntity)) == 2
+    assert test_session.scalar(select(func.count()).select_from(DeskReservationHistoryEntity)) == 2
+
+
+def test_maintain_partitions_creates_upcoming_months(test_session: Session):
+    created = maintain_partitions(test_session, before=last_month + timedelta(days=1), now=now)
+    month, upcoming = last_month, []
+    for _ in range(MONTHS_AHEAD + 2):
+        upcoming.append(partition_name(month))
+        month = next_month(month)
+    assert created == upcoming
+    # Reservations entirely past the retention period are left to the batched archiving.
+    assert _partition_counts(test_session)['desk_reservation_default'] == 2
+
+
+@pytest.mark.commits
+def test_worker_maintains_partitions_once_started(test_engine: Engine):
+    worker = PartitionWorker(test_engine, interval=0, retention=now - last_month)
+    worker.start()
+    worker._thread.join(timeout=5)
+    worker.stop()
+    with Session(test_engine) as session:
+        assert partition_name(this_month) in list_partitions(session)
+        assert _partition_counts(session)[partition_name(last_month)] == 1
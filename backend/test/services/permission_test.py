@@ -3,7 +3,8 @@ import pytest
 from sqlalchemy.orm import Session
 from ...models import User, Role, Permission
 from ...entities import UserEntity, RoleEntity, PermissionEntity
-from ...services import PermissionService
+from ...services import PermissionService, RoleService
+from ...services.permission import permission_index
 
 # Mock Models
 root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
@@ -115,3 +116,29 @@ def test_check_specific_permission(permission: PermissionService):
         p, 'checkin.create', 'checkin/12') is False
     assert permission._check_permission(
         p, 'permission.revoke', 'checkin.*') is False
+
+
+def test_check_uses_permission_index(permission: PermissionService, statements: list[str]):
+    hits, misses = permission_index.hits, permission_index.misses
+
+    assert permission.check(ambassador, 'checkin.create', 'checkin')
+    assert permission.check(ambassador, 'checkin.create', 'checkin')
+    assert permission.check(ambassador, 'checkin.delete', 'checkin') is False
+    assert len(statements) == 1
+    assert permission_index.hits - hits == 2
+    assert permission_index.misses - misses == 1
+
+
+def test_grant_invalidates_permission_index(permission: PermissionService):
+    assert permission.check(user, 'checkin.create', 'checkin') is False
+    permission.grant(root, user, Permission(action='checkin.*', resource='checkin'))
+    assert permission.check(user, 'checkin.create', 'checkin')
+
+
+def test_role_membership_invalidates_permission_index(permission: PermissionService, test_session: Session):
+    role_service = RoleService(test_session, permission)
+    assert permission.check(user, 'checkin.create', 'checkin') is False
+    role_service.add(root, ambassador_role.id, user)
+    assert permission.check(user, 'checkin.create', 'checkin')
+    role_service.remove(root, ambassador_role.id, user.id)
+    assert permission.check(user, 'checkin.create', 'checkin') is False
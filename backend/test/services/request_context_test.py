@@ -0,0 +1,139 @@
+import json
+import logging
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from ...models import User, Desk, Role, Permission
+from ...entities import UserEntity, DeskEntity, RoleEntity, PermissionEntity
+from ...services import DeskService, PermissionService, RoleService, UserService
+from ...services.user import registered_users
+from ...services.desk import desk_catalog, find_desk
+from ...services.permission import permission_index
+from ...services import request_context
+from ...services.request_context import request_scope
+
+# Mock Models
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+
+ambassador = User(id=2, pid=888888888, onyen='ambassador', email='ambassador@unc.edu')
+ambassador_role = Role(id=2, name='ambassadors')
+
+desk1 = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session, monkeypatch: pytest.MonkeyPatch):
+    root_user_entity = UserEntity.from_model(root)
+    test_session.add(root_user_entity)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    test_session.add(root_role_entity)
+    test_session.add(PermissionEntity(action='*', resource='*', role=root_role_entity))
+
+    ambassador_entity = UserEntity.from_model(ambassador)
+    test_session.add(ambassador_entity)
+    ambassador_role_entity = RoleEntity.from_model(ambassador_role)
+    ambassador_role_entity.users.append(ambassador_entity)
+    test_session.add(ambassador_role_entity)
+
+    test_session.add(DeskEntity.from_model(desk1))
+    test_session.commit()
+
+    # Every lookup reaches the database unless memoized by the request.
+    monkeypatch.setattr(permission_index, 'max_age', 0.0)
+    registered_users.clear()
+    desk_catalog.invalidate()
+    yield
+    registered_users.clear()
+
+
+@pytest.fixture()
+def permission(test_session: Session):
+    return PermissionService(test_session)
+
+
+def test_permissions_loaded_once_per_request(permission: PermissionService):
+    with request_scope() as context:
+        for _ in range(5):
+            permission.enforce(root, 'role.details', 'role/1')
+    assert context.statements == 1
+
+
+def test_permissions_loaded_again_by_next_request(permission: PermissionService, test_session: Session):
+    with request_scope() as context:
+        PermissionService(test_session).enforce(root, 'role.details', 'role/1')
+    with request_scope() as other:
+        PermissionService(test_session).enforce(root, 'role.details', 'role/1')
+    assert context.statements == other.statements == 1
+
+
+def test_grant_runs_bounded_statements(test_session: Session, permission: PermissionService):
+    role = RoleService(test_session, permission)
+    with request_scope() as context:
+        role.grant(root, ambassador_role.id, Permission(action='checkin.create', resource='checkin'))
+    assert context.statements <= 9
+
+
+def test_permission_granted_in_request_is_seen(test_session: Session, permission: PermissionService):
+    role = RoleService(test_session, permission)
+    with request_scope():
+        assert not permission.check(ambassador, 'checkin.create', 'checkin')
+        role.grant(root, ambassador_role.id, Permission(action='checkin.create', resource='checkin'))
+        assert permission.check(ambassador, 'checkin.create', 'checkin')
+
+
+def test_user_looked_up_once_per_request(test_session: Session, permission: PermissionService):
+    users = UserService(test_session, permission)
+    with request_scope() as context:
+        first = users.get(ambassador.pid)
+        registered_users.clear()
+        statements = context.statements
+        second = users.get(ambassador.pid)
+    assert statements > 0
+    assert context.statements == statements
+    assert first == second and first is not second
+
+
+def test_user_updated_in_request_is_seen(test_session: Session, permission: PermissionService):
+    users = UserService(test_session, permission)
+    with request_scope():
+        user = users.get(ambassador.pid)
+        user.first_name = 'Amby'
+        users.update(root, user)
+        assert users.get(ambassador.pid).first_name == 'Amby'
+
+
+def test_desk_looked_up_once_per_version(test_session: Session, permission: PermissionService):
+    desks = DeskService(test_session, permission)
+    with request_scope() as context:
+        assert find_desk(test_session, desk1.id) == desk1
+        test_session.expunge_all()
+        statements = context.statements
+        assert desks.get_desk_by_id(desk1.id) == desk1
+        assert context.statements == statements
+        desks.update_desk(desk1.id, desk1.copy(update={'available': False}), root)
+        assert desks.get_desk_by_id(desk1.id).available is False
+
+
+def test_slow_query_logged_redacted(test_session: Session, permission: PermissionService, caplog: pytest.LogCaptureFixture,
+                                    monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(request_context, 'SLOW_QUERY_SECONDS', 0.0)
+    users = UserService(test_session, permission)
+    with request_scope() as context:
+        users.get(ambassador.pid)
+    assert context.db_seconds > 0
+    with caplog.at_level(logging.WARNING, 'backend.sql'):
+        request_context.report(context, 'GET /api/user/{pid}')
+    logged = [json.loads(record.getMessage()) for record in caplog.records]
+    assert logged and all(entry['event'] == 'slow_query' and entry['route'] == 'GET /api/user/{pid}' for entry in logged)
+    assert str(ambassador.pid) not in caplog.text
+    assert any('int' in entry['parameters'].values() for entry in logged)
+
+
+def test_fingerprint():
+    assert request_context.fingerprint(
+        "SELECT user.id FROM user\n WHERE user.pid = %(pid_1)s AND user.onyen IN (%(onyen_1_1)s, %(onyen_1_2)s) OR user.email = 'a''b' LIMIT 10"
+    ) == 'SELECT user.id FROM user WHERE user.pid = ? AND user.onyen IN (?) OR user.email = ? LIMIT ?'
@@ -0,0 +1,81 @@
+import pytest
+import time
+
+from datetime import datetime, timedelta
+from sqlalchemy import Engine, select, func
+from sqlalchemy.orm import Session
+from ...entities import UserEntity, DeskEntity, DeskReservationEntity, DeskReservationHistoryEntity
+from ...models import User, Desk
+from ...services.retention import archive_batch, archive_old_reservations, RetentionWorker
+
+desk = Desk(id=1, tag='AA1', desk_type='Computer Desk', included_resource='Pro Display XDR w/ Mac Pro', available=True)
+student = User(id=1, pid=123456789, onyen='student1', email='student1@unc.edu')
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    test_session.add(DeskEntity.from_model(desk))
+    test_session.add(UserEntity.from_model(student))
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    for days in [40, 39, 38, 37, 36, 1]:
+        test_session.add(DeskReservationEntity(desk_id=desk.id, user_id=student.id, date=now - timedelta(days=days)))
+    test_session.add(DeskReservationEntity(desk_id=desk.id, user_id=student.id, date=now + timedelta(days=1)))
+    test_session.commit()
+    yield
+
+
+def _counts(session: Session) -> tuple[int, int]:
+    session.expire_all()
+    return (session.scalar(select(func.count()).select_from(DeskReservationEntity)),
+            session.scalar(select(func.count()).select_from(DeskReservationHistoryEntity)))
+
+
+def test_archive_batch_moves_the_oldest_reservations(test_session: Session):
+    assert archive_batch(test_session, datetime.now() - timedelta(days=30), batch_size=2) == 2
+    assert _counts(test_session) == (5, 2)
+    oldest = test_session.scalar(select(func.min(DeskReservationEntity.date)))
+    assert oldest.date() == (datetime.now() - timedelta(days=38)).date()
+    history = test_session.scalars(select(DeskReservationHistoryEntity)).all()
+    assert all(entry.desk_id == desk.id and entry.user_id == student.id for entry in history)
+
+
+def test_archive_old_reservations_in_batches(test_session: Session):
+    batches = []
+    assert archive_old_reservations(test_session, batch_size=2, progress=batches.append) == 5
+    assert batches == [2, 2, 1]
+    assert _counts(test_session) == (2, 5)
+
+
+@pytest.mark.commits
+def test_worker_records_progress(test_session: Session, test_engine: Engine):
+    worker = RetentionWorker(test_engine, interval=0, batch_size=2)
+    assert worker.run_once() == 5
+    assert worker.run_once() == 0
+    status = worker.status()
+    assert not status.enabled and not status.running
+    assert (status.runs, status.batches, status.archived, status.last_archived) == (2, 4, 5, 0)
+    assert status.last_error is None
+    assert _counts(test_session) == (2, 5)
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+@pytest.mark.commits
+def test_worker_thread_runs_on_start_and_trigger(test_session: Session, test_engine: Engine):
+    worker = RetentionWorker(test_engine, interval=3600, batch_size=2)
+    worker.start()
+    try:
+        _wait_for(lambda: worker.status().runs == 1)
+        assert worker.status().archived == 5
+        test_session.add(DeskReservationEntity(desk_id=desk.id, user_id=student.id, date=datetime.now() - timedelta(days=60)))
+        test_session.commit()
+        worker.trigger()
+        _wait_for(lambda: worker.status().runs == 2)
+    finally:
+        worker.stop(timeout=5)
+    assert worker.status().archived == 6
+    assert _counts(test_session) == (2, 6)
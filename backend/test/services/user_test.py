@@ -0,0 +1,156 @@
+import pytest
+
+from sqlalchemy.orm import Session
+from ...models import User, Role, Permission, PaginationParams, CursorPaginationParams
+from ...entities import UserEntity, RoleEntity, PermissionEntity
+from ...services import UserService, PermissionService, RoleService
+from ...services.user import registered_users
+from ...services.request_context import request_scope
+
+# Mock Models
+root = User(id=1, pid=999999999, onyen='root', email='root@unc.edu')
+root_role = Role(id=1, name='root')
+
+user = User(id=2, pid=111111111, onyen='user', email='user@unc.edu')
+
+
+@pytest.fixture(autouse=True)
+def setup_teardown(test_session: Session):
+    root_user_entity = UserEntity.from_model(root)
+    test_session.add(root_user_entity)
+    root_role_entity = RoleEntity.from_model(root_role)
+    root_role_entity.users.append(root_user_entity)
+    test_session.add(root_role_entity)
+    test_session.add(PermissionEntity(action='*', resource='*', role=root_role_entity))
+    test_session.add(UserEntity.from_model(user))
+    test_session.commit()
+    yield
+
+
+@pytest.fixture()
+def permission(test_session: Session):
+    return PermissionService(test_session)
+
+
+@pytest.fixture()
+def user_service(test_session: Session, permission: PermissionService):
+    return UserService(test_session, permission)
+
+
+def test_get_is_cached(user_service: UserService, statements: list[str]):
+    assert user_service.get(root.pid).permissions[0].action == '*'
+    queries = len(statements)
+    assert queries > 0
+    assert user_service.get(root.pid).onyen == 'root'
+    assert len(statements) == queries
+
+
+def test_get_returns_copies(user_service: UserService):
+    user_service.get(user.pid).first_name = 'Changed'
+    assert user_service.get(user.pid).first_name == ''
+
+
+def test_get_returns_copies_of_permissions(user_service: UserService):
+    with request_scope():
+        user_service.get(root.pid).permissions.append(Permission(action='changed', resource='*'))
+        user_service.get(root.pid).permissions[0].action = 'changed'
+        assert [permission.action for permission in user_service.get(root.pid).permissions] == ['*']
+    assert [permission.action for permission in user_service.get(root.pid).permissions] == ['*']
+
+
+def test_update_invalidates_cache(user_service: UserService):
+    cached = user_service.get(user.pid)
+    cached.first_name = 'Updated'
+    user_service.update(root, cached)
+    assert user_service.get(user.pid).first_name == 'Updated'
+
+
+def test_grant_invalidates_cache(user_service: UserService, permission: PermissionService):
+    assert user_service.get(user.pid).permissions == []
+    permission.grant(root, user, Permission(action='checkin.create', resource='checkin'))
+    assert [p.action for p in user_service.get(user.pid).permissions] == ['checkin.create']
+
+
+def test_role_membership_invalidates_cache(user_service: UserService, permission: PermissionService, test_session: Session):
+    assert user_service.get(user.pid).permissions == []
+    RoleService(test_session, permission).add(root, root_role.id, user)
+    assert [p.action for p in user_service.get(user.pid).permissions] == ['*']
+
+
+def test_cache_expires(user_service: UserService, monkeypatch: pytest.MonkeyPatch, statements: list[str]):
+    monkeypatch.setattr(registered_users, 'ttl', 0.0)
+    user_service.get(user.pid)
+    queries = len(statements)
+    user_service.get(user.pid)
+    assert len(statements) > queries
+
+
+@pytest.fixture()
+def searched_users(test_session: Session):
+    ada = User(id=3, pid=730000001, onyen='alove', email='ada@unc.edu', first_name='Ada', last_name='Lovelace')
+    adam = User(id=4, pid=730000002, onyen='asmith', email='adam.smith@unc.edu', first_name='Adam', last_name='Smith')
+    test_session.add_all([UserEntity.from_model(ada), UserEntity.from_model(adam)])
+    test_session.commit()
+    return ada, adam
+
+
+def test_search_by_word_prefixes(user_service: UserService, searched_users: tuple[User, User]):
+    search = lambda query: [found.onyen for found in user_service.search(root, query)]
+    assert sorted(search('ad')) == ['alove', 'asmith']
+    assert search('Ada Lov') == ['alove']
+    assert search('smi') == ['asmith']
+    assert search('asm') == ['asmith']
+    assert search('adam.smith') == ['asmith']
+    assert search('lovelace ada') == ['alove']
+    assert search('grace') == []
+
+
+def test_search_by_pid_prefix(user_service: UserService, searched_users: tuple[User, User]):
+    assert sorted(found.onyen for found in user_service.search(root, '7300')) == ['alove', 'asmith']
+    assert [found.onyen for found in user_service.search(root, '730000002')] == ['asmith']
+
+
+def test_search_ranks_exact_onyen_first(user_service: UserService, test_session: Session):
+    test_session.add(UserEntity.from_model(User(id=3, pid=730000003, onyen='users', email='users@unc.edu')))
+    test_session.commit()
+    assert [found.onyen for found in user_service.search(root, 'user')] == ['user', 'users']
+
+
+def test_list_filters_by_search(user_service: UserService, searched_users: tuple[User, User]):
+    page = user_service.list(root, PaginationParams(order_by='first_name', filter='ada'))
+    assert page.length == 2
+    assert [found.onyen for found in page.items] == ['alove', 'asmith']
+
+
+def test_list_orders_by_sortable_columns_only(user_service: UserService, searched_users: tuple[User, User]):
+    page = user_service.list(root, PaginationParams(order_by='-pid', page_size=2))
+    assert page.length == 4
+    assert [found.onyen for found in page.items] == ['root', 'asmith']
+    assert user_service.list(root, PaginationParams(order_by='pid', page=5)).length == 4
+    with pytest.raises(ValueError):
+        user_service.list(root, PaginationParams(order_by='pronouns'))
+    with pytest.raises(ValueError):
+        user_service.list(root, PaginationParams(order_by='__class__'))
+
+
+def test_page_resumes_after_cursor(user_service: UserService, searched_users: tuple[User, User]):
+    params = CursorPaginationParams(page_size=3, order_by='last_name')
+    first = user_service.page(root, params)
+    assert first.length == 4
+    second = user_service.page(root, params.copy(update={'cursor': first.next_cursor}))
+    assert second.next_cursor is None
+    assert [found.onyen for found in first.items + second.items] == ['root', 'user', 'alove', 'asmith']
+
+    descending = user_service.page(root, CursorPaginationParams(page_size=1, order_by='-onyen', filter='a'))
+    assert descending.length == 2
+    assert [found.onyen for found in descending.items] == ['asmith']
+    rest = user_service.page(root, CursorPaginationParams(cursor=descending.next_cursor, page_size=1, order_by='-onyen', filter='a'))
+    assert [found.onyen for found in rest.items] == ['alove']
+
+
+def test_page_rejects_cursor_of_other_order(user_service: UserService, searched_users: tuple[User, User]):
+    first = user_service.page(root, CursorPaginationParams(page_size=1, order_by='email'))
+    with pytest.raises(ValueError):
+        user_service.page(root, CursorPaginationParams(cursor=first.next_cursor, order_by='pid'))
+    with pytest.raises(ValueError):
+        user_service.page(root, CursorPaginationParams(cursor='garbage', order_by='email'))